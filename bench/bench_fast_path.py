@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  Per tweet throughput of reading and parsing the tweets the way
+#           `tweet_processor.py` does now (bytes read in as is, cleaned with
+#           `bytes.translate`) against the legacy way (lines decoded when the
+#           file is read in text mode, cleaned with `str.translate`), and of
+#           the whole run on top of it.  Under python 2 the two are the same
+#           code, so run it under each interpreter to compare them as well.
+#
+#   $ python3 ./bench/bench_fast_path.py [./data-gen/tweets_very_big.txt]
+#   $ pypy3 ./bench/bench_fast_path.py
+#----------------------------------------------------------------
+
+import io
+import sys
+import shutil
+import platform
+import tempfile
+from os import path
+from timeit import default_timer
+
+src_dir = path.join(path.dirname(path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, src_dir)
+import tweet_processor
+from tweet_processor import iter_parsed_chunks
+from tweet_processor import process_tweets
+from tweets_graph import TweetsGraph
+from output_sinks import NullSink
+from tweet_generator import TweetGenerator
+
+
+def legacy_translate(ascii_txt, table):
+    '''How `clean_texts` used to translate under python 3: decode, then `str.translate`'''
+    return ascii_txt.decode('ascii').translate(table)
+
+
+class legacy_cleaning(object):
+    '''Swaps the legacy `str.translate` cleaning into `tweet_processor` (python 3 only)'''
+
+    def __enter__(self):
+        self.saved = tweet_processor.translate, tweet_processor.trans_table
+        tweet_processor.translate = legacy_translate
+        tweet_processor.trans_table = str.maketrans('\t\n\r\v\f', ' ' * 5)
+
+    def __exit__(self, *exc_info):
+        tweet_processor.translate, tweet_processor.trans_table = self.saved
+
+
+def run(tweets_path, legacy, with_graph):
+    '''Reads and parses the file at `tweets_path` (and builds the graph, if
+    `with_graph`); returns the (list) of average degrees, or of parsed tweets'''
+
+    if legacy:
+        tweets_file = io.open(tweets_path, 'r', encoding='utf-8')
+    else:
+        tweets_file = open(tweets_path, 'rb')
+    tweet_graph = TweetsGraph()
+    results = []
+    with tweets_file:
+        for parsed_chunk, _ in iter_parsed_chunks(tweets_file):
+            if with_graph:
+                process_tweets(parsed_chunk, tweet_graph, NullSink(), NullSink())
+                results.append(tweet_graph.get_graph_avg_degree_of_all_nodes(as_float=True))
+            else:
+                results.extend(parsed[1] for parsed in parsed_chunk if parsed is not None)
+    return results
+
+
+def time_it(func, repeat=5):
+    '''Best wall time (secs) of `repeat` calls of `func` (and its last result)'''
+
+    best = result = None
+    for _ in range(repeat):
+        start = default_timer()
+        result = func()
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(argv):
+    work_dir = tempfile.mkdtemp(prefix='bench_fast_path')
+    try:
+        if argv:
+            tweets_path = argv[0]
+        else:
+            tweets_path = path.join(work_dir, 'tweets.txt')
+            with open(tweets_path, 'wb') as tweets_file:
+                for line in TweetGenerator(seed=0).lines(50000):
+                    tweets_file.write(line if isinstance(line, bytes) else line.encode('utf-8'))
+        with open(tweets_path, 'rb') as tweets_file:
+            line_count = sum(1 for _ in tweets_file)
+
+        results = {}
+        for stage, with_graph in (('parse', False), ('parse + graph', True)):
+            results[stage, 'bytes'] = time_it(lambda: run(tweets_path, False, with_graph))
+            if bytes is not str:
+                with legacy_cleaning():
+                    results[stage, 'legacy'] = time_it(lambda: run(tweets_path, True, with_graph))
+                # the output has to be exactly the same either way
+                assert results[stage, 'legacy'][1] == results[stage, 'bytes'][1]
+    finally:
+        shutil.rmtree(work_dir)
+
+    sys.stdout.write('{} lines ({} {})\n'.format(line_count, platform.python_implementation(),
+                                                  platform.python_version()))
+    for stage in ('parse', 'parse + graph'):
+        bytes_secs = results[stage, 'bytes'][0]
+        if bytes is str:
+            sys.stdout.write('  {:<14} {:7.3f} us/tweet (python 2 only has the one path)\n'.format(
+                stage, 1e6 * bytes_secs / line_count))
+            continue
+        legacy_secs = results[stage, 'legacy'][0]
+        sys.stdout.write('  {:<14} legacy {:7.3f} us/tweet   bytes {:7.3f} us/tweet  {:5.2f}x\n'.format(
+            stage, 1e6 * legacy_secs / line_count, 1e6 * bytes_secs / line_count, legacy_secs / bytes_secs))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  Throughput and latency of each stage of `tweet_processor.py`
+#           (and of the whole thing) on synthetic tweets, written out as json
+#           and checked against a stored baseline.
+#
+#   $ python ./bench/bench_pipeline.py --tweets 50000 --json results.json
+#   $ python ./bench/bench_pipeline.py --baseline ./bench/baseline.json
+#   $ python ./bench/bench_pipeline.py --save-baseline ./bench/baseline.json
+#----------------------------------------------------------------
+
+import sys
+import json
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+from os import path
+from timeit import default_timer
+
+src_dir = path.join(path.dirname(path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, src_dir)
+from tweet_extractor import extract_tweet_fields
+from tweet_processor import parse_tweet_chunk
+from tweet_processor import iter_parsed_chunks
+from tweet_processor import process_tweets
+from tweets_graph import TweetsGraph
+from sharded_graph import ShardedTweetsGraph
+from output_sinks import make_sink
+from tweet_generator import add_generator_args
+from tweet_generator import generator_from_args
+
+
+# the graph stage again with a `ShardedTweetsGraph` (see `--graph-shards`) of each size
+SHARD_COUNTS = (1, 2, 4)
+STAGES = (('extract', 'parse', 'graph') + tuple('graph_shards_{}'.format(shards) for shards in SHARD_COUNTS)
+          + ('output', 'end_to_end'))
+
+
+def best_time(func, repeat):
+    '''Best wall time (secs) of `repeat` calls of `func` (and its last result)'''
+
+    best = result = None
+    for _ in range(repeat):
+        start = default_timer()
+        result = func()
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class _TimedSink(object):
+    '''Passes everything on to `sink`, noting the time of each write'''
+
+    def __init__(self, sink, write_times):
+        self.sink = sink
+        self.write_times = write_times
+
+    def write(self, item):
+        self.write_times.append(default_timer())
+        self.sink.write(item)
+
+    def flush(self):
+        self.sink.flush()
+
+    def close(self):
+        self.sink.close()
+
+
+def run_stages(lines, tweets_file_path, output_dir, chunk_size, repeat):
+    '''Times each stage on its own (with the output of the stage before it as
+    input) and then the whole pipeline, reading `tweets_file_path` and writing
+    into `output_dir`.
+
+
+    Returns
+    -------
+    (tuple) of the (dict) of stage name -> secs, and the (list) of per tweet
+    latencies (secs) from the end to end run
+    '''
+
+    stage_secs = {}
+    chunks = [lines[i:i + chunk_size] for i in range(0, len(lines), chunk_size)]
+
+    def extract():
+        for line in lines:
+            try:
+                extract_tweet_fields(line)
+            except Exception:
+                pass
+    stage_secs['extract'], _ = best_time(extract, repeat)
+
+    stage_secs['parse'], parsed_chunks = best_time(lambda: [parse_tweet_chunk(chunk) for chunk in chunks], repeat)
+    tweets = [parsed[0] for parsed_chunk in parsed_chunks for parsed in parsed_chunk if parsed is not None]
+
+    def graph():
+        tweet_graph = TweetsGraph()
+        avg_degrees = []
+        for tweet in tweets:
+            tweet_graph.update_graph(tweet)
+            avg_degrees.append(tweet_graph.get_graph_avg_degree_of_all_nodes(as_float=True))
+        return avg_degrees
+    stage_secs['graph'], avg_degrees = best_time(graph, repeat)
+
+    def sharded_graph(shards):
+        # a batch per chunk, the way `tweet_processor.py` feeds it (the time
+        # includes starting and stopping the shard processes)
+        tweet_graph = ShardedTweetsGraph(shards=shards)
+        try:
+            sharded_avg_degrees = []
+            for i in range(0, len(tweets), chunk_size):
+                sharded_avg_degrees.extend(tweet_graph.update_graph_batch(tweets[i:i + chunk_size]))
+        finally:
+            tweet_graph.close()
+        if sharded_avg_degrees != avg_degrees:
+            raise AssertionError('{} shards gave other average degrees than one graph'.format(shards))
+    for shards in SHARD_COUNTS:
+        stage_secs['graph_shards_{}'.format(shards)], _ = best_time(lambda: sharded_graph(shards), repeat)
+
+    outputs = [('{} (timestamp: {})\n'.format(parsed[1], parsed[2]), avg_deg)
+               for parsed, avg_deg in zip((parsed for parsed_chunk in parsed_chunks
+                                           for parsed in parsed_chunk if parsed is not None), avg_degrees)
+               if parsed[1] is not None]
+
+    def output():
+        ft1 = make_sink('file', path.join(output_dir, 'ft1.txt'))
+        ft2 = make_sink('file', path.join(output_dir, 'ft2.txt'), averages=True)
+        for text_line, avg_deg in outputs:
+            ft1.write(text_line)
+            ft2.write(avg_deg)
+        ft1.close()
+        ft2.close()
+    stage_secs['output'], _ = best_time(output, repeat)
+
+    def end_to_end():
+        # latency of a tweet: from when the chunk it's in starts being parsed until
+        # its average degree is written out (so the wait for its chunk is included)
+        latencies = []
+        write_times = []
+        tweet_graph = TweetsGraph()
+        ft1 = make_sink('file', path.join(output_dir, 'ft1.txt'))
+        ft2 = _TimedSink(make_sink('file', path.join(output_dir, 'ft2.txt'), averages=True), write_times)
+        with open(tweets_file_path, 'rb') as tweets_incomming:
+            chunk_start = default_timer()
+            for parsed_chunk, _ in iter_parsed_chunks(tweets_incomming, chunk_size=chunk_size):
+                process_tweets(parsed_chunk, tweet_graph, ft1, ft2)
+                latencies.extend(write_time - chunk_start for write_time in write_times)
+                del write_times[:]
+                chunk_start = default_timer()
+        ft1.close()
+        ft2.close()
+        return latencies
+    stage_secs['end_to_end'], latencies = best_time(end_to_end, repeat)
+    return stage_secs, latencies
+
+
+def check_against_baseline(results, baseline, tolerance):
+    '''Returns a (list) of (str) descriptions of every stage whose throughput
+    dropped by more than `tolerance` (a fraction) from the `baseline`, or that
+    isn't in the `baseline` at all (so it can't go unchecked)'''
+
+    failures = []
+    for stage, stage_results in sorted(results['stages'].items()):
+        baseline_stage = baseline['stages'].get(stage)
+        if baseline_stage is None:
+            failures.append('{}: not in the baseline, save a new one with --save-baseline'.format(stage))
+            continue
+        floor = baseline_stage['lines_per_sec'] * (1.0 - tolerance)
+        if stage_results['lines_per_sec'] < floor:
+            failures.append('{}: {:.0f} lines/sec, baseline {:.0f} (-{:.0%})'.format(
+                stage, stage_results['lines_per_sec'], baseline_stage['lines_per_sec'],
+                1 - stage_results['lines_per_sec'] / baseline_stage['lines_per_sec']))
+    return failures
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmarks each stage of tweet_processor.py '
+                                                 'on synthetic tweets.')
+    add_generator_args(parser)
+    parser.set_defaults(tweets=50000)
+    parser.add_argument('--chunk-size', type=int, default=1000, metavar='LINES')
+    parser.add_argument('--repeat', type=int, default=5, metavar='N',
+                        help='runs of each stage; the best is kept (default: 5)')
+    parser.add_argument('--json', default=None, metavar='PATH', help='write the results to PATH')
+    parser.add_argument('--baseline', default=None, metavar='PATH',
+                        help='fail if a stage is slower than in this results file (by more than --tolerance)')
+    parser.add_argument('--tolerance', type=float, default=0.2, metavar='FRACTION',
+                        help='slowdown allowed against the baseline (default: 0.2)')
+    parser.add_argument('--save-baseline', default=None, metavar='PATH',
+                        help='write the results to PATH to be used as a baseline later')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    config = dict((name, value) for name, value in sorted(vars(args).items())
+                  if name not in ('json', 'baseline', 'tolerance', 'save_baseline', 'repeat'))
+
+    work_dir = tempfile.mkdtemp(prefix='bench_pipeline')
+    try:
+        # as bytes, the way `tweet_processor.py` reads them in
+        lines = [line if isinstance(line, bytes) else line.encode('utf-8')
+                 for line in generator_from_args(args).lines(args.tweets)]
+        tweets_file_path = path.join(work_dir, 'tweets.txt')
+        with open(tweets_file_path, 'wb') as tweets_file:
+            tweets_file.writelines(lines)
+        stage_secs, latencies = run_stages(lines, tweets_file_path, work_dir, args.chunk_size, args.repeat)
+    finally:
+        shutil.rmtree(work_dir)
+
+    latencies.sort()
+    results = {
+        'config': config,
+        'python': '{} {}'.format(platform.python_implementation(), platform.python_version()),
+        'stages': dict((stage, {'secs': round(stage_secs[stage], 6),
+                                'lines_per_sec': round(len(lines) / stage_secs[stage], 1)})
+                       for stage in STAGES),
+        'latency_us': {'p50': round(1e6 * percentile(latencies, 0.50), 1),
+                       'p99': round(1e6 * percentile(latencies, 0.99), 1)},
+        # ru_maxrss is in KB on linux (but bytes on os x)
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                             / (1024.0 * 1024 if sys.platform == 'darwin' else 1024.0), 1),
+    }
+
+    sys.stdout.write('{} lines ({})\n'.format(len(lines), results['python']))
+    for stage in STAGES:
+        sys.stdout.write('  {:<14} {:10.0f} lines/sec  {:8.3f} secs\n'.format(
+            stage, results['stages'][stage]['lines_per_sec'], results['stages'][stage]['secs']))
+    sys.stdout.write('  latency        p50 {p50:.0f} us, p99 {p99:.0f} us\n'.format(**results['latency_us']))
+    sys.stdout.write('  peak rss       {} MB\n'.format(results['peak_rss_mb']))
+
+    for results_path in (args.json, args.save_baseline):
+        if results_path:
+            with open(results_path, 'w') as results_file:
+                json.dump(results, results_file, indent=2, sort_keys=True, separators=(',', ': '))
+                results_file.write('\n')
+
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['config'] != config:
+            sys.stdout.write('note: the baseline was run with different settings\n')
+        failures = check_against_baseline(results, baseline, args.tolerance)
+        for failure in failures:
+            sys.stdout.write('FAIL {}\n'.format(failure))
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  Microbenchmark of `timestamp_parser` against the original
+#           `timegm(strptime(...))` way of getting a tweet's timestamp.
+#
+#   $ python ./bench/bench_timestamp_parser.py
+#----------------------------------------------------------------
+
+import sys
+from os import path
+from time import strftime, gmtime, strptime
+from calendar import timegm
+from timeit import default_timer
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), '..', 'src'))
+from timestamp_parser import CREATED_AT_FORMAT, parse_created_at, TimestampParser
+
+
+def make_created_at_stream(seconds=2000, tweets_per_second=50, start=1446141061):
+    '''(list) of `created_at` strs like the api delivers them (many per second)'''
+
+    created_at_stream = []
+    for second in range(start, start + seconds):
+        created_at_stream.extend([strftime(CREATED_AT_FORMAT, gmtime(second))] * tweets_per_second)
+    return created_at_stream
+
+
+def time_it(func, created_at_stream, repeat=3):
+    '''Best wall time (secs) of calling `func` on every str in the stream'''
+
+    best = None
+    for _ in range(repeat):
+        start = default_timer()
+        for created_at in created_at_stream:
+            func(created_at)
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    created_at_stream = make_created_at_stream()
+    strptime_parse = lambda created_at: timegm(strptime(created_at, CREATED_AT_FORMAT))
+
+    # make sure they all agree before timing anything
+    expected = [strptime_parse(created_at) for created_at in created_at_stream[::49]]
+    assert expected == [parse_created_at(created_at) for created_at in created_at_stream[::49]]
+    assert expected == [TimestampParser().parse(created_at) for created_at in created_at_stream[::49]]
+
+    results = [('timegm(strptime(...))', time_it(strptime_parse, created_at_stream)),
+               ('parse_created_at (no cache)', time_it(parse_created_at, created_at_stream)),
+               ('TimestampParser().parse', time_it(TimestampParser().parse, created_at_stream))]
+
+    baseline = results[0][1]
+    sys.stdout.write('{} timestamps ({} per distinct second)\n'.format(len(created_at_stream), 50))
+    for name, elapsed in results:
+        sys.stdout.write('  {:<30} {:8.3f} us/tweet  {:7.1f}x\n'.format(
+            name, 1e6 * elapsed / len(created_at_stream), baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
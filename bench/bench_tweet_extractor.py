@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  Microbenchmark of `tweet_extractor` against decoding every
+#           tweet in full with `json.loads`.
+#
+#   $ python ./bench/bench_tweet_extractor.py [./data-gen/tweets_very_big.txt]
+#----------------------------------------------------------------
+
+import sys
+from os import path
+from timeit import default_timer
+
+src_dir = path.join(path.dirname(path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, src_dir)
+from tweet_extractor import extract_tweet_fields, _extract_with_json_loads
+
+
+def full_decode(line):
+    try:
+        return _extract_with_json_loads(line)
+    except Exception:
+        return None
+
+
+def selective_decode(line):
+    try:
+        return extract_tweet_fields(line)
+    except Exception:
+        return None
+
+
+def time_it(func, lines, repeat=3):
+    '''Best wall time (secs) of calling `func` on every line'''
+
+    best = None
+    for _ in range(repeat):
+        start = default_timer()
+        for line in lines:
+            func(line)
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv):
+    if argv:
+        with open(argv[0], 'rb') as tweets_file:
+            lines = tweets_file.readlines()
+    else:
+        with open(path.join(src_dir, 'tests', 'test_data', 'data_from_instructions_orig.txt'), 'rb') as f:
+            lines = f.readlines() * 5000
+
+    assert [full_decode(line) for line in lines[:1000]] == [selective_decode(line) for line in lines[:1000]]
+
+    full = time_it(full_decode, lines)
+    selective = time_it(selective_decode, lines)
+    sys.stdout.write('{} lines, {:.0f} bytes per line\n'.format(len(lines),
+                                                                sum(map(len, lines)) / float(len(lines))))
+    sys.stdout.write('  {:<20} {:8.3f} us/line\n'.format('json.loads', 1e6 * full / len(lines)))
+    sys.stdout.write('  {:<20} {:8.3f} us/line  {:5.1f}x\n'.format('extract_tweet_fields', 1e6 * selective / len(lines),
+                                                                  full / selective))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  Seedable generator of synthetic tweets, laid out like the lines of
+#           the Twitter streaming api output (no network or credentials needed),
+#           for benchmarking; see `bench_pipeline.py`.
+#
+#   $ python ./bench/tweet_generator.py --tweets 100000 --zipf 1.1 --out-of-order 0.05 > tweets.txt
+#----------------------------------------------------------------
+
+import sys
+import json
+import random
+import argparse
+from bisect import bisect
+from time import gmtime
+from time import strftime
+
+
+CREATED_AT_FORMAT = '%a %b %d %H:%M:%S +0000 %Y'
+DEFAULT_HASHTAG_COUNTS = '0:60,1:15,2:12,3:8,4:3,5:2'
+
+
+def parse_weights(spec):
+    '''Parses a 'value:weight,value:weight,...' (str) into a (list) of (value, weight)
+
+        eg. '0:60,2:30,3:10' -> 60% of the tweets with no hashtags, 30% with 2, ...'''
+
+    weights = []
+    for item in spec.split(','):
+        value, weight = item.split(':')
+        weights.append((int(value), float(weight)))
+    return weights
+
+
+class TweetGenerator(object):
+    """Makes lines of json that look like what `get-tweets.py` collects, with
+    knobs for the properties that matter to the graph.
+        eg.
+            generator = TweetGenerator(seed=1, tweets_per_sec=50, zipf=1.1)
+            lines = list(generator.lines(10000))
+
+
+    Attributes
+    ----------
+    seed: (int) the same seed (and settings) always makes the same lines
+
+    tweets_per_sec: (float) rate of tweets; sets how fast `created_at` moves
+
+    hashtag_counts: (list) of (number of hashtags, weight) for how many hashtags
+        each tweet has (Default: mostly none, like the real stream)
+
+    vocabulary: (int) number of distinct hashtags
+
+    zipf: (float) skew of how often each hashtag is used; the k-th most common
+        one is used in proportion to 1 / k**zipf (0 means all equally often)
+
+    out_of_order: (float) fraction of tweets that show up late
+
+    max_delay: (int) most seconds a late tweet can be behind
+
+    unicode_rate: (float) fraction of tweets with non ascii chars in their text
+
+    non_tweet_rate: (float) fraction of lines that are `limit`/`delete` notices
+
+    padding: (int) size of the (unused) user object in each tweet, to get the
+        line lengths of the real api output (~2-4KB)
+
+
+    Notes
+    -----
+    The fields are in the same order as the api's, so the lines take the same
+    path through `tweet_extractor.py` as real tweets would."""
+
+
+    def __init__(self, seed=0, tweets_per_sec=50.0, hashtag_counts=None, vocabulary=5000, zipf=1.0,
+                 out_of_order=0.0, max_delay=10, unicode_rate=0.1, non_tweet_rate=0.01, padding=2000,
+                 start_timestamp=1446141061):
+        self.seed = seed
+        self.tweets_per_sec = tweets_per_sec
+        self.hashtag_counts = hashtag_counts or parse_weights(DEFAULT_HASHTAG_COUNTS)
+        self.vocabulary = vocabulary
+        self.zipf = zipf
+        self.out_of_order = out_of_order
+        self.max_delay = max_delay
+        self.unicode_rate = unicode_rate
+        self.non_tweet_rate = non_tweet_rate
+        self.padding = padding
+        self.start_timestamp = start_timestamp
+
+
+    def lines(self, count):
+        '''Yields `count` lines (str, each ending in '\\r\\n' like the api's)'''
+
+        rand = random.Random(self.seed)
+        count_values, count_cumulative = _cumulative(self.hashtag_counts)
+        hashtag_cumulative = _cumulative([(rank, 1.0 / rank ** self.zipf)
+                                          for rank in range(1, self.vocabulary + 1)])[1]
+        user = '{"id":1,"description":' + json.dumps('x' * self.padding) + '}'
+
+        for i in range(count):
+            timestamp_ms = int(1000 * (self.start_timestamp + i / float(self.tweets_per_sec)))
+            if rand.random() < self.non_tweet_rate:
+                if rand.random() < 0.5:
+                    yield '{{"limit":{{"track":{},"timestamp_ms":"{}"}}}}\r\n'.format(i, timestamp_ms)
+                else:
+                    yield ('{{"delete":{{"status":{{"id":{0},"id_str":"{0}","user_id":1,"user_id_str":"1"}},'
+                           '"timestamp_ms":"{1}"}}}}\r\n').format(i, timestamp_ms)
+                continue
+            if rand.random() < self.out_of_order:
+                timestamp_ms -= 1000 * (1 + int(rand.random() * self.max_delay))
+
+            hashtag_count = count_values[bisect(count_cumulative, rand.random() * count_cumulative[-1])]
+            hashtags = ['tag{}'.format(bisect(hashtag_cumulative, rand.random() * hashtag_cumulative[-1]))
+                        for _ in range(hashtag_count)]
+            text = u'synthetic tweet {}'.format(i)
+            hashtag_entities = []
+            for hashtag in hashtags:
+                hashtag_entities.append('{{"text":"{}","indices":[{},{}]}}'.format(
+                    hashtag, len(text) + 1, len(text) + 2 + len(hashtag)))
+                text += u' #' + hashtag
+            if rand.random() < self.unicode_rate:
+                text += u' caf\xe9 \u2615'
+
+            yield ('{{"created_at":"{created_at}","id":{id},"id_str":"{id}","text":{text},'
+                   '"source":"synthetic","truncated":false,"user":{user},"geo":null,"retweet_count":0,'
+                   '"entities":{{"hashtags":[{hashtags}],"urls":[],"user_mentions":[],"symbols":[]}},'
+                   '"lang":"en","timestamp_ms":"{timestamp_ms}"}}\r\n').format(
+                       created_at=strftime(CREATED_AT_FORMAT, gmtime(timestamp_ms // 1000)), id=i,
+                       text=json.dumps(text), user=user, hashtags=','.join(hashtag_entities),
+                       timestamp_ms=timestamp_ms)
+
+
+def _cumulative(weights):
+    '''(tuple) of the values and the running totals of their weights, for `bisect`'''
+
+    values, cumulative = [], []
+    total = 0.0
+    for value, weight in weights:
+        total += weight
+        values.append(value)
+        cumulative.append(total)
+    return values, cumulative
+
+
+def add_generator_args(parser):
+    '''Adds the options of `TweetGenerator` to an argparse `parser`'''
+
+    parser.add_argument('--tweets', type=int, default=100000, metavar='N',
+                        help='number of lines to generate (default: 100000)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tweets-per-sec', type=float, default=50.0, metavar='RATE',
+                        help='tweets per (tweet time) second (default: 50)')
+    parser.add_argument('--hashtag-counts', default=DEFAULT_HASHTAG_COUNTS, metavar='N:WEIGHT,...',
+                        help='weights of the number of hashtags per tweet (default: {})'.format(
+                            DEFAULT_HASHTAG_COUNTS))
+    parser.add_argument('--vocabulary', type=int, default=5000, metavar='N',
+                        help='number of distinct hashtags (default: 5000)')
+    parser.add_argument('--zipf', type=float, default=1.0, metavar='S',
+                        help='skew of the hashtag frequencies; 0 is uniform (default: 1.0)')
+    parser.add_argument('--out-of-order', type=float, default=0.0, metavar='FRACTION',
+                        help='fraction of tweets that arrive late (default: 0)')
+    parser.add_argument('--max-delay', type=int, default=10, metavar='SECS',
+                        help='most seconds a late tweet is behind (default: 10)')
+    parser.add_argument('--unicode-rate', type=float, default=0.1, metavar='FRACTION',
+                        help='fraction of tweets with non ascii text (default: 0.1)')
+    parser.add_argument('--non-tweet-rate', type=float, default=0.01, metavar='FRACTION',
+                        help='fraction of limit/delete notices (default: 0.01)')
+    parser.add_argument('--padding', type=int, default=2000, metavar='BYTES',
+                        help='size of the filler user object in each tweet (default: 2000)')
+
+
+def generator_from_args(args):
+    return TweetGenerator(seed=args.seed, tweets_per_sec=args.tweets_per_sec,
+                          hashtag_counts=parse_weights(args.hashtag_counts), vocabulary=args.vocabulary,
+                          zipf=args.zipf, out_of_order=args.out_of_order, max_delay=args.max_delay,
+                          unicode_rate=args.unicode_rate, non_tweet_rate=args.non_tweet_rate,
+                          padding=args.padding)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Writes synthetic tweets to stdout.')
+    add_generator_args(parser)
+    args = parser.parse_args(sys.argv[1:])
+    write = sys.stdout.write
+    for line in generator_from_args(args).lines(args.tweets):
+        write(line)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  Checks the estimates of `ApproxTweetsGraph` against the exact
+#           `TweetsGraph` on a recorded file of tweets (or synthetic ones):
+#           the errors of the node and edge counts and of the average degree
+#           after every tweet, against the standard errors the sketches
+#           state, and that the degree bounds are never below the true
+#           degrees.  Exits with 1 if either doesn't hold.
+#
+#   $ python ./bench/validate_approx.py ./tweet_input/tweets.txt --time-window 3600
+#   $ python ./bench/validate_approx.py --tweets 200000 --vocabulary 1000000 --zipf 0.5
+#----------------------------------------------------------------
+
+import sys
+import shutil
+import argparse
+import platform
+import tempfile
+from os import path
+from math import sqrt
+from random import Random
+from timeit import default_timer
+
+src_dir = path.join(path.dirname(path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, src_dir)
+from tweet_processor import iter_parsed_file_chunks
+from tweets_graph import TweetsGraph
+from approx_graph import ApproxTweetsGraph
+from tweet_generator import add_generator_args
+from tweet_generator import generator_from_args
+
+
+def read_tweets(tweets_path):
+    '''(list) of the `Tweet`s in the file at `tweets_path` (compressed or not)'''
+
+    tweets = []
+    for parsed_chunk, _ in iter_parsed_file_chunks(tweets_path, 0, workers=1, chunk_size=1000):
+        tweets.extend(parsed_tweet[0] for parsed_tweet in parsed_chunk if parsed_tweet is not None)
+    return tweets
+
+
+def relative_error(estimate, exact):
+    return abs(estimate - exact) / float(exact)
+
+
+def summarize(errors, std_error):
+    '''(tuple) of the root mean square (ie. the measured standard error),
+    median, 95th percentile and max of `errors`, and the fraction of them
+    within twice `std_error`'''
+
+    if not errors:
+        return 0.0, 0.0, 0.0, 0.0, 1.0
+    errors = sorted(errors)
+    within = sum(1 for error in errors if error <= 2 * std_error) / float(len(errors))
+    return (sqrt(sum(error * error for error in errors) / len(errors)), errors[len(errors) // 2],
+            errors[min(len(errors) - 1, int(0.95 * len(errors)))], errors[-1], within)
+
+
+def main(args):
+    work_dir = tempfile.mkdtemp(prefix='validate_approx')
+    try:
+        if args.tweets_input:
+            tweets_path = args.tweets_input
+        else:
+            tweets_path = path.join(work_dir, 'tweets.txt')
+            with open(tweets_path, 'wb') as tweets_file:
+                for line in generator_from_args(args).lines(args.tweets):
+                    tweets_file.write(line if isinstance(line, bytes) else line.encode('utf-8'))
+        tweets = read_tweets(tweets_path)
+    finally:
+        shutil.rmtree(work_dir)
+
+    # the exact graph first, noting what it had after each tweet
+    exact_graph = TweetsGraph(args.time_window, args.max_lateness)
+    exact = []
+    peak_nodes = peak_edges = 0
+    start = default_timer()
+    for tweet in tweets:
+        exact_graph.update_graph(tweet)
+        edge_store = exact_graph.edge_store
+        exact.append((edge_store.node_count, edge_store.edge_count, edge_store.avg_degree()))
+        peak_nodes = max(peak_nodes, edge_store.node_count)
+        peak_edges = max(peak_edges, edge_store.edge_count)
+    exact_secs = default_timer() - start
+
+    approx_graph = ApproxTweetsGraph(args.time_window, args.max_lateness, precision=args.precision)
+    errors = {'nodes': [], 'edges': [], 'avg degree': []}
+    approx_secs = 0.0
+    for tweet, (node_count, edge_count, avg_deg) in zip(tweets, exact):
+        start = default_timer()
+        approx_graph.update_graph(tweet)
+        approx_avg_deg = approx_graph.get_graph_avg_degree_of_all_nodes(as_float=True)
+        approx_secs += default_timer() - start
+        if node_count:
+            errors['nodes'].append(relative_error(approx_graph.estimated_node_count(), node_count))
+            errors['edges'].append(relative_error(approx_graph.estimated_edge_count(), edge_count))
+            errors['avg degree'].append(relative_error(approx_avg_deg, avg_deg))
+
+    # the degree bounds, for (a sample of) the hashtags of the last window
+    graph = exact_graph.graph
+    hashtags = sorted(graph)
+    hashtags = Random(0).sample(hashtags, min(args.check_degrees, len(hashtags)))
+    degree_misses = [hashtag for hashtag in hashtags
+                     if approx_graph.degree_upper_bound(hashtag) < len(graph[hashtag])]
+    overestimates = [approx_graph.degree_upper_bound(hashtag) / float(len(graph[hashtag]))
+                     for hashtag in hashtags]
+
+    # the average degree, a ratio of two estimates, has sqrt(2) times their
+    # standard error; the estimates after one tweet and the next are nearly
+    # the same, so a run only has as many independent ones as it has windows
+    # of tweets, and the measured standard errors get `--tolerance` of slack
+    std_error = approx_graph.relative_error
+    std_errors = {'nodes': std_error, 'edges': std_error, 'avg degree': sqrt(2) * std_error}
+    write = sys.stdout.write
+    write('{} tweets, {} sec window, precision {} ({} {})\n'.format(
+        len(tweets), args.time_window, args.precision, platform.python_implementation(),
+        platform.python_version()))
+    write('  {:<12} {:>7} {:>7} {:>7} {:>7} {:>8} {:>10}\n'.format(
+        'relative err', 'rms', 'p50', 'p95', 'max', 'stated', 'within 2x'))
+    failed = False
+    for name in ('nodes', 'edges', 'avg degree'):
+        rms, median, p95, worst, within = summarize(errors[name], std_errors[name])
+        write('  {:<12} {:7.2%} {:7.2%} {:7.2%} {:7.2%} {:8.2%} {:10.1%}\n'.format(
+            name, rms, median, p95, worst, std_errors[name], within))
+        failed = failed or rms > args.tolerance * std_errors[name]
+    write('  degree bounds: {} hashtags checked, {} below the true degree, {:.2f}x it on average\n'.format(
+        len(hashtags), len(degree_misses), sum(overestimates) / max(1, len(overestimates))))
+    write('  exact graph: up to {} nodes and {} edges;  sketches: {:.1f} KB (fixed)\n'.format(
+        peak_nodes, peak_edges, approx_graph.memory_bytes / 1024.0))
+    write('  update + average: exact {:.2f} us/tweet, approximate {:.2f} us/tweet\n'.format(
+        1e6 * exact_secs / max(1, len(tweets)), 1e6 * approx_secs / max(1, len(tweets))))
+    if failed or degree_misses:
+        write('FAILED: the estimates are not within the stated bounds\n')
+        sys.exit(1)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Compares the approximate graph to the exact one.')
+    parser.add_argument('tweets_input', nargs='?', default=None,
+                        help='a recorded file of tweets (can be compressed); synthetic tweets '
+                             'are generated when left out')
+    parser.add_argument('--time-window', type=int, default=60, metavar='SECS')
+    parser.add_argument('--max-lateness', type=int, default=None, metavar='SECS')
+    parser.add_argument('--precision', type=int, default=12, metavar='P',
+                        help='see --approx-precision of tweet_processor.py (default: 12)')
+    parser.add_argument('--tolerance', type=float, default=1.5, metavar='X',
+                        help='fail if a measured standard error is more than X times the stated '
+                             'one (default: 1.5)')
+    parser.add_argument('--check-degrees', type=int, default=1000, metavar='N',
+                        help='number of hashtags to check the degree bounds of (default: 1000)')
+    add_generator_args(parser)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_args(sys.argv[1:]))
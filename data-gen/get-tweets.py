@@ -6,6 +6,7 @@ from tweepy import OAuthHandler
 from tweepy import Stream
 from datetime import datetime
 from pprint import pprint
+from time import time
 import json
 import os
 
@@ -22,21 +23,44 @@ consumer_secret = twitter_cred["consumer_secret"]
 
 class StdOutListener(StreamListener):
     """ A listener handles tweets that are the received from the stream.
-    This is a basic listener that just prints received tweets to stdout.
+    This is a basic listener that appends the received tweets to a file;
+    the file is kept open, and the tweets are written out in batches (once
+    `flush_bytes` have piled up, or `flush_interval` secs have passed), so
+    that `tweet_processor.py --follow` can keep up with it in real time.
     """
-    def __init__(self, filename):
+    def __init__(self, filename, flush_bytes=1 << 16, flush_interval=1.0):
         self.filename = filename
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.tweets_file = open(self.filename, 'ab')
+        self.pending = []
+        self.pending_bytes = 0
+        self.last_flush = time()
 
     # this is the event handler for new data
     def on_data(self, data):
-        if not os.path.isfile(self.filename):    # check if file doesn't exist
-            f = file(self.filename, 'w')
-            f.close()
-        with open(self.filename, 'ab') as f:
-            # print("writing to {}".format(self.filename))
-            f.write(data)
-        f.closed
-        
+        self.pending.append(data)
+        self.pending_bytes += len(data)
+        if self.pending_bytes >= self.flush_bytes or time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    # the stream sends a keep-alive every so often, even when no tweets come in
+    def keep_alive(self):
+        if self.pending and time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        # print("writing to {}".format(self.filename))
+        self.tweets_file.write(''.join(self.pending))
+        self.tweets_file.flush()
+        self.pending = []
+        self.pending_bytes = 0
+        self.last_flush = time()
+
+    def close(self):
+        self.flush()
+        self.tweets_file.close()
+
     # this is the event handler for errors    
     def on_error(self, status):
         print(status)
@@ -48,4 +72,7 @@ if __name__ == '__main__':
 
     print("Use CTRL + C to exit at any time.\n")
     stream = Stream(auth, listener)
-    stream.filter(locations=[-180,-90,180,90]) # this is the entire world, any tweet with geo-location enabled
+    try:
+        stream.filter(locations=[-180,-90,180,90]) # this is the entire world, any tweet with geo-location enabled
+    finally:
+        listener.close()
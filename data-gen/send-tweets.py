@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+# Local stand-in for the Twitter stream when running `src/async_ingest.py`:
+# replays a file of tweets (eg. one collected with get-tweets.py) over several
+# concurrent connections, then asks the server for its stats.
+#
+#   $ python3 ./src/async_ingest.py --listen /tmp/tweets.sock --query /tmp/query.sock
+#   $ python3 ./data-gen/send-tweets.py ./data-gen/tweets.txt /tmp/tweets.sock --query /tmp/query.sock
+
+import os
+import sys
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'src'))
+from async_ingest import send_tweets
+from async_ingest import query
+
+BATCH_SIZE = 100    # lines sent at a time
+
+
+async def main(args):
+    with open(args.tweets_file, 'rb') as tweets_file:
+        lines = tweets_file.readlines()
+    # each connection gets every n-th line, like n collectors splitting up one stream
+    interval = BATCH_SIZE * args.connections / args.rate if args.rate else None
+    senders = []
+    for i in range(args.connections):
+        shard = lines[i::args.connections]
+        blocks = (b''.join(shard[start:start + BATCH_SIZE]) for start in range(0, len(shard), BATCH_SIZE))
+        senders.append(send_tweets(args.address, blocks, interval))
+    await asyncio.gather(*senders)
+
+    if args.query:
+        await asyncio.sleep(args.settle)
+        for q, reply in zip(['avg', 'stats'], await query(args.query, ['avg', 'stats'])):
+            print('{}: {}'.format(q, reply))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replays a file of tweets to async_ingest.py.')
+    parser.add_argument('tweets_file')
+    parser.add_argument('address', help='unix socket path or HOST:PORT the server listens on')
+    parser.add_argument('--connections', type=int, default=4, metavar='N',
+                        help='number of concurrent connections to send over (default: 4)')
+    parser.add_argument('--rate', type=float, default=None, metavar='LINES_PER_SEC',
+                        help='total lines per second to send at (default: as fast as possible)')
+    parser.add_argument('--query', default=None, metavar='ADDRESS',
+                        help="server's query address; if given, the stats are printed at the end")
+    parser.add_argument('--settle', type=float, default=0.5, metavar='SECS',
+                        help='how long to wait after sending before querying (default: 0.5)')
+    asyncio.run(main(parser.parse_args(sys.argv[1:])))
@@ -8,9 +8,62 @@
 #
 # Optionally, the script can take one argument -- the path to a data set file.
 #   $ python ./src/tweet_processor.py ./data-gen/tweets.txt
+#
+# Out of order input (eg. several stream shards merged together) is fine; tweets
+# more than --max-lateness secs behind the newest one are left out of the graph.
+#   $ python ./src/tweet_processor.py ./data-gen/tweets.txt --max-lateness 10
+#
+# On a multi-core box the json decoding and text cleaning can be spread over
+# several processes (the output is exactly the same as with a single process).
+#   $ python ./src/tweet_processor.py ./data-gen/tweets.txt --workers 8
+#
+# The upkeep of the graph itself can also be split over several processes (each
+# holding the edges of a share of the hashtags); again the output doesn't change.
+#   $ python ./src/tweet_processor.py ./data-gen/tweets.txt --workers 4 --graph-shards 4
+#
+# With --checkpoint the graph and the input position are saved every minute, and
+# rerunning the same command after a crash resumes from there (no replaying).
+#   $ python ./src/tweet_processor.py ./data-gen/tweets.txt --checkpoint ./tweet_output/checkpoint.pkl
+#
+# A gzip, bz2 (or, with the zstandard package, zstd) compressed file is read as
+# is, and --start-time begins the replay at a given time (found with a line index
+# that's saved next to the file as <file>.idx the first time).
+#   $ python ./src/tweet_processor.py ./data-gen/tweets.txt.gz
+#   $ python ./src/tweet_processor.py ./data-gen/tweets.txt --start-time 2015-10-29T17:52:00
+#
+# To keep up with a file that's still being collected (eg. by ./data-gen/get-tweets.py),
+# --follow keeps reading whatever gets appended and writes the results out in real
+# time (stop it with ctrl-c); '-' reads from stdin and --listen from a local socket.
+#   $ python ./src/tweet_processor.py ./data-gen/tweets_very_big.txt --follow
+#   $ python ./src/tweet_processor.py --listen /tmp/tweets.sock
+#
+# Several time windows can be kept from the one pass over the tweets; ft2 then gets
+# a column of averages per window (in the order given).
+#   $ python ./src/tweet_processor.py ./data-gen/tweets.txt --time-windows 10,60,300
+#
+# For looking back at some moment of a long replay, src/tweet_archive.py converts
+# the tweets into a columnar archive once, from which the graph of the window
+# ending at any time is rebuilt by reading just that window's tweets.
+#   $ python ./src/tweet_archive.py build ./data-gen/tweets.txt ./tweet_archive
+#   $ python ./src/tweet_archive.py graph ./tweet_archive --at 2015-10-29T17:52:00 --top 10
+#
+# For windows with more hashtags than the graph can be kept for, --approximate
+# estimates the averages with fixed size sketches instead (within a few percent);
+# bench/validate_approx.py checks them against the exact ones on a recorded file.
+#   $ python ./src/tweet_processor.py ./data-gen/tweets.txt --approximate --time-windows 3600
+#   $ python ./bench/validate_approx.py ./data-gen/tweets.txt --time-window 3600
+#
+# --stats-interval logs the time spent in each stage, the parsed/skipped/errored
+# line counts and the size of the graph (to stderr); --profile writes a cProfile
+# (or, with --profiler sampling, a flame graph friendly) profile of the run.
+#   $ python ./src/tweet_processor.py ./data-gen/tweets.txt --stats-interval 10
+#   $ python ./src/tweet_processor.py ./data-gen/tweets.txt --profile run.prof
 
 
 python ./src/tweet_processor.py
 
+# python3 works just as well (and is faster than python 2)
+#python3 ./src/tweet_processor.py
+
 # pypy is WAY faster!
 #pypy ./src/tweet_processor.py
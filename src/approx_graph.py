@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  `ApproxTweetsGraph` estimates the number of hashtags and edges
+#           (and so the average degree) of the time window with sketches of
+#           a fixed size, rather than keeping the graph itself, for windows
+#           with more hashtags than would fit in memory.
+#----------------------------------------------------------------
+
+from math import log
+from math import sqrt
+from array import array
+from zlib import crc32
+from itertools import combinations
+
+from tweets_graph import format_avg_degree
+
+
+_MASK32 = 0xffffffff
+_NEVER = -(1 << 31)     # `last_seen` of a rank that hasn't been seen (in an array('i'))
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(64)]
+_ALPHA = 1 / (2 * log(2))
+
+
+def _sigma(x):
+    '''sigma(x) = x + sum over k >= 1 of x ** (2 ** k) * 2 ** (k - 1)'''
+
+    if x == 1:
+        return float('inf')
+    y = 1.0
+    z = x
+    while True:
+        x *= x
+        z_old = z
+        z += x * y
+        y += y
+        if z == z_old:
+            return z
+
+
+def _tau(x):
+    '''tau(x) = (1 - x - sum over k >= 1 of (1 - x ** (2 ** -k)) ** 2 * 2 ** -k) / 3'''
+
+    if x == 0 or x == 1:
+        return 0.0
+    y = 1.0
+    z = 1 - x
+    while True:
+        x = sqrt(x)
+        z_old = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == z_old:
+            return z / 3
+
+
+def _fmix32(h):
+    '''murmur3's finalizer: spreads every bit of the (int) `h` over all 32 bits'''
+
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & _MASK32
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & _MASK32
+    return h ^ (h >> 16)
+
+
+def hash_hashtag(hashtag):
+    '''(int) 32 bit hash of `hashtag`; the same in every process and under
+    python 2 and 3 (unlike `hash`)'''
+
+    if not isinstance(hashtag, bytes):  # python 3; the same bytes as a python 2 str has
+        hashtag = hashtag.encode('utf-8')
+    return _fmix32(crc32(hashtag) & _MASK32)
+
+
+def hash_edge(hashed, other_hashed):
+    '''(int) 32 bit hash of the edge between two hashtags, from their
+    `hash_hashtag`s (in either order)'''
+
+    if hashed > other_hashed:
+        hashed, other_hashed = other_hashed, hashed
+    return _fmix32(hashed ^ ((other_hashed * 0x9e3779b1) & _MASK32))
+
+
+
+class SlidingHyperLogLog(object):
+    """Estimates the number of distinct items (by their 32 bit hashes) seen in
+    the last `time_window` secs, in a fixed amount of memory.
+        eg.
+            sketch = SlidingHyperLogLog(time_window=60)
+            sketch.update([hash_hashtag('spark'), hash_hashtag('hadoop')], timestamp)
+            sketch.estimate()      # -> 2.0
+
+
+    Attributes
+    ----------
+    time_window: (int) secs that an item counts for after it was last seen
+
+    precision: (int) the first `precision` bits of a hash pick its register
+        (Default: 12, ie. 4096 registers)
+
+    register_count: (int) 2 ** `precision`
+
+    relative_error: (float) standard error of an estimate, relative to the
+        true count: 1.04 / sqrt(`register_count`) (1.6% for 4096 registers)
+
+    newest_timestamp: (int) newest timestamp seen (None if there hasn't been one)
+
+
+    Notes
+    -----
+    A HyperLogLog keeps, for each register, the most leading zeros (+ 1, its
+    rank) of the rest of the hashes that landed in it.  To be able to forget
+    items once they're out of the window, each register here keeps the newest
+    timestamp it saw each rank at (32 - `precision` + 1 ranks); its value for
+    the window is its highest rank that was seen within it.  That value only
+    drops when the timestamp it's owed to leaves the window, so each register
+    is filed under that second, and only the registers filed under the seconds
+    that expire are looked at again (the same filing as a `MultiWindowTweetsGraph`
+    does for its edges).  What the estimate is made from (the sum of 2 ** -value
+    over the registers, and how many of them are empty and at the highest rank)
+    is kept up to date as registers change, so an estimate is O(1); the sum is
+    exact, as it's a sum of powers of two.  The memory is the same however many items there
+    are: 4 bytes per rank per register (~360KB for 4096), and a register is
+    filed under at most one second.  With 32 bit hashes, counts of more than
+    ~10**8 get increasingly less accurate."""
+
+
+    def __init__(self, time_window=60, precision=12):
+        if not 4 <= precision <= 16:
+            raise ValueError('precision needs to be from 4 to 16, not {}'.format(precision))
+        self.time_window = time_window
+        self.precision = precision
+        self.register_count = register_count = 1 << precision
+        self.relative_error = 1.04 / sqrt(register_count)
+        self.newest_timestamp = None
+        self.__rank_bits = 32 - precision
+        self.__stride = self.__rank_bits + 2   # ranks 1 through rank_bits + 1 (0 is unused)
+        self.__last_seen = array('i', [_NEVER]) * (register_count * self.__stride)
+        self.__registers = bytearray(register_count)
+        self.__filed_at = {}            # timestamp -> (set) of the registers whose value it holds up
+        self.__inverse_sum = float(register_count)     # sum of 2 ** -value over the registers
+        self.__zero_registers = register_count
+        self.__full_registers = 0       # at the highest rank there is
+        self.__cutoff = None            # oldest timestamp still in the window
+
+
+    def update(self, hashes, timestamp):
+        '''Adds the items with the (int) 32 bit `hashes` (eg. from `hash_hashtag`),
+        seen at `timestamp`; moves the window along first if that's the newest
+        timestamp yet, and ignores them if it's already out of the window'''
+
+        if self.newest_timestamp is None or timestamp > self.newest_timestamp:
+            self.advance(timestamp)
+        elif timestamp < self.__cutoff:
+            return
+        last_seen = self.__last_seen
+        registers = self.__registers
+        stride = self.__stride
+        rank_bits = self.__rank_bits
+        rank_mask = (1 << rank_bits) - 1
+        for hashed in hashes:
+            register = hashed >> rank_bits
+            rank = rank_bits - (hashed & rank_mask).bit_length() + 1
+            slot = register * stride + rank
+            seen = last_seen[slot]
+            if timestamp <= seen:
+                continue
+            last_seen[slot] = timestamp
+            value = registers[register]
+            if rank < value:
+                continue
+            if rank > value:
+                if value:
+                    self.__unfile(register, last_seen[register * stride + value])
+                self.__set_register(register, value, rank)
+            else:
+                self.__unfile(register, seen)
+            self.__file(register, timestamp)
+
+
+    def __file(self, register, timestamp):
+        registers = self.__filed_at.get(timestamp)
+        if registers is None:
+            registers = self.__filed_at[timestamp] = set()
+        registers.add(register)
+
+
+    def __unfile(self, register, timestamp):
+        registers = self.__filed_at[timestamp]
+        registers.discard(register)
+        if not registers:
+            del self.__filed_at[timestamp]
+
+
+    def __set_register(self, register, old_value, new_value):
+        self.__registers[register] = new_value
+        self.__inverse_sum += _INVERSE_POWERS[new_value] - _INVERSE_POWERS[old_value]
+        self.__zero_registers += (not new_value) - (not old_value)
+        top_rank = self.__rank_bits + 1
+        self.__full_registers += (new_value == top_rank) - (old_value == top_rank)
+
+
+    def advance(self, timestamp):
+        '''Moves the window along to end at `timestamp` (the newest yet); the
+        registers whose values were owed to seconds that just left it drop to
+        their highest rank that is still in it'''
+
+        self.newest_timestamp = timestamp
+        old_cutoff = self.__cutoff
+        cutoff = self.__cutoff = timestamp - self.time_window
+        filed_at = self.__filed_at
+        if old_cutoff is None or not filed_at:
+            return
+        # look up each second that just expired, or go over `filed_at` if that's fewer
+        if cutoff - old_cutoff <= len(filed_at):
+            expired = [second for second in range(old_cutoff, cutoff) if second in filed_at]
+        else:
+            expired = [second for second in filed_at if second < cutoff]
+        last_seen = self.__last_seen
+        registers = self.__registers
+        stride = self.__stride
+        for second in expired:
+            for register in filed_at.pop(second):
+                value = registers[register]
+                base = register * stride
+                for rank in range(value - 1, 0, -1):
+                    seen = last_seen[base + rank]
+                    if seen >= cutoff:
+                        self.__set_register(register, value, rank)
+                        self.__file(register, seen)
+                        break
+                else:
+                    self.__set_register(register, value, 0)
+
+
+    def estimate(self):
+        '''Returns the (float) estimated number of distinct items in the window'''
+
+        # Ertl's improved estimator ("New cardinality estimation algorithms for
+        # HyperLogLog sketches", 2017), which (unlike the original one with its
+        # small and large range corrections) has no bias to speak of at any count
+        register_count = self.register_count
+        zeros, fulls = self.__zero_registers, self.__full_registers
+        rank_bits = self.__rank_bits
+        if zeros == register_count:
+            return 0.0
+        in_between = self.__inverse_sum - zeros - fulls * _INVERSE_POWERS[rank_bits + 1]
+        denominator = (register_count * _sigma(zeros / float(register_count)) + in_between +
+                       register_count * _tau(1 - fulls / float(register_count)) * _INVERSE_POWERS[rank_bits])
+        return _ALPHA * register_count * register_count / denominator
+
+
+    @property
+    def memory_bytes(self):
+        '''(int) bytes taken by the registers (the same however many items there are)'''
+        return (len(self.__last_seen) * self.__last_seen.itemsize + len(self.__registers))
+
+
+
+class SlidingCountMin(object):
+    """Count-min sketch of the counts added for each item (by its 32 bit hash)
+    over (about) the last `time_window` secs, in a fixed amount of memory.
+        eg.
+            sketch = SlidingCountMin(time_window=60)
+            sketch.add(hash_hashtag('spark'), timestamp, 2)
+            sketch.estimate(hash_hashtag('spark'))     # -> 2
+
+
+    Attributes
+    ----------
+    width, depth: (int) counters per row, and rows (Default: 2048 and 4); an
+        estimate is never below the true count, and is more than
+        e / `width` * (the total of all of the counts in the window) above it
+        with a probability of at most e ** -`depth`
+
+    pane_secs: (int) the counts are kept in panes of this many secs
+        (`time_window` / `panes`, rounded up), which expire as a whole
+
+
+    Notes
+    -----
+    Counts go into the pane for their second, and an estimate adds up the
+    panes (`depth` counters from each); a pane is dropped once all of its
+    seconds have left the window.  So the oldest pane can hold up to
+    `pane_secs` - 1 secs of counts that are already out of the window, which
+    (like the collisions) can only make an estimate higher.  There are never
+    more than `panes` + 1 panes, and their arrays are reused as they expire."""
+
+
+    def __init__(self, time_window=60, width=2048, depth=4, panes=8):
+        self.time_window = time_window
+        self.width = width
+        self.depth = depth
+        self.pane_secs = max(1, -(-time_window // panes))
+        self.newest_timestamp = None
+        self.__panes = {}               # pane number -> (array) of its counts
+        self.__spare_panes = []
+        self.__zeros = array('l', [0]) * (width * depth)
+        self.__oldest_pane = None
+
+
+    def __slots_of(self, hashed):
+        '''(list) of the counter of `hashed` in each row (double hashing)'''
+
+        step = _fmix32(hashed ^ 0x5bd1e995) | 1
+        width = self.width
+        return [row * width + (hashed + row * step) % width for row in range(self.depth)]
+
+
+    def advance(self, timestamp):
+        '''Moves the window along to end at `timestamp` (the newest yet)'''
+
+        self.newest_timestamp = timestamp
+        oldest_pane = (timestamp - self.time_window) // self.pane_secs
+        if self.__oldest_pane is not None and oldest_pane <= self.__oldest_pane:
+            return
+        self.__oldest_pane = oldest_pane
+        for pane_number in [number for number in self.__panes if number < oldest_pane]:
+            self.__spare_panes.append(self.__panes.pop(pane_number))
+
+
+    def add(self, hashed, timestamp, count=1):
+        '''Adds `count` to the item with the (int) 32 bit hash `hashed`, at
+        `timestamp` (moving the window along first if that's the newest yet)'''
+
+        if self.newest_timestamp is None or timestamp > self.newest_timestamp:
+            self.advance(timestamp)
+        pane_number = timestamp // self.pane_secs
+        if pane_number < self.__oldest_pane:
+            return
+        counts = self.__panes.get(pane_number)
+        if counts is None:
+            if self.__spare_panes:
+                counts = self.__spare_panes.pop()
+                counts[:] = self.__zeros
+            else:
+                counts = array('l', self.__zeros)
+            self.__panes[pane_number] = counts
+        for slot in self.__slots_of(hashed):
+            counts[slot] += count
+
+
+    def estimate(self, hashed):
+        '''Returns the (int) estimated count of the item with the hash `hashed`'''
+
+        panes = list(self.__panes.values())
+        return min(sum(counts[slot] for counts in panes) for slot in self.__slots_of(hashed))
+
+
+    @property
+    def memory_bytes(self):
+        '''(int) bytes taken by the counters, at most (`panes` + 2) arrays of them'''
+
+        arrays = [self.__zeros] + list(self.__panes.values()) + self.__spare_panes
+        return sum(len(counts) * counts.itemsize for counts in arrays)
+
+
+
+class ApproxTweetsGraph(object):
+    """Estimates of the size and average degree of the graph of a `TweetsGraph`,
+    in a fixed amount of memory (whatever the number of hashtags).
+        eg.
+            tweet_graph = ApproxTweetsGraph(time_window=3600)
+            tweet_graph.update_graph(tweet)
+            tweet_graph.get_graph_avg_degree_of_all_nodes()   # -> '2.31'
+            tweet_graph.estimated_node_count()                # -> 48211.7
+            tweet_graph.degree_upper_bound('#spark')          # -> 12
+
+
+    Methods
+    -------
+    update_graph: adds a tweet, the same as for a `TweetsGraph`
+
+    get_graph_avg_degree_of_all_nodes: the estimated average degree
+
+    estimated_node_count, estimated_edge_count: estimated number of hashtags
+        and edges in the window
+
+    degree_upper_bound: a count that a hashtag's degree is no more than
+
+
+    Attributes
+    ----------
+    time_window, max_lateness, late_tweets_merged, late_tweets_dropped,
+        newest_timestamp: the same as for a `TweetsGraph`
+
+    node_sketch, edge_sketch: (SlidingHyperLogLog) of the hashtags, and of the
+        edges, of the tweets in the window
+
+    degree_sketch: (SlidingCountMin) of the number of (other) hashtags each
+        hashtag was in a tweet with
+
+    relative_error: (float) standard error of the node and edge counts,
+        relative to the true counts (1.6% at the default `precision` of 12);
+        the average degree is a ratio of the two, so its standard error is
+        about sqrt(2) times that, and ~95% of the averages are within twice it
+
+
+    Notes
+    -----
+    A hashtag is in the graph when a tweet in the window has it along with
+    another hashtag, and an edge when a tweet in the window has both of its
+    hashtags, so counting the distinct hashtags and pairs of the tweets in the
+    window (see `SlidingHyperLogLog`) counts the nodes and edges; the average
+    degree is then 2 * edges / nodes (kept to at least 1, and at most
+    nodes - 1, like any graph's).  A hashtag's degree is at most the number of
+    other hashtags it was in the tweets of the window with, which is what
+    `degree_sketch` counts (a count-min can only over estimate it further).
+    The graph itself (and so `graph`) isn't kept at all.  Adding a tweet costs
+    two to three times what it does for a `TweetsGraph`, but the memory stays
+    at ~1.4MB (at the default settings) however many hashtags there are; the
+    exact graph stays the default everywhere."""
+
+
+    def __init__(self, time_window=60, max_lateness=None, precision=12, width=2048, depth=4):
+        self.time_window = time_window
+        if max_lateness is None or max_lateness > time_window:
+            max_lateness = time_window  # anything older would be expired right away
+        self.max_lateness = max_lateness
+        self.late_tweets_merged = 0
+        self.late_tweets_dropped = 0
+        self.newest_timestamp = None
+        self.node_sketch = SlidingHyperLogLog(time_window, precision)
+        self.edge_sketch = SlidingHyperLogLog(time_window, precision)
+        self.degree_sketch = SlidingCountMin(time_window, width, depth)
+        self.relative_error = self.node_sketch.relative_error
+        self.__avg_deg = None       # until the sketches change again
+
+
+    def update_graph(self, tweet):
+        '''Adds `tweet` (an instance of class Tweet, see `tweet_processor.py`)
+        to the estimates, or drops it if it's more than `max_lateness` late'''
+
+        timestamp = tweet.timestamp
+        newest_timestamp = self.newest_timestamp
+        if newest_timestamp is not None and timestamp < newest_timestamp:
+            if newest_timestamp - timestamp > self.max_lateness:
+                self.late_tweets_dropped += 1
+                return
+            self.late_tweets_merged += 1
+        elif newest_timestamp is None or timestamp > newest_timestamp:
+            self.newest_timestamp = timestamp
+            self.node_sketch.advance(timestamp)
+            self.edge_sketch.advance(timestamp)
+            self.degree_sketch.advance(timestamp)
+            self.__avg_deg = None
+
+        hashtags = tweet.hashtags
+        if len(hashtags) > 1:
+            hashes = [hash_hashtag(hashtag) for hashtag in hashtags]
+            self.node_sketch.update(hashes, timestamp)
+            self.edge_sketch.update([hash_edge(hashed, other_hashed)
+                                     for hashed, other_hashed in combinations(hashes, 2)], timestamp)
+            add = self.degree_sketch.add
+            for hashed in hashes:
+                add(hashed, timestamp, len(hashes) - 1)
+            self.__avg_deg = None
+
+
+    def estimated_node_count(self):
+        '''(float) estimated number of hashtags in the graph'''
+        return self.node_sketch.estimate()
+
+
+    def estimated_edge_count(self):
+        '''(float) estimated number of edges in the graph'''
+        return self.edge_sketch.estimate()
+
+
+    def degree_upper_bound(self, hashtag):
+        '''(int) that the degree of `hashtag` (lowercased, like a `Tweet`'s
+        hashtags) is no more than; 0 if it isn't in the graph'''
+        return self.degree_sketch.estimate(hash_hashtag(hashtag))
+
+
+    def get_graph_avg_degree_of_all_nodes(self, as_float=False):
+        '''Returns the estimated average degree of all nodes, as a (float) if
+        `as_float`, else a (str) rounded like `TweetsGraph` does (Default)'''
+
+        if self.__avg_deg is None:
+            node_count = self.node_sketch.estimate()
+            avg_deg = 0.0
+            if node_count:
+                avg_deg = 2 * self.edge_sketch.estimate() / node_count
+                avg_deg = min(max(avg_deg, 1.0), max(node_count - 1, 1.0))
+            self.__avg_deg = avg_deg
+        if as_float:
+            return self.__avg_deg
+        return format_avg_degree(self.__avg_deg)
+
+
+    @property
+    def memory_bytes(self):
+        '''(int) bytes taken by the sketches'''
+        return sum(sketch.memory_bytes for sketch in (self.node_sketch, self.edge_sketch, self.degree_sketch))
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+
+#----------------------------------------------------------------
+# Purpose:  asyncio front end (python 3.7+ only) that takes in newline delimited
+#           tweet json from any number of local connections at once and feeds
+#           it all into a single `TweetsGraph`, whose current average degree
+#           (and a few other stats) can be queried over another socket.
+#----------------------------------------------------------------
+
+import os
+import sys
+import json
+import signal
+import asyncio
+import logging
+import argparse
+from os import path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+
+from tweets_graph import TweetsGraph
+from tweets_graph import format_avg_degree
+from graph_analytics import AnalyticsTweetsGraph
+from tweet_processor import parse_tweet_chunk
+from tweet_processor import process_tweets
+from output_sinks import make_sink
+from output_sinks import NullSink
+from output_sinks import DEFAULT_FLUSH_BYTES
+from line_follower import split_lines
+
+
+READ_SIZE = 1 << 16
+ANALYTICS_QUERIES = ('top', 'degrees', 'components')
+STREAM_LIMIT = 1 << 20      # longest line (in bytes) that a connection buffers
+
+logger = logging.getLogger('tweet_processor.async_ingest')
+
+
+class IngestServer(object):
+    """Serves one `TweetsGraph` to several producers (eg. collectors each
+    streaming a part of the tweets) and to queries for its current state.
+        eg.
+            server = IngestServer(TweetsGraph(max_lateness=10))
+            await server.start(['/tmp/tweets.sock', '127.0.0.1:9000'], ['/tmp/query.sock'])
+            ...
+            await server.stop()
+
+
+    Attributes
+    ----------
+    tweet_graph: the TweetsGraph instance that all producers feed; it's only
+        ever updated by the server's one graph owner task
+
+    ft1, ft2: sinks (see `output_sinks.py`) for the cleaned texts and the
+        averages, same as `tweet_processor.py` writes (Default: NullSinks)
+
+    flush_interval: (float) if given, the sinks are flushed every this many
+        seconds, whether or not anything was written in between
+
+    stats: (dict) snapshot of the graph (the average degree as written out to
+        ft2, number of nodes/edges, tweets processed, ...); it's replaced after
+        every chunk, so reading it never has to wait on the graph
+
+    error: the exception a chunk failed to be applied with, which stopped the
+        server (None while it's running normally)
+
+
+    Notes
+    -----
+    Each producer connection is read a block at a time, and the complete lines
+    of a block are decoded together as one chunk (in a pool of `workers`
+    processes if more than 1, else in a single thread), so that the event loop
+    is free to answer queries in the meantime.  The decoded chunks go onto a
+    queue of at most `max_pending_chunks` that the graph owner task works
+    through in order; once it's full, the producers stop being read, which
+    (through the socket buffers) makes the producers wait in turn.  A chunk that
+    fails to be applied may have left part of its tweets in the graph and the
+    sinks, so that's fatal: it's logged, the server stops accepting and closes
+    every connection (see `wait_failed`), and nothing else gets applied.
+
+    The chunks of a single connection are applied in order, but chunks from
+    different connections are interleaved in whatever order they arrive, so
+    tweets may reach the graph slightly out of order; set the graph's
+    `max_lateness` with that in mind."""
+
+
+    def __init__(self, tweet_graph, ft1=None, ft2=None, workers=1, max_pending_chunks=64,
+                 flush_interval=None):
+        self.tweet_graph = tweet_graph
+        self.ft1 = ft1 if ft1 is not None else NullSink()
+        self.ft2 = ft2 if ft2 is not None else NullSink()
+        self.workers = workers
+        self.max_pending_chunks = max_pending_chunks
+        self.flush_interval = flush_interval
+        self.tweets_processed = 0
+        self.unicode_tweets_count = 0
+        self.error = None
+        self.__failed = None
+        self.__queue = None
+        self.__owner_task = None
+        self.__flush_task = None
+        self.__servers = []
+        self.__connections = {}     # writer -> the task handling that connection
+        self.__executor = None
+        self.stats = self.__current_stats()
+
+
+    async def start(self, listen_addresses, query_addresses=()):
+        '''Starts the graph owner task and listens for producers and queries.
+
+
+        Parameters
+        ----------
+        listen_addresses:  (list) of addresses (a unix socket path or 'HOST:PORT'
+            for tcp) to accept tweets on
+        query_addresses:   (list) of addresses to answer queries on; each line sent
+            is a query: 'avg' (the average degree) or 'stats' (json of `stats`);
+            with an `AnalyticsTweetsGraph`, also 'top [K]' (the K hashtags with the
+            highest degree), 'degrees' (the degree histogram) or 'components'
+            (the sizes of the connected components)
+        '''
+
+        self.__queue = asyncio.Queue(self.max_pending_chunks)
+        self.__failed = asyncio.Event()
+        self.__owner_task = asyncio.ensure_future(self.__own_graph())
+        if self.flush_interval is not None:
+            self.__flush_task = asyncio.ensure_future(self.__flush_periodically())
+        if self.workers > 1:
+            self.__executor = ProcessPoolExecutor(self.workers)
+        else:
+            self.__executor = ThreadPoolExecutor(1)
+        for address in listen_addresses:
+            self.__servers.append(await _start_server(self.__handle_producer, address))
+        for address in query_addresses:
+            self.__servers.append(await _start_server(self.__handle_queries, address))
+
+
+    async def stop(self):
+        '''Stops accepting connections, closes the ones that are still open,
+        finishes the chunks that are already queued up, and closes the sinks.'''
+
+        self.__close_connections()
+        await asyncio.gather(*self.__connections.values(), return_exceptions=True)
+        for server in self.__servers:
+            await server.wait_closed()
+        self.__servers = []
+        await self.__queue.put(None)
+        await self.__owner_task
+        if self.__flush_task is not None:
+            self.__flush_task.cancel()
+            await asyncio.gather(self.__flush_task, return_exceptions=True)
+            self.__flush_task = None
+        self.__executor.shutdown()
+        self.ft1.write('\n{} tweets contained unicode.'.format(self.unicode_tweets_count))
+        self.ft1.close()
+        self.ft2.close()
+
+
+    async def wait_failed(self):
+        '''Waits until a chunk fails to be applied to the graph, after which the
+        server no longer takes in tweets (see `error`); it should then be `stop`ped.'''
+
+        await self.__failed.wait()
+
+
+    def __close_connections(self):
+        '''Stops accepting connections and closes the ones that are open'''
+
+        for server in self.__servers:
+            server.close()
+        # the connections are closed first, as (depending on the python version)
+        # `wait_closed` also waits on them
+        for writer in list(self.__connections):
+            writer.close()
+
+
+    async def __own_graph(self):
+        '''The only place the graph is updated: applies each queued chunk in turn'''
+
+        while True:
+            parsed_chunk = await self.__queue.get()
+            if parsed_chunk is None:
+                break
+            if self.error is not None:
+                # the producers may still be waiting to queue a chunk, so the
+                # queue is emptied (without applying anything) until they're gone
+                continue
+            try:
+                self.unicode_tweets_count += process_tweets(parsed_chunk, self.tweet_graph, self.ft1, self.ft2)
+            except Exception as e:
+                # part of the chunk may already be in the graph and the sinks,
+                # and can't be taken back out
+                logger.exception('could not apply a chunk of %d tweets to the graph, stopping',
+                                 len(parsed_chunk))
+                self.error = e
+                self.__close_connections()
+                self.__failed.set()
+            else:
+                self.tweets_processed += len(parsed_chunk) - parsed_chunk.count(None)
+            self.stats = self.__current_stats()
+
+
+    async def __flush_periodically(self):
+        '''Writes out the sinks' buffers every `flush_interval`, as the sinks
+        themselves only check it when something is written'''
+
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.ft1.flush()
+            self.ft2.flush()
+
+
+    def __current_stats(self):
+        edge_store = self.tweet_graph.edge_store
+        return {'avg_degree': format_avg_degree(edge_store.avg_degree()),
+                'nodes': edge_store.node_count,
+                'edges': edge_store.edge_count,
+                'tweets_processed': self.tweets_processed,
+                'failed': self.error is not None,
+                'late_tweets_merged': self.tweet_graph.late_tweets_merged,
+                'late_tweets_dropped': self.tweet_graph.late_tweets_dropped,
+                'pending_chunks': self.__queue.qsize() if self.__queue is not None else 0}
+
+
+    async def __parse(self, lines):
+        return await asyncio.get_event_loop().run_in_executor(self.__executor, parse_tweet_chunk, lines)
+
+
+    def __track(self, writer):
+        '''Keeps track of an open connection, so `stop` can close it'''
+
+        self.__connections[writer] = asyncio.current_task()
+
+
+    async def __handle_producer(self, reader, writer):
+        self.__track(writer)
+        partial_line = b''
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                lines, partial_line = split_lines(data, partial_line)
+                if lines:
+                    await self.__submit(lines)
+            if partial_line:
+                await self.__submit([partial_line])
+        finally:
+            del self.__connections[writer]
+            writer.close()
+
+
+    async def __submit(self, lines):
+        # the lines stay bytes; they're decoded as they're parsed, where a line
+        # that isn't utf-8 is simply not a usable tweet (see `tweet_extractor.py`)
+        await self.__queue.put(await self.__parse(lines))
+
+
+    def __answer_analytics(self, query):
+        '''Answers 'top [K]', 'degrees' or 'components' (as json) straight from
+        the graph, if it keeps them (see `graph_analytics.py`)'''
+
+        tweet_graph = self.tweet_graph
+        if not hasattr(tweet_graph, 'top_hashtags'):
+            return 'not kept by this graph: {!r} (start the server with --analytics)'.format(query)
+        query = query.split(' ')
+        if query[0] == 'top':
+            k = int(query[1]) if len(query) > 1 and query[1].isdigit() else 10
+            return json.dumps(tweet_graph.top_hashtags(k))
+        if query[0] == 'degrees':
+            return json.dumps(sorted(tweet_graph.degree_histogram().items()))
+        return json.dumps(tweet_graph.connected_components())
+
+
+    async def __handle_queries(self, reader, writer):
+        self.__track(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                query = line.strip().decode('ascii', 'replace')
+                if query == 'avg':
+                    reply = self.stats['avg_degree']
+                elif query == 'stats':
+                    reply = json.dumps(self.stats, sort_keys=True)
+                elif query.split(' ')[0] in ANALYTICS_QUERIES:
+                    reply = self.__answer_analytics(query)
+                else:
+                    reply = 'unknown query: {!r} (try avg or stats)'.format(query)
+                writer.write((reply + '\n').encode('ascii'))
+                await writer.drain()
+        finally:
+            del self.__connections[writer]
+            writer.close()
+
+
+
+async def _start_server(client_connected, address):
+    '''Listens on `address`: a unix socket path or 'HOST:PORT' for tcp'''
+
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        return await asyncio.start_server(client_connected, host, int(port), limit=STREAM_LIMIT)
+    if path.exists(address):
+        os.unlink(address)
+    return await asyncio.start_unix_server(client_connected, address, limit=STREAM_LIMIT)
+
+
+async def open_connection(address):
+    '''Client side of `_start_server`: returns the (reader, writer) streams'''
+
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        return await asyncio.open_connection(host, int(port))
+    return await asyncio.open_unix_connection(address)
+
+
+async def send_tweets(address, blocks, interval=None):
+    '''Sends each (bytes) block of newline delimited tweets in `blocks` to the
+    server at `address` (over a single connection), then closes it; with an
+    `interval` (secs), it waits that long after each block.'''
+
+    _, writer = await open_connection(address)
+    for block in blocks:
+        writer.write(block)
+        await writer.drain()     # waits whenever the server applies back-pressure
+        if interval:
+            await asyncio.sleep(interval)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def query(address, queries):
+    '''Sends each of `queries` (eg. 'avg') to the server's query `address`
+    and returns the (list) of (str) replies.'''
+
+    reader, writer = await open_connection(address)
+    replies = []
+    for q in queries:
+        writer.write(q.encode('ascii') + b'\n')
+        replies.append((await reader.readline()).decode('ascii').rstrip('\n'))
+    writer.close()
+    await writer.wait_closed()
+    return replies
+
+
+def parse_args(argv):
+    '''Parses the command line options for running this script directly'''
+
+    parser = argparse.ArgumentParser(description='Builds one rolling hashtag graph from tweets '
+                                                 'streamed in over local connections.')
+    parser.add_argument('--listen', action='append', required=True, metavar='ADDRESS',
+                        help='unix socket path or HOST:PORT to accept tweets on (can be repeated)')
+    parser.add_argument('--query', action='append', default=[], metavar='ADDRESS',
+                        help="unix socket path or HOST:PORT to answer queries on; send a line with "
+                             "'avg' or 'stats' (or with --analytics, 'top [K]', 'degrees' or "
+                             "'components') (can be repeated)")
+    parser.add_argument('--analytics', action='store_true',
+                        help='also keep the top hashtags, degree histogram and connected components '
+                             'up to date for querying (makes the graph upkeep somewhat slower)')
+    parser.add_argument('--max-lateness', type=int, default=None, metavar='SECS',
+                        help='how far behind the newest tweet (in seconds) an out of order '
+                             'tweet may be and still be added to the graph (default: the time window)')
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help='number of processes used to decode and clean the tweets; with 1, '
+                             'a thread is used (default: 1)')
+    parser.add_argument('--max-pending-chunks', type=int, default=64, metavar='N',
+                        help='decoded chunks that may wait for the graph before the producers '
+                             'are made to wait (default: 64)')
+    parser.add_argument('--ft1-sink', choices=['file', 'stdout', 'null'], default='null',
+                        help='where the cleaned tweet texts go (default: null)')
+    parser.add_argument('--ft2-sink', choices=['file', 'binary', 'stdout', 'null'], default='null',
+                        help='where the average degrees go (default: null)')
+    parser.add_argument('--flush-interval', type=float, default=1.0, metavar='SECS',
+                        help='write out the buffered output at least every SECS seconds (default: 1)')
+    return parser.parse_args(argv)
+
+
+async def main(args):
+    '''Runs the server until it gets a SIGINT or SIGTERM (or a chunk of tweets
+    fails to be applied to the graph); returns the exit status'''
+
+    tweet_output_path = path.abspath('tweet_output')
+    if 'file' in (args.ft1_sink, args.ft2_sink) or args.ft2_sink == 'binary':
+        if not path.isdir(tweet_output_path):
+            os.makedirs(tweet_output_path)
+    ft1 = make_sink(args.ft1_sink, path.join(tweet_output_path, 'ft1.txt'),
+                    DEFAULT_FLUSH_BYTES, args.flush_interval)
+    ft2 = make_sink(args.ft2_sink, path.join(tweet_output_path,
+                                             'ft2.bin' if args.ft2_sink == 'binary' else 'ft2.txt'),
+                    DEFAULT_FLUSH_BYTES, args.flush_interval, averages=True)
+
+    graph_class = AnalyticsTweetsGraph if args.analytics else TweetsGraph
+    server = IngestServer(graph_class(time_window=60, max_lateness=args.max_lateness), ft1, ft2,
+                          workers=args.workers, max_pending_chunks=args.max_pending_chunks,
+                          flush_interval=args.flush_interval)
+    await server.start(args.listen, args.query)
+    sys.stderr.write('listening for tweets on {} (queries on {})\n'.format(
+        ', '.join(args.listen), ', '.join(args.query) or 'nothing'))
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    failed = asyncio.ensure_future(server.wait_failed())
+    failed.add_done_callback(lambda _: stopping.set())
+    await stopping.wait()
+    failed.cancel()
+    await server.stop()
+    return 1 if server.error is not None else 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main(parse_args(sys.argv[1:]))))
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  Saves (and restores) a snapshot of a `TweetsGraph`, along with
+#           where `tweet_processor.py` was in its input and outputs, so that
+#           a restart can pick up right where it left off instead of having
+#           to replay the input to rebuild the window.
+#----------------------------------------------------------------
+
+import os
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(checkpoint_path, tweet_graph, **processor_state):
+    '''Writes `tweet_graph` (its window buckets, adjacency, interned hashtags
+    and counters) and any extra `processor_state` to `checkpoint_path`.
+
+    The snapshot is written to a temporary file that is then renamed over
+    `checkpoint_path`, so a crash part way through never leaves a broken
+    checkpoint behind.
+
+
+    Parameters
+    ----------
+    checkpoint_path:  (str) path of the checkpoint file
+    tweet_graph:      the TweetsGraph instance to save
+    processor_state:  keyword args of plain values (eg. the input byte offset)
+    '''
+
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'wb') as checkpoint_file:
+        pickle.dump({'version': CHECKPOINT_VERSION,
+                     'tweet_graph': tweet_graph,
+                     'processor_state': processor_state},
+                    checkpoint_file, pickle.HIGHEST_PROTOCOL)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.rename(tmp_path, checkpoint_path)
+
+
+def load_checkpoint(checkpoint_path):
+    '''Reads back a checkpoint written by `save_checkpoint`.
+
+
+    Returns
+    -------
+    (tuple) of the restored TweetsGraph and the (dict) of processor state
+    '''
+
+    with open(checkpoint_path, 'rb') as checkpoint_file:
+        checkpoint = pickle.load(checkpoint_file)
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        raise ValueError('unsupported checkpoint version: {}'.format(checkpoint.get('version')))
+    return checkpoint['tweet_graph'], checkpoint['processor_state']
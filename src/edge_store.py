@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  `EdgeStore` holds the hashtag graph's adjacency with a
+#           reference count per edge, so that an edge shared by several
+#           tweets in the window only disappears once the last of those
+#           tweets has expired.
+#----------------------------------------------------------------
+
+from itertools import permutations
+
+from symbol_table import SymbolTable
+
+
+class EdgeStore(object):
+    """Reference-counted adjacency store keyed on interned hashtag ids.
+
+    Every tweet that is added bumps the count of each of its hashtag pairs,
+    and every tweet that expires decrements them again; an edge (and a node
+    without any edges left) is only dropped once its count reaches zero.
+    Adding or removing a tweet therefore costs time proportional to its own
+    number of hashtag pairs, no matter how many other tweets share them.
+
+
+    Attributes
+    ----------
+    symbols: (SymbolTable) mapping of hashtags to the ids used in here; a
+        hashtag's id is released as soon as its node leaves the graph
+
+    adjacency: (dict) where each key is a hashtag id and each value is a
+        (dict) of neighboring hashtag id -> number of tweets in the window
+        containing that pair
+
+    node_count: (int) number of nodes currently in the graph
+
+    degree_sum: (int) sum of the degrees of all nodes (ie. twice the number
+        of edges); kept up to date as edges are added and removed
+
+
+    Notes
+    -----
+    Both halves of an edge (id1 -> id2 and id2 -> id1) are stored with the
+    same count, so the degree of a node is just `len(adjacency[node_id])`."""
+
+
+    def __init__(self):
+        self.symbols = SymbolTable()
+        self.adjacency = {}
+        self.node_count = 0
+        self.degree_sum = 0
+
+
+    def intern(self, hashtag):
+        '''Returns the (int) id for `hashtag`, assigning a new one if needed;
+        the tweet with `hashtag` has to be added with `add_tweet_edges` right
+        after, as ids are only released again when a node leaves the graph.'''
+
+        return self.symbols.intern(hashtag)
+
+
+    def name_of(self, hashtag_id):
+        '''Returns the hashtag (str) that is interned as `hashtag_id`.'''
+
+        return self.symbols.name_of(hashtag_id)
+
+
+    def add_tweet_edges(self, hashtag_ids):
+        '''Adds one reference to every pair of the tweet's hashtags.
+
+
+        Parameters
+        ----------
+        hashtag_ids:  (sequence) of unique hashtag ids for a single tweet
+        '''
+
+        adjacency = self.adjacency
+        new_nodes = new_halves = 0
+        for id1, id2 in permutations(hashtag_ids, 2):
+            neighbors = adjacency.get(id1)
+            if neighbors is None:
+                adjacency[id1] = {id2: 1}
+                new_nodes += 1
+                new_halves += 1
+            else:
+                refs = neighbors.get(id2, 0)
+                if not refs:
+                    new_halves += 1
+                neighbors[id2] = refs + 1
+        self.node_count += new_nodes
+        self.degree_sum += new_halves
+
+
+    def remove_tweet_edges(self, hashtag_ids):
+        '''Drops one reference from every pair of the tweet's hashtags; edges
+        whose count reaches zero (and nodes left without neighbors, along with
+        their interned ids) are removed.
+
+
+        Parameters
+        ----------
+        hashtag_ids:  (sequence) of hashtag ids previously passed to `add_tweet_edges`
+        '''
+
+        adjacency = self.adjacency
+        gone_nodes = gone_halves = 0
+        for id1, id2 in permutations(hashtag_ids, 2):
+            neighbors = adjacency[id1]
+            refs = neighbors[id2] - 1
+            if refs:
+                neighbors[id2] = refs
+            else:
+                del neighbors[id2]
+                gone_halves += 1
+                if not neighbors:
+                    del adjacency[id1]
+                    self.symbols.release(id1)
+                    gone_nodes += 1
+        self.node_count -= gone_nodes
+        self.degree_sum -= gone_halves
+
+
+    @property
+    def edge_count(self):
+        '''(int) number of (undirected) edges currently in the graph'''
+        return self.degree_sum // 2
+
+
+    def avg_degree(self):
+        '''Returns the average degree of all nodes as a (float), in O(1)'''
+
+        if self.node_count:
+            return self.degree_sum / float(self.node_count)
+        return 0.0
+
+
+    def as_adjacency_sets(self):
+        '''Returns the graph as a (dict) of hashtag (str) -> (set) of neighboring
+        hashtags; builds a new dict each call, so meant for inspection only.'''
+
+        name_of = self.symbols.name_of
+        return dict((name_of(node_id), set(name_of(nbr_id) for nbr_id in neighbors))
+                    for node_id, neighbors in self.adjacency.items())
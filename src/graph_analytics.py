@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  `AnalyticsTweetsGraph` is a `TweetsGraph` that also keeps the
+#           top hashtags by degree, the degree histogram, and the connected
+#           components of the window up to date as edges come and go, so
+#           they can be queried without going over the whole graph.
+#----------------------------------------------------------------
+
+from heapq import nsmallest
+from bisect import bisect_left, insort
+
+from edge_store import EdgeStore
+from tweets_graph import TweetsGraph
+
+
+class DegreeIndex(object):
+    """The nodes of the graph grouped by their degree.
+        eg.
+            degrees = DegreeIndex()
+            degrees.move(node_id, 0, 2)     # node_id went from no neighbors to 2
+            degrees.histogram()             # -> {2: 1}
+            list(degrees.highest())         # -> [(2, set([node_id]))]
+
+
+    Attributes
+    ----------
+    buckets: (dict) of degree (int) -> (set) of the node ids with that degree;
+        only degrees that some node has are in it (and never 0)
+
+    sorted_degrees: (list) of the degrees in `buckets`, in increasing order
+
+    max_degree: (int) highest degree of any node (0 when the graph is empty)
+
+
+    Notes
+    -----
+    A node's degree only changes by the few edges of one tweet at a time, so
+    moving it between buckets is O(1); only when a bucket is made or emptied is
+    its degree put into or taken out of `sorted_degrees`, found by a binary
+    search.  So neither a move nor `highest` steps through the degrees that no
+    node has, however far apart the degrees are."""
+
+
+    def __init__(self):
+        self.buckets = {}
+        self.sorted_degrees = []
+
+
+    @property
+    def max_degree(self):
+        sorted_degrees = self.sorted_degrees
+        return sorted_degrees[-1] if sorted_degrees else 0
+
+
+    def move(self, node_id, old_degree, new_degree):
+        '''Moves `node_id` from the bucket for `old_degree` to `new_degree`
+        (where 0 means it isn't (or is no longer) in the graph)'''
+
+        buckets = self.buckets
+        if old_degree:
+            bucket = buckets[old_degree]
+            bucket.discard(node_id)
+            if not bucket:
+                del buckets[old_degree]
+                sorted_degrees = self.sorted_degrees
+                del sorted_degrees[bisect_left(sorted_degrees, old_degree)]
+        if new_degree:
+            bucket = buckets.get(new_degree)
+            if bucket is None:
+                bucket = buckets[new_degree] = set()
+                insort(self.sorted_degrees, new_degree)
+            bucket.add(node_id)
+
+
+    def highest(self):
+        '''Yields (degree, (set) of node ids) for each degree, highest first;
+        stop early to only look at the buckets that are needed (eg. for a top k)'''
+
+        buckets = self.buckets
+        for degree in reversed(self.sorted_degrees):
+            yield degree, buckets[degree]
+
+
+    def histogram(self):
+        '''(dict) of degree -> number of nodes with that degree'''
+        return dict((degree, len(bucket)) for degree, bucket in self.buckets.items())
+
+
+
+class ComponentTracker(object):
+    """Connected components of the graph: a union-find that is kept up to date
+    as edges are added, and rebuilt (lazily) after edges are removed.
+
+
+    Attributes
+    ----------
+    rebuild_interval: (int) secs (of tweet time) that a result may be behind the
+        edges that have been removed since; 0 rebuilds on every query that
+        follows a removal (Default: 1)
+
+    rebuilds: (int) number of times the components were worked out from scratch
+
+
+    Notes
+    -----
+    A union-find can only join components, so it's exact for as long as edges
+    are only added.  Once an edge is removed (which could split a component) it
+    gets dropped, and the next query that is at least `rebuild_interval` secs
+    past the last rebuild works the components out again from the adjacency, in
+    O(nodes + edges).  Queries in between get the result of the last rebuild.
+    So under a steady stream there is at most one rebuild per second of tweets,
+    however often the components are asked for."""
+
+
+    def __init__(self, rebuild_interval=1):
+        self.rebuild_interval = rebuild_interval
+        self.rebuilds = 0
+        self.__parents = {}
+        self.__sizes = {}            # root id -> number of nodes in its component
+        self.__stale = False
+        self.__last_rebuild = None   # timestamp
+        self.__last_sizes = []
+
+
+    def __find(self, node_id):
+        parents = self.__parents
+        parent = parents.get(node_id)
+        if parent is None:
+            parents[node_id] = node_id
+            self.__sizes[node_id] = 1
+            return node_id
+        while parent != node_id:
+            grandparent = parents[parent]
+            parents[node_id] = grandparent
+            node_id, parent = parent, grandparent
+        return node_id
+
+
+    def join(self, node_ids):
+        '''Puts all of `node_ids` (eg. a tweet's hashtags) into one component'''
+
+        if self.__stale:
+            return
+        find = self.__find
+        sizes = self.__sizes
+        parents = self.__parents
+        root = find(node_ids[0])
+        for node_id in node_ids[1:]:
+            other_root = find(node_id)
+            if other_root == root:
+                continue
+            if sizes[other_root] > sizes[root]:
+                root, other_root = other_root, root
+            parents[other_root] = root
+            sizes[root] += sizes.pop(other_root)
+
+
+    def invalidate(self):
+        '''Notes that an edge was removed (so a component may have split)'''
+
+        if not self.__stale:
+            self.__stale = True
+            self.__parents = {}
+            self.__sizes = {}
+
+
+    def sizes(self, adjacency, timestamp):
+        '''Returns the (list) of the sizes (int) of the components, largest first.
+
+
+        Parameters
+        ----------
+        adjacency:  (dict) of node id -> neighbors, to rebuild from if needed
+        timestamp:  (int) current (tweet) time, for `rebuild_interval`
+        '''
+
+        if not self.__stale:
+            return sorted(self.__sizes.values(), reverse=True)
+        if (self.__last_rebuild is None or timestamp is None or
+                timestamp - self.__last_rebuild >= self.rebuild_interval):
+            self.__rebuild(adjacency)
+            self.__last_rebuild = timestamp
+            self.__last_sizes = sorted(self.__sizes.values(), reverse=True)
+        return self.__last_sizes
+
+
+    def __rebuild(self, adjacency):
+        self.__parents = {}
+        self.__sizes = {}
+        self.__stale = False
+        self.rebuilds += 1
+        for node_id, neighbors in adjacency.items():
+            self.join([node_id] + [nbr_id for nbr_id in neighbors if nbr_id > node_id])
+
+
+
+class AnalyticsEdgeStore(EdgeStore):
+    """`EdgeStore` that also keeps a `DegreeIndex` (`degrees`) and a
+    `ComponentTracker` (`components`) up to date with its edges."""
+
+
+    def __init__(self, rebuild_interval=1):
+        super(AnalyticsEdgeStore, self).__init__()
+        self.degrees = DegreeIndex()
+        self.components = ComponentTracker(rebuild_interval)
+
+
+    def add_tweet_edges(self, hashtag_ids):
+        adjacency = self.adjacency
+        old_degrees = [len(adjacency.get(hashtag_id, ())) for hashtag_id in hashtag_ids]
+        EdgeStore.add_tweet_edges(self, hashtag_ids)
+        move = self.degrees.move
+        for hashtag_id, old_degree in zip(hashtag_ids, old_degrees):
+            new_degree = len(adjacency[hashtag_id])
+            if new_degree != old_degree:
+                move(hashtag_id, old_degree, new_degree)
+        self.components.join(hashtag_ids)
+
+
+    def remove_tweet_edges(self, hashtag_ids):
+        adjacency = self.adjacency
+        old_degrees = [len(adjacency[hashtag_id]) for hashtag_id in hashtag_ids]
+        degree_sum = self.degree_sum
+        EdgeStore.remove_tweet_edges(self, hashtag_ids)
+        if self.degree_sum == degree_sum:
+            return      # every edge is still held by another tweet
+        move = self.degrees.move
+        for hashtag_id, old_degree in zip(hashtag_ids, old_degrees):
+            new_degree = len(adjacency.get(hashtag_id, ()))
+            if new_degree != old_degree:
+                move(hashtag_id, old_degree, new_degree)
+        self.components.invalidate()
+
+
+
+class AnalyticsTweetsGraph(TweetsGraph):
+    """`TweetsGraph` that can also answer, without going over the whole graph:
+        eg.
+            tweet_graph = AnalyticsTweetsGraph()
+            tweet_graph.update_graph(tweet)
+            tweet_graph.top_hashtags(10)       # -> [('#spark', 5), ('#hadoop', 3), ...]
+            tweet_graph.degree_histogram()     # -> {1: 40, 2: 7, 5: 1}
+            tweet_graph.connected_components() # -> [12, 3, 2, 2]
+
+
+    Methods
+    -------
+    top_hashtags: the `k` hashtags with the highest degree
+
+    degree_histogram: how many hashtags have each degree
+
+    connected_components: the sizes of the connected components
+
+
+    Attributes
+    ----------
+    rebuild_interval: (int) secs of tweet time the components may lag behind
+        the removal of edges (see `ComponentTracker`) (Default: 1)
+
+    (and the same as for a `TweetsGraph`)
+
+
+    Notes
+    -----
+    The degree index and the components are updated along with the edges
+    themselves (see `AnalyticsEdgeStore`), which makes adding and removing a
+    tweet somewhat slower than for a plain `TweetsGraph`; the average degrees
+    are exactly the same."""
+
+
+    def __init__(self, time_window=60, max_lateness=None, rebuild_interval=1):
+        super(AnalyticsTweetsGraph, self).__init__(time_window, max_lateness,
+                                                   edge_store=AnalyticsEdgeStore(rebuild_interval))
+        self.rebuild_interval = rebuild_interval
+
+
+    def top_hashtags(self, k=10):
+        '''Returns a (list) of up to `k` (hashtag, degree), highest degree first
+        (and then by hashtag)'''
+
+        name_of = self.edge_store.name_of
+        top = []
+        for degree, node_ids in self.edge_store.degrees.highest():
+            if len(top) >= k:
+                break
+            hashtags = [name_of(node_id) for node_id in node_ids]
+            wanted = k - len(top)
+            hashtags = sorted(hashtags) if len(hashtags) <= wanted else nsmallest(wanted, hashtags)
+            top.extend((hashtag, degree) for hashtag in hashtags)
+        return top
+
+
+    def degree_histogram(self):
+        '''(dict) of degree (int) -> number of hashtags with that degree'''
+        return self.edge_store.degrees.histogram()
+
+
+    def connected_components(self):
+        '''Returns the (list) of the number of hashtags in each connected
+        component, largest first (its length is the number of components)'''
+
+        edge_store = self.edge_store
+        return edge_store.components.sizes(edge_store.adjacency, self.newest_timestamp)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  Reading the tweet files: gzip, bz2 and zstd (if the `zstandard`
+#           package is installed) compressed files are decompressed on the
+#           fly in large blocks, uncompressed ones are read line by line
+#           straight out of a memory map (and can be handed out to worker
+#           processes as byte ranges of it), and a sparse index of line
+#           offsets by time lets a replay start at a given time.
+#----------------------------------------------------------------
+
+import os
+import re
+import bz2
+import json
+import mmap
+import zlib
+from bisect import bisect_left
+try:
+    from cStringIO import StringIO as BlockIO
+except ImportError:     # python 3
+    from io import BytesIO as BlockIO
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from timestamp_parser import parse_created_at
+
+
+BLOCK_SIZE = 1 << 22            # bytes of decompressed input split into lines at a time
+COMPRESSED_READ_SIZE = 1 << 20
+INDEX_GRANULARITY = 60          # secs of tweets between entries of a line index
+
+_MAGIC_NUMBERS = [(b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\x28\xb5\x2f\xfd', 'zstd')]
+
+
+def compression_of(file_path):
+    '''Returns 'gzip', 'bz2' or 'zstd' if the file at `file_path` is compressed
+    that way (going by its first bytes, not its name), or None'''
+
+    with open(file_path, 'rb') as input_file:
+        head = input_file.read(4)
+    for magic, compression in _MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def _decompressed_blocks(input_file, compression):
+    '''Yields the decompressed data of the (binary) `input_file` a block at a time'''
+
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("reading zstd compressed input needs the `zstandard` package "
+                              "(pip install zstandard)")
+        reader = zstandard.ZstdDecompressor().stream_reader(input_file, read_across_frames=True)
+        while True:
+            block = reader.read(BLOCK_SIZE)
+            if not block:
+                return
+            yield block
+
+    if compression == 'gzip':
+        new_decompressor = lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)
+    else:
+        new_decompressor = bz2.BZ2Decompressor
+    decompressor = new_decompressor()
+    while True:
+        data = input_file.read(COMPRESSED_READ_SIZE)
+        if not data:
+            return
+        while data:
+            block = decompressor.decompress(data)
+            if block:
+                yield block
+            # a file can be several compressed streams one after the other (eg. `cat a.gz b.gz`)
+            data = decompressor.unused_data
+            if data:
+                decompressor = new_decompressor()
+
+
+def iter_decompressed_lines(file_path, offset=0, compression=None):
+    '''Yields the lines (bytes) of the compressed file at `file_path`, starting
+    `offset` bytes into the decompressed data.
+
+
+    Notes
+    -----
+    The data is decompressed in large blocks and each block is split into lines
+    in one go (only on '\\n'), rather than reading a line at a time.  Starting
+    part way in still has to decompress everything before `offset` (but not
+    parse it).'''
+
+    compression = compression or compression_of(file_path)
+    partial_line = b''
+    to_skip = offset
+    with open(file_path, 'rb') as input_file:
+        for block in _decompressed_blocks(input_file, compression):
+            if to_skip:
+                if to_skip >= len(block):
+                    to_skip -= len(block)
+                    continue
+                block = block[to_skip:]
+                to_skip = 0
+            lines = list(BlockIO(partial_line + block))
+            partial_line = lines.pop() if not lines[-1].endswith(b'\n') else b''
+            for line in lines:
+                yield line
+    if partial_line:
+        yield partial_line
+
+
+def open_lines(file_path, offset=0):
+    '''Returns an iterable of the lines of the file at `file_path` (compressed
+    or not), starting at byte `offset` (of the decompressed data).
+
+    The lines are bytes (ie. a (str) under python 2), each ending in '\\n'
+    (except maybe the last); they're decoded as they're parsed (see
+    `tweet_extractor.py`), so reading them doesn't depend on the locale, and
+    their lengths are the byte offsets that a checkpoint needs.'''
+
+    compression = compression_of(file_path)
+    if compression is not None:
+        return iter_decompressed_lines(file_path, offset, compression)
+    return _iter_plain_lines(file_path, offset)
+
+
+def _iter_plain_lines(file_path, offset):
+    with open(file_path, 'rb') as input_file:
+        if os.fstat(input_file.fileno()).st_size <= offset:
+            return
+        file_map = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        for line in _iter_mapped_lines(file_map, offset, len(file_map)):
+            yield line
+    finally:
+        file_map.close()
+
+
+def _iter_mapped_lines(file_map, start, end):
+    '''Yields the lines in bytes [start, end) of `file_map` (a memory map), each
+    sliced right out of the map (so only the line itself is ever copied)'''
+
+    find = file_map.find
+    while start < end:
+        line_end = find(b'\n', start, end) + 1
+        if not line_end:
+            line_end = end
+        yield file_map[start:line_end]
+        start = line_end
+
+
+
+def iter_line_ranges(file_path, offset=0, lines_per_range=1000):
+    '''Yields (start, end) byte ranges of the (uncompressed) file at `file_path`,
+    from `offset` on, each holding whole lines, about `lines_per_range` of them
+    (going by the average length of the lines at the start); see `read_line_range`.
+
+
+    Notes
+    -----
+    Only the newline at the end of each range is looked for (in a memory map of
+    the file), so the lines themselves are never even read here; a worker process
+    given a range reads its lines straight from its own map of the file.'''
+
+    with open(file_path, 'rb') as input_file:
+        if os.fstat(input_file.fileno()).st_size <= offset:
+            return
+        file_map = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        size = len(file_map)
+        sample = file_map[offset:offset + (1 << 16)]
+        range_size = max(1, lines_per_range * len(sample) // max(1, sample.count(b'\n')))
+        start = offset
+        while start < size:
+            end = file_map.find(b'\n', min(size, start + range_size) - 1) + 1
+            if not end:
+                end = size
+            yield start, end
+            start = end
+    finally:
+        file_map.close()
+
+
+_file_maps = {}     # file path -> (size, mtime, mmap), kept open by each worker process
+
+
+def read_line_range(file_path, start, end):
+    '''Returns the (list) of lines in bytes [start, end) of the file at `file_path`
+    (eg. a range from `iter_line_ranges`), read from a memory map of the file;
+    the map is kept for the next range, for as long as the file's size and
+    modification time stay the same (so a file that is replaced or truncated
+    in the meantime gets mapped again)'''
+
+    stat = os.stat(file_path)
+    mapped = _file_maps.get(file_path)
+    if mapped is None or mapped[:2] != (stat.st_size, stat.st_mtime):
+        if mapped is not None:
+            mapped[2].close()
+        _file_maps.pop(file_path, None)
+        with open(file_path, 'rb') as input_file:
+            stat = os.fstat(input_file.fileno())
+            if not stat.st_size:
+                return []   # (an empty file can't be mapped)
+            mapped = _file_maps[file_path] = (stat.st_size, stat.st_mtime,
+                                              mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ))
+    file_map = mapped[2]
+    return list(_iter_mapped_lines(file_map, start, min(end, len(file_map))))
+
+
+
+_TIMESTAMP_MS = re.compile(br'"timestamp_ms"\s*:\s*"?(\d+)')
+_CREATED_AT = re.compile(br'"created_at"\s*:\s*"([^"]+)"')
+
+
+def _line_timestamp(line):
+    '''(int) timestamp of a line of api output, or None; only as exact as an
+    index needs (eg. a retweet without `timestamp_ms` could give the time of the
+    retweeted tweet)'''
+
+    match = _TIMESTAMP_MS.search(line)
+    if match is not None:
+        return int(match.group(1)) // 1000
+    match = _CREATED_AT.search(line)
+    if match is not None:
+        try:
+            return parse_created_at(match.group(1).decode('ascii'))
+        except (ValueError, UnicodeDecodeError):
+            pass
+    return None
+
+
+def build_line_index(file_path, granularity=INDEX_GRANULARITY):
+    '''Goes over the file at `file_path` (compressed or not) once and returns its
+    line index: a (dict) with the size and modification time of the file it is
+    for, and its `entries`, a (list) of [watermark, offset] pairs.
+
+    There is an entry for the first line of each `granularity` secs of tweets,
+    ie. wherever the newest timestamp so far moves into the next `granularity`
+    secs; its offset is where that line starts (in the decompressed data) and its
+    watermark the newest timestamp of all of the lines before it.  As tweets can
+    be out of order, the watermark (rather than the line's own timestamp) is what
+    says that everything before the offset is older.'''
+
+    entries = [[0, 0]]
+    watermark = None
+    offset = 0
+    compression = compression_of(file_path)
+    if compression is None:
+        with open(file_path, 'rb') as input_file:
+            for line in input_file:
+                watermark = _index_line(line, offset, watermark, granularity, entries)
+                offset += len(line)
+    else:
+        with open(file_path, 'rb') as input_file:
+            partial_line = b''
+            for block in _decompressed_blocks(input_file, compression):
+                lines = list(BlockIO(partial_line + block))
+                partial_line = lines.pop() if not lines[-1].endswith(b'\n') else b''
+                for line in lines:
+                    watermark = _index_line(line, offset, watermark, granularity, entries)
+                    offset += len(line)
+    stat = os.stat(file_path)
+    return {'input_size': stat.st_size, 'input_mtime': stat.st_mtime,
+            'granularity': granularity, 'entries': entries}
+
+
+def _index_line(line, offset, watermark, granularity, entries):
+    timestamp = _line_timestamp(line)
+    if timestamp is None:
+        return watermark
+    if watermark is None or timestamp > watermark:
+        if watermark is not None and timestamp // granularity > watermark // granularity:
+            entries.append([watermark, offset])
+        watermark = timestamp
+    return watermark
+
+
+def load_line_index(file_path, granularity=INDEX_GRANULARITY):
+    '''Returns the line index for `file_path` (see `build_line_index`) from the
+    '<file_path>.idx' next to it; it's built (and saved there, if possible) when
+    it doesn't exist yet or the file has changed since.'''
+
+    index_path = file_path + '.idx'
+    stat = os.stat(file_path)
+    try:
+        with open(index_path, 'r') as index_file:
+            index = json.load(index_file)
+        if (index['input_size'] == stat.st_size and index['input_mtime'] == stat.st_mtime and
+                index['granularity'] == granularity):
+            return index
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+    index = build_line_index(file_path, granularity)
+    try:
+        with open(index_path, 'w') as index_file:
+            json.dump(index, index_file)
+    except (IOError, OSError):
+        pass    # eg. a read only archive; it just gets built again next time
+    return index
+
+
+def offset_for_time(index, timestamp):
+    '''Returns the (int) byte offset in the file of `index` to start reading at
+    to begin a replay at `timestamp`: the last indexed line with only older
+    tweets before it (so at most a `granularity` of tweets before `timestamp`
+    get read, but none at or after it are missed)'''
+
+    watermarks = [watermark for watermark, _ in index['entries']]
+    return index['entries'][max(0, bisect_left(watermarks, timestamp) - 1)][1]
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  Optional instrumentation of `tweet_processor.py`: cumulative
+#           timers and counters for each stage of the pipeline, a periodic
+#           dump of them, and cProfile / sampling profiler hooks.  Nothing
+#           in here is touched unless it's asked for on the command line.
+#----------------------------------------------------------------
+
+import sys
+import json
+import signal
+import logging
+from collections import defaultdict
+from timeit import default_timer as clock
+
+
+logger = logging.getLogger('tweet_processor.stats')
+
+
+class PipelineStats(object):
+    """Cumulative (float) secs spent in each stage and (int) counters.
+        eg.
+            stats = PipelineStats()
+            start = clock()
+            ...
+            stats.add_time('decode', clock() - start)
+            stats.count('errored')
+
+
+    Stages (timers)
+    ---------------
+    decode: pulling the fields out of the json lines (see `tweet_extractor.py`)
+    clean: cleaning the texts and hashtags (see `clean_texts`)
+    timestamp: parsing `created_at` / `timestamp_ms`
+    build: making the `Tweet`s (ie. their sets of hashtags)
+    insert: adding tweets' edges into the graph
+    evict: removing expired tweets' edges from the graph
+    output: writing to the ft1 and ft2 sinks
+    apply: all of the graph upkeep and output (includes insert, evict and output)
+
+
+    Counters
+    --------
+    lines, parsed (tweets), skipped (non-tweet messages like `limit` notices),
+    errored (lines that couldn't be used), inserted_tweets, evicted_tweets and
+    evicted_edges"""
+
+
+    def __init__(self):
+        self.timers = defaultdict(float)
+        self.counters = defaultdict(int)
+
+
+    def add_time(self, stage, secs):
+        self.timers[stage] += secs
+
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+
+    def as_dict(self):
+        '''(dict) of plain values (eg. to send back from a worker process)'''
+        return {'timers': dict(self.timers), 'counters': dict(self.counters)}
+
+
+    def merge(self, stats_dict):
+        '''Adds in the values of an `as_dict` (eg. from a worker process)'''
+
+        for stage, secs in stats_dict['timers'].items():
+            self.timers[stage] += secs
+        for name, amount in stats_dict['counters'].items():
+            self.counters[name] += amount
+
+
+    def snapshot(self, tweet_graph=None):
+        '''(dict) with the timers, counters and the current size of `tweet_graph`'''
+
+        snapshot = {'timers': dict((stage, round(secs, 6)) for stage, secs in self.timers.items()),
+                    'counters': dict(self.counters)}
+        if tweet_graph is not None:
+            snapshot['graph'] = {'late_tweets_merged': tweet_graph.late_tweets_merged,
+                                 'late_tweets_dropped': tweet_graph.late_tweets_dropped}
+            edge_store = getattr(tweet_graph, 'edge_store', None)
+            if edge_store is not None:
+                snapshot['graph'].update({'window_seconds': tweet_graph.window_seconds,
+                                          'nodes': edge_store.node_count,
+                                          'edges': edge_store.edge_count,
+                                          'symbols': len(edge_store.symbols)})
+            elif hasattr(tweet_graph, 'estimated_node_count'):    # an `ApproxTweetsGraph`
+                snapshot['graph'].update({'nodes_estimate': round(tweet_graph.estimated_node_count(), 1),
+                                          'edges_estimate': round(tweet_graph.estimated_edge_count(), 1)})
+        return snapshot
+
+
+
+def parse_chunk_with_stats(lines):
+    '''`parse_tweet_chunk` for a worker process: returns the parsed chunk along
+    with its `PipelineStats.as_dict`'''
+
+    from tweet_processor import parse_tweet_chunk
+    stats = PipelineStats()
+    return parse_tweet_chunk(lines, stats), stats.as_dict()
+
+
+class TimedEdgeStore(object):
+    """Stands in for an edge store (see `edge_store.py`), timing (and counting)
+    every insert into and eviction from it; everything else is passed straight
+    through to the wrapped `edge_store`.
+
+    It pickles as the wrapped edge store itself, so a checkpoint of an
+    instrumented graph is the same as one of a plain graph (and loads as one)."""
+
+    def __init__(self, edge_store, stats):
+        self.edge_store = edge_store
+        self.__add_tweet_edges = edge_store.add_tweet_edges
+        self.__remove_tweet_edges = edge_store.remove_tweet_edges
+        self.__timers = stats.timers
+        self.__counters = stats.counters
+
+
+    def __getattr__(self, name):
+        # (only called for what isn't found on the wrapper itself)
+        return getattr(self.edge_store, name)
+
+
+    def __reduce__(self):
+        return _unwrapped, (self.edge_store,)
+
+
+    def add_tweet_edges(self, hashtag_ids):
+        start = clock()
+        self.__add_tweet_edges(hashtag_ids)
+        self.__timers['insert'] += clock() - start
+        self.__counters['inserted_tweets'] += 1
+
+
+    def remove_tweet_edges(self, hashtag_ids):
+        edge_store = self.edge_store
+        degree_sum = edge_store.degree_sum
+        start = clock()
+        self.__remove_tweet_edges(hashtag_ids)
+        self.__timers['evict'] += clock() - start
+        counters = self.__counters
+        counters['evicted_tweets'] += 1
+        counters['evicted_edges'] += (degree_sum - edge_store.degree_sum) // 2
+
+
+def _unwrapped(edge_store):
+    # what a pickled `TimedEdgeStore` loads back as
+    return edge_store
+
+
+def instrument_graph(tweet_graph, stats):
+    '''Times (and counts) every insert into and eviction from `tweet_graph`'s
+    edge store, by putting a `TimedEdgeStore` in front of it; only a graph that
+    was passed in here pays for it.'''
+
+    tweet_graph.edge_store = TimedEdgeStore(tweet_graph.edge_store, stats)
+
+
+class TimedSink(object):
+    '''Passes everything on to `sink` (see `output_sinks.py`), adding the time
+    taken to the 'output' stage of `stats`'''
+
+    def __init__(self, sink, stats):
+        self.sink = sink
+        self.__timers = stats.timers
+
+
+    def write(self, item):
+        start = clock()
+        self.sink.write(item)
+        self.__timers['output'] += clock() - start
+
+
+    def flush(self):
+        start = clock()
+        self.sink.flush()
+        self.__timers['output'] += clock() - start
+
+
+    def position(self):
+        return self.sink.position()
+
+
+    def close(self):
+        self.sink.close()
+
+
+class StatsReporter(object):
+    '''Logs a json snapshot of `stats` (and `tweet_graph`) at most every
+    `interval` secs, whenever `maybe_report` is called (eg. once per chunk)'''
+
+    def __init__(self, stats, tweet_graph=None, interval=10.0):
+        self.stats = stats
+        self.tweet_graph = tweet_graph
+        self.interval = interval
+        self.__last_report = clock()
+
+
+    def maybe_report(self):
+        if clock() - self.__last_report >= self.interval:
+            self.report()
+
+
+    def report(self):
+        logger.info('stats %s', json.dumps(self.stats.snapshot(self.tweet_graph), sort_keys=True))
+        self.__last_report = clock()
+
+
+
+class SamplingProfiler(object):
+    """Statistical profiler: every `interval` secs of cpu time, notes the stack
+    that's running (via SIGPROF, so unix only, and only for the main thread),
+    and writes the counts out in the 'folded' format that flame graph tools read
+    (one `outer;inner;innermost count` line per distinct stack).
+        eg.
+            profiler = SamplingProfiler()
+            profiler.start()
+            ...
+            profiler.stop('profile.folded')"""
+
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = defaultdict(int)
+
+
+    def __sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('{}:{}'.format(code.co_filename.rsplit('/', 1)[-1], code.co_name))
+            frame = frame.f_back
+        self.samples[';'.join(reversed(stack))] += 1
+
+
+    def start(self):
+        signal.signal(signal.SIGPROF, self.__sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+
+    def stop(self, output_path):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        with open(output_path, 'w') as output_file:
+            for stack, count in sorted(self.samples.items()):
+                output_file.write('{} {}\n'.format(stack, count))
+
+
+def start_profiler(kind):
+    '''Starts a 'cprofile' or 'sampling' profiler; returns it for `stop_profiler`'''
+
+    if kind == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    profiler = SamplingProfiler()
+    profiler.start()
+    return profiler
+
+
+def stop_profiler(profiler, output_path):
+    '''Stops a profiler from `start_profiler` and writes its results to
+    `output_path` (pstats for cProfile, which is also summarized on stderr)'''
+
+    if isinstance(profiler, SamplingProfiler):
+        profiler.stop(output_path)
+        return
+    import pstats
+    profiler.disable()
+    profiler.dump_stats(output_path)
+    pstats.Stats(output_path, stream=sys.stderr).sort_stats('cumulative').print_stats(25)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  Reads lines from inputs that keep on growing (a file that's still
+#           being appended to, stdin, or a local socket), handing them out in
+#           batches as soon as they're complete, and blocking (rather than
+#           busy polling) while there's nothing new to read.
+#----------------------------------------------------------------
+
+import os
+import socket
+import select
+from time import sleep
+
+
+READ_SIZE = 1 << 20
+
+
+def split_lines(data, partial_line=''):
+    '''Splits a block of freshly read `data` into complete lines.
+
+
+    Parameters
+    ----------
+    data:          (str) block of bytes that was just read (or bytes in python 3)
+    partial_line:  (str) unfinished last line left over from the previous block
+
+
+    Returns
+    -------
+    (tuple) of a (list) of the complete lines (each keeping its '\\n', like
+    iterating over a file does) and the (str) unfinished line left at the end
+    '''
+
+    data = partial_line + data
+    newline = b'\n' if isinstance(data, bytes) else '\n'
+    last_newline = data.rfind(newline)
+    if last_newline == -1:
+        return [], data
+    # only '\n' ends a line (unlike `splitlines`, which also splits on a lone '\r')
+    lines = data[:last_newline].split(newline)
+    return [line + newline for line in lines], data[last_newline + 1:]
+
+
+def iter_stream_batches(fd, on_idle=None):
+    '''Yields (lists) of complete lines read from a pipe or socket `fd` (eg.
+    stdin) until the other end closes it; reads just block until there's data.
+
+
+    Parameters
+    ----------
+    fd:       (int) file descriptor to read from
+    on_idle:  (callable) called (w/o args) before each read that would block,
+        eg. to write out results so far in real time
+    '''
+
+    partial_line = b''
+    while True:
+        if on_idle is not None and not _is_readable(fd):
+            on_idle()
+        data = os.read(fd, READ_SIZE)
+        if not data:
+            break
+        lines, partial_line = split_lines(data, partial_line)
+        if lines:
+            yield lines
+    if partial_line:
+        # the writer is done, so the last line is as complete as it'll get
+        yield [partial_line]
+
+
+def follow_file(file_path, offset=0, on_idle=None, poll_interval=1.0):
+    '''Yields (lists) of complete lines from `file_path` starting at byte
+    `offset`, and keeps waiting for (and yielding) whatever gets appended to
+    the file afterwards, like `tail -f`; it never returns on its own.
+
+
+    Parameters
+    ----------
+    file_path:  (str) path of an append-only file
+    offset:     (int) byte offset to start reading at (Default: 0)
+    on_idle:    (callable) called (w/o args) each time the end of the file is
+        reached, before waiting for more, eg. to write out results in real time
+    poll_interval:  (float) longest time (secs) to wait before checking the file
+        again (Default: 1.0)
+
+
+    Notes
+    -----
+    On linux, the wait is done with inotify, so new data is picked up right as
+    it's written without any polling; elsewhere, the file is polled with a
+    backoff from 10ms up to `poll_interval`.  A partial line at the end of the
+    file (ie. the writer is in the middle of a line) is held back until the
+    rest of it is written.  The file must only ever be appended to (it isn't
+    reopened if it's truncated or rotated).
+    '''
+
+    fd = os.open(file_path, os.O_RDONLY)
+    waiter = _InotifyWaiter.create(file_path) or _BackoffWaiter(poll_interval)
+    try:
+        os.lseek(fd, offset, os.SEEK_SET)
+        partial_line = b''
+        while True:
+            data = os.read(fd, READ_SIZE)
+            if not data:
+                if on_idle is not None:
+                    on_idle()
+                waiter.wait(poll_interval)
+                continue
+            waiter.reset()
+            lines, partial_line = split_lines(data, partial_line)
+            if lines:
+                yield lines
+    finally:
+        waiter.close()
+        os.close(fd)
+
+
+def serve_socket(address, on_idle=None):
+    '''Listens on a local socket and yields (lists) of complete lines from each
+    connection that's made to it, one connection after another (eg. from a
+    collector that streams the tweets in); it never returns on its own.
+
+
+    Parameters
+    ----------
+    address:  (str) either a unix socket path or 'HOST:PORT' for tcp
+    on_idle:  (callable) see `iter_stream_batches`
+    '''
+
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, int(port)))
+    else:
+        if os.path.exists(address):
+            os.unlink(address)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(address)
+    server.listen(1)
+    try:
+        while True:
+            connection, _ = server.accept()
+            try:
+                for lines in iter_stream_batches(connection.fileno(), on_idle):
+                    yield lines
+            finally:
+                connection.close()
+    finally:
+        server.close()
+
+
+def _is_readable(fd):
+    return bool(select.select([fd], [], [], 0)[0])
+
+
+
+class _BackoffWaiter(object):
+    '''Sleeps for a bit longer each time nothing new showed up'''
+
+    def __init__(self, max_wait, min_wait=0.01):
+        self.max_wait = max_wait
+        self.min_wait = min_wait
+        self.__wait = min_wait
+
+
+    def wait(self, timeout):
+        sleep(min(self.__wait, timeout))
+        self.__wait = min(self.__wait * 2, self.max_wait)
+
+
+    def reset(self):
+        self.__wait = self.min_wait
+
+
+    def close(self):
+        pass
+
+
+class _InotifyWaiter(object):
+    '''Blocks until the watched file is modified (linux only, via ctypes)'''
+
+    IN_MODIFY = 0x00000002
+    IN_CLOEXEC = 0x00080000
+    IN_NONBLOCK = 0x00000800
+
+    def __init__(self, inotify_fd):
+        self.__inotify_fd = inotify_fd
+
+
+    @classmethod
+    def create(cls, file_path):
+        '''Returns a waiter watching `file_path`, or None if inotify isn't available'''
+
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            inotify_fd = libc.inotify_init1(cls.IN_CLOEXEC | cls.IN_NONBLOCK)
+        except (OSError, AttributeError):
+            return None
+        if inotify_fd < 0:
+            return None
+        if not isinstance(file_path, bytes):
+            file_path = file_path.encode('utf-8')
+        if libc.inotify_add_watch(inotify_fd, file_path, cls.IN_MODIFY) < 0:
+            os.close(inotify_fd)
+            return None
+        return cls(inotify_fd)
+
+
+    def wait(self, timeout):
+        # the events are only used as a wake up call, so they're just drained;
+        # the timeout is a safety net in case an event is ever missed
+        if select.select([self.__inotify_fd], [], [], timeout)[0]:
+            try:
+                while os.read(self.__inotify_fd, 4096):
+                    pass
+            except OSError:
+                pass
+
+
+    def reset(self):
+        pass
+
+
+    def close(self):
+        os.close(self.__inotify_fd)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  `MultiWindowTweetsGraph` keeps the hashtag graph for several
+#           time windows at once (eg. 10s, 60s and 300s) from a single pass
+#           over the tweets, with one copy of the hashtags and edges shared
+#           by all of the windows.
+#----------------------------------------------------------------
+
+from tweets_graph import format_avg_degree
+
+
+class MultiWindowTweetsGraph(object):
+    """The same graphs (and the very same average degrees) as one `TweetsGraph`
+    per time window, but built in one go.
+        eg.
+            tweet_graph = MultiWindowTweetsGraph(time_windows=(10, 60, 300))
+            tweet_graph.update_graph(tweet)
+            tweet_graph.get_graph_avg_degree_of_all_nodes()   # -> '1.00 2.33 2.50'
+
+
+    Methods
+    -------
+    update_graph: adds a tweet (into every window it's recent enough for)
+
+    get_graph_avg_degree_of_all_nodes: returns the average degree of each window
+        (as a (tuple) of floats, or a (str) of them rounded and space separated)
+
+    graph_for: the graph of one of the windows, as adjacency sets
+
+
+    Attributes
+    ----------
+    time_windows: (tuple) of the window lengths (int secs), in the order that
+        their averages are returned in
+
+    max_lateness: (int) same as for a `TweetsGraph`, for all of the windows (a
+        window shorter than it only takes tweets that are within its length)
+
+    late_tweets_merged, late_tweets_dropped: (list) of the counts for each
+        window, the same as a `TweetsGraph` for that window would have
+
+    edge_seconds: (dict) of each edge ((tuple) of its two hashtags, in sorted
+        order) -> newest timestamp of a tweet with that pair of hashtags
+
+    node_seconds: (dict) of each hashtag -> newest timestamp of a tweet with it
+        (and at least one other hashtag)
+
+    graph: the graph of the longest window (see `graph_for`)
+
+
+    Notes
+    -----
+    The windows all end at the newest tweet, so a shorter window holds a subset
+    of the tweets of a longer one, and an edge is in a window exactly when the
+    newest tweet with that edge is.  So instead of a reference count per window,
+    each edge (and hashtag) only keeps the timestamp of the newest tweet it was
+    in, and is filed under that second.  Each window keeps a count of the edges
+    and hashtags that are filed under its seconds; as the newest timestamp moves
+    on, the seconds that fall out of a window are subtracted from its counts, and
+    once they fall out of the longest window, their edges and hashtags are
+    deleted.  Adding a tweet costs the same whatever the number of windows, bar
+    a comparison per window for each edge, and the graph is only stored once."""
+
+
+    def __init__(self, time_windows=(10, 60, 300), max_lateness=None):
+        if len(set(time_windows)) != len(time_windows):
+            raise ValueError('the time windows need to be different: {}'.format(time_windows))
+        self.time_windows = tuple(time_windows)
+        longest_window = max(time_windows)
+        if max_lateness is None or max_lateness > longest_window:
+            max_lateness = longest_window  # anything older would be expired right away
+        self.max_lateness = max_lateness
+        self.late_tweets_merged = [0] * len(time_windows)
+        self.late_tweets_dropped = [0] * len(time_windows)
+        self.newest_timestamp = None
+        self.edge_seconds = {}
+        self.node_seconds = {}
+        self.__edges_at = {}         # timestamp -> (set) of the edges filed under it
+        self.__nodes_at = {}
+        self.__edge_counts = [0] * len(time_windows)
+        self.__node_counts = [0] * len(time_windows)
+        self.__cutoffs = None        # oldest timestamp still in each window
+        self.__avg_degs = None       # until the counts change again
+        self.__longest = self.time_windows.index(longest_window)
+        # shortest first, so a second is taken off the counts of every window
+        # it falls out of before the longest one deletes what's filed under it
+        self.__shortest_first = sorted(range(len(time_windows)), key=lambda i: time_windows[i])
+
+
+    def update_graph(self, tweet):
+        '''Adds `tweet` (an instance of class Tweet, see `tweet_processor.py`)
+        to every window, moving them all along to its timestamp first if it's
+        the newest one yet'''
+
+        timestamp = tweet.timestamp
+        newest_timestamp = self.newest_timestamp
+        if newest_timestamp is not None and timestamp < newest_timestamp:
+            lateness = newest_timestamp - timestamp
+            for i, time_window in enumerate(self.time_windows):
+                if lateness > self.max_lateness or lateness > time_window:
+                    self.late_tweets_dropped[i] += 1
+                else:
+                    self.late_tweets_merged[i] += 1
+            if lateness > self.max_lateness:
+                return
+        elif newest_timestamp is None or timestamp > newest_timestamp:
+            self.__advance(timestamp)
+
+        hashtags = tweet.hashtags
+        if len(hashtags) > 1:
+            hashtags = sorted(hashtags)
+            touch = self.__touch
+            for hashtag in hashtags:
+                touch(self.node_seconds, self.__nodes_at, self.__node_counts, hashtag, timestamp)
+            edge_seconds, edges_at, edge_counts = self.edge_seconds, self.__edges_at, self.__edge_counts
+            for i, hashtag in enumerate(hashtags):
+                for other_hashtag in hashtags[i + 1:]:
+                    touch(edge_seconds, edges_at, edge_counts, (hashtag, other_hashtag), timestamp)
+
+
+    def __touch(self, seconds, filed_at, counts, key, timestamp):
+        '''Refiles `key` (an edge or hashtag) under `timestamp` if that's newer
+        than what it's filed under, and counts it in the windows it just joined'''
+
+        old_timestamp = seconds.get(key)
+        if old_timestamp is not None:
+            if old_timestamp >= timestamp:
+                return
+            keys = filed_at[old_timestamp]
+            keys.discard(key)
+            if not keys:
+                del filed_at[old_timestamp]
+        seconds[key] = timestamp
+        keys = filed_at.get(timestamp)
+        if keys is None:
+            keys = filed_at[timestamp] = set()
+        keys.add(key)
+        for i, cutoff in enumerate(self.__cutoffs):
+            if timestamp >= cutoff and (old_timestamp is None or old_timestamp < cutoff):
+                counts[i] += 1
+                self.__avg_degs = None
+
+
+    def __advance(self, timestamp):
+        '''Moves every window along to end at `timestamp` (the newest yet)'''
+
+        old_cutoffs = self.__cutoffs
+        self.newest_timestamp = timestamp
+        self.__cutoffs = [timestamp - time_window for time_window in self.time_windows]
+        if old_cutoffs is None:
+            return
+        for i in self.__shortest_first:
+            old_cutoff, cutoff = old_cutoffs[i], self.__cutoffs[i]
+            for filed_at, seconds, counts in ((self.__edges_at, self.edge_seconds, self.__edge_counts),
+                                              (self.__nodes_at, self.node_seconds, self.__node_counts)):
+                for expired in _filed_between(filed_at, old_cutoff, cutoff):
+                    if i == self.__longest:     # out of every window, so gone for good
+                        keys = filed_at.pop(expired)
+                        for key in keys:
+                            del seconds[key]
+                    else:
+                        keys = filed_at[expired]
+                    counts[i] -= len(keys)
+                    self.__avg_degs = None
+
+
+    def __avg_degrees(self):
+        if self.__avg_degs is None:
+            # the same division as `EdgeStore.avg_degree`, so exactly the same floats
+            self.__avg_degs = tuple(2 * edge_count / float(node_count) if node_count else 0.0
+                                    for edge_count, node_count in zip(self.__edge_counts, self.__node_counts))
+        return self.__avg_degs
+
+
+    def get_graph_avg_degree_of_all_nodes(self, as_float=False):
+        '''Returns the current average degree of each window, in the order of
+        `time_windows`: a (tuple) of floats if `as_float`, else a (str) of them
+        rounded like `TweetsGraph` does and separated by spaces (Default)'''
+
+        avg_degs = self.__avg_degrees()
+        if as_float:
+            return avg_degs
+        return ' '.join(format_avg_degree(avg_deg) for avg_deg in avg_degs)
+
+
+    def graph_for(self, time_window):
+        '''Returns the graph of the window of `time_window` secs as a (dict) of
+        hashtag -> (set) of neighboring hashtags (built on each call)'''
+
+        if self.newest_timestamp is None:
+            return {}
+        cutoff = self.newest_timestamp - time_window
+        graph = {}
+        for (hashtag, other_hashtag), timestamp in self.edge_seconds.items():
+            if timestamp >= cutoff:
+                graph.setdefault(hashtag, set()).add(other_hashtag)
+                graph.setdefault(other_hashtag, set()).add(hashtag)
+        return graph
+
+
+    @property
+    def graph(self):
+        return self.graph_for(self.time_windows[self.__longest])
+
+
+
+def _filed_between(filed_at, start, stop):
+    '''(list) of the timestamps in `filed_at` in [start, stop); looks up each
+    second in between, or goes over `filed_at` if that's fewer'''
+
+    if stop - start <= len(filed_at):
+        return [timestamp for timestamp in range(start, stop) if timestamp in filed_at]
+    return [timestamp for timestamp in filed_at if start <= timestamp < stop]
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  Output sinks for the results of `tweet_processor.py`; they
+#           collect the per tweet output in memory and hand it over to the
+#           underlying file in large writes.
+#----------------------------------------------------------------
+
+import sys
+from array import array
+from time import time
+
+_array_bytes = getattr(array, 'tobytes', None) or array.tostring    # (python 2 only has `tostring`)
+
+from tweets_graph import format_avg_degree
+
+
+DEFAULT_FLUSH_BYTES = 1 << 20
+
+
+class LineSink(object):
+    """Buffers (str) lines and writes them out to `fileobj` in large chunks.
+        eg.
+            ft1 = LineSink(open('ft1.txt', 'w'))
+            ft1.write('some line\\n')
+            ft1.close()     # flushes whatever is left
+
+
+    Attributes
+    ----------
+    fileobj: the (file) like object that's written to
+
+    flush_bytes: (int) the buffer is written out once it holds at least this
+        many chars (Default: 1MB)
+
+    flush_interval: (float) if given, the buffer is also written out once this
+        many secs have passed since the last time (checked on each write);
+        useful to get results out in real time (Default: None)
+
+    close_file: (bool) if `fileobj` should be closed by `close` (Default: True;
+        eg. set it to False for sys.stdout)"""
+
+
+    def __init__(self, fileobj, flush_bytes=DEFAULT_FLUSH_BYTES, flush_interval=None, close_file=True):
+        self.fileobj = fileobj
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.close_file = close_file
+        self.__buffer = []
+        self.__buffered_len = 0
+        self.__last_flush = time()
+
+
+    def write(self, line):
+        self.__buffer.append(line)
+        self.__buffered_len += len(line)
+        if self.__buffered_len >= self.flush_bytes:
+            self.flush()
+        elif self.flush_interval is not None and time() - self.__last_flush >= self.flush_interval:
+            self.flush()
+
+
+    def flush(self):
+        '''Writes out everything that's buffered (in a single write) and flushes `fileobj`'''
+
+        if self.__buffer:
+            self.fileobj.write(''.join(self.__buffer))
+            self.__buffer = []
+            self.__buffered_len = 0
+        self.fileobj.flush()
+        self.__last_flush = time()
+
+
+    def position(self):
+        '''Flushes and returns the (int) size of the output so far, or None if
+        the output isn't a regular file (eg. stdout piped somewhere)'''
+
+        self.flush()
+        return _file_position(self.fileobj)
+
+
+    def close(self):
+        self.flush()
+        if self.close_file:
+            self.fileobj.close()
+
+
+class AverageTextSink(object):
+    """Writes each average degree (float) as a line of text, rounded to two
+    decimals like `TweetsGraph.get_graph_avg_degree_of_all_nodes` does (the
+    original `ft2.txt` format), into a `LineSink`.
+
+    The average only changes when the graph does, so the formatted str of the
+    last average is reused as long as it stays the same.
+
+    With `columns` > 1, each average is a (tuple) of that many floats (eg. one
+    per time window, see `multi_window_graph.py`) written as one line of space
+    separated columns."""
+
+
+    def __init__(self, line_sink, columns=1):
+        self.line_sink = line_sink
+        self.columns = columns
+        self.__format = format_avg_degree if columns == 1 else _format_avg_degrees
+        self.__last_avg_deg = None
+        self.__last_line = None
+
+
+    def write(self, avg_deg):
+        if avg_deg != self.__last_avg_deg:
+            self.__last_avg_deg = avg_deg
+            self.__last_line = self.__format(avg_deg) + '\n'
+        self.line_sink.write(self.__last_line)
+
+
+    def flush(self):
+        self.line_sink.flush()
+
+
+    def position(self):
+        return self.line_sink.position()
+
+
+    def close(self):
+        self.line_sink.close()
+
+
+class AverageBinarySink(object):
+    """Writes each average degree as a raw (unrounded) 8 byte float in native
+    byte order, ie. the file can be read back with `array('d').fromfile` (or
+    `numpy.fromfile(path, dtype='f8')`); the averages are buffered in an array
+    and written out `flush_count` at a time.
+
+    With `columns` > 1, each average is a (tuple) of that many floats, written
+    one after the other (ie. rows of a `columns` wide table)."""
+
+
+    def __init__(self, fileobj, flush_count=DEFAULT_FLUSH_BYTES // 8, flush_interval=None, close_file=True,
+                 columns=1):
+        self.fileobj = fileobj
+        self.flush_count = flush_count
+        self.flush_interval = flush_interval
+        self.close_file = close_file
+        self.columns = columns
+        self.__buffer = array('d')
+        self.__last_flush = time()
+        if columns > 1:
+            self.write = self.__write_columns
+
+
+    def write(self, avg_deg):
+        self.__buffer.append(avg_deg)
+        if len(self.__buffer) >= self.flush_count:
+            self.flush()
+        elif self.flush_interval is not None and time() - self.__last_flush >= self.flush_interval:
+            self.flush()
+
+
+    def __write_columns(self, avg_degs):
+        self.__buffer.extend(avg_degs)
+        if len(self.__buffer) >= self.flush_count:
+            self.flush()
+        elif self.flush_interval is not None and time() - self.__last_flush >= self.flush_interval:
+            self.flush()
+
+
+    def flush(self):
+        if self.__buffer:
+            self.fileobj.write(_array_bytes(self.__buffer))
+            self.__buffer = array('d')
+        self.fileobj.flush()
+        self.__last_flush = time()
+
+
+    def position(self):
+        self.flush()
+        return _file_position(self.fileobj)
+
+
+    def close(self):
+        self.flush()
+        if self.close_file:
+            self.fileobj.close()
+
+
+class NullSink(object):
+    """Throws away everything written to it (eg. for benchmarking)."""
+
+    def write(self, item):
+        pass
+
+    def flush(self):
+        pass
+
+    def position(self):
+        return None
+
+    def close(self):
+        pass
+
+
+def _format_avg_degrees(avg_degs):
+    return ' '.join(format_avg_degree(avg_deg) for avg_deg in avg_degs)
+
+
+def _file_position(fileobj):
+    try:
+        return fileobj.tell()
+    except (IOError, OSError, AttributeError):
+        return None
+
+
+def _open_for_output(file_path, mode, resume_at=None):
+    '''Opens `file_path` for writing; if `resume_at` is given, the existing
+    file is cut back to that size and appended to instead'''
+
+    if resume_at is None:
+        return open(file_path, mode)
+    output_file = open(file_path, 'r+' + mode[1:])
+    output_file.truncate(resume_at)
+    output_file.seek(resume_at)
+    return output_file
+
+
+def make_sink(kind, file_path=None, flush_bytes=DEFAULT_FLUSH_BYTES, flush_interval=None, averages=False,
+              resume_at=None, columns=1):
+    '''Creates one of the sinks above from a command line style description.
+
+
+    Parameters
+    ----------
+    kind:  (str) one of 'file' (text lines in `file_path`), 'binary' (raw floats
+        in `file_path`; only for averages), 'stdout' or 'null'
+    file_path:  (str) path of the file to write for 'file' and 'binary'
+    flush_bytes, flush_interval:  see `LineSink`
+    averages:  (bool) if the sink is going to be given average degrees (floats)
+        rather than (str) lines
+    resume_at:  (int) for 'file' and 'binary'; if given, the existing file is
+        cut back to this size and appended to (eg. after restoring a checkpoint)
+    columns:  (int) number of averages in each one written (eg. one per time window)
+    '''
+
+    if kind == 'null':
+        return NullSink()
+    elif kind == 'binary':
+        if not averages:
+            raise ValueError("only the average degrees can be written as 'binary'")
+        return AverageBinarySink(_open_for_output(file_path, 'wb', resume_at),
+                                 flush_count=max(1, flush_bytes // 8),
+                                 flush_interval=flush_interval, columns=columns)
+    elif kind == 'file':
+        sink = LineSink(_open_for_output(file_path, 'w', resume_at), flush_bytes, flush_interval)
+    elif kind == 'stdout':
+        sink = LineSink(sys.stdout, flush_bytes, flush_interval, close_file=False)
+    else:
+        raise ValueError('unknown sink: {}'.format(kind))
+    return AverageTextSink(sink, columns) if averages else sink
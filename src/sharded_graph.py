@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  `ShardedTweetsGraph` spreads the upkeep of the hashtag graph over
+#           several processes, each holding the edges of a share of the
+#           hashtags, and adds up their node and degree counts to get the
+#           same average degree as a single `TweetsGraph`.
+#----------------------------------------------------------------
+
+from array import array
+from zlib import crc32
+from multiprocessing import Pipe
+from multiprocessing import Process
+
+from symbol_table import SymbolTable
+from time_window import TimeWindow
+from time_window import iter_entries
+from tweets_graph import format_avg_degree
+
+
+_array_bytes = getattr(array, 'tobytes', None) or array.tostring    # (python 2 only has `tostring`)
+_array_from_bytes = getattr(array, 'frombytes', None) or array.fromstring
+
+
+def shard_of(hashtag, shard_count):
+    '''Returns the (int) index of the shard that owns `hashtag`'s node; the
+    same in every process (unlike `hash`, which can be randomized)'''
+
+    if not isinstance(hashtag, bytes):  # python 3; the same bytes as a python 2 str has
+        hashtag = hashtag.encode('utf-8')
+    return (crc32(hashtag) & 0xffffffff) % shard_count
+
+
+class GraphShard(object):
+    """The part of the graph that belongs to one shard: the neighbors of the
+    hashtags it owns (see `shard_of`), along with its own time window.
+
+    A shard is only given the tweets that have at least one of its own hashtags
+    in them (with all of their hashtags), and only keeps the edges going out
+    from its own hashtags (ie. half of each edge whose ends are in different
+    shards).  So, summed over all of the shards, `node_count` and `degree_sum`
+    come out the same as for the whole graph.  Its window is moved along by
+    `advance`, with every newest timestamp of the whole stream (not just of its
+    own tweets), so it expires its tweets exactly when a `TweetsGraph` would.
+
+
+    Attributes
+    ----------
+    adjacency: (dict) of owned hashtag id -> (dict) of neighboring hashtag id ->
+        number of tweets in the window containing that pair
+
+    node_count: (int) number of owned hashtags that have neighbors
+
+    degree_sum: (int) sum of the degrees of the owned hashtags
+
+
+    Notes
+    -----
+    The window keeps each tweet as [number of owned ids, *owned ids, *other ids];
+    the ids are local to the shard and are released once the last tweet in the
+    window that has the hashtag expires."""
+
+
+    def __init__(self, time_window=60):
+        self.symbols = SymbolTable()
+        self.adjacency = {}
+        self.node_count = 0
+        self.degree_sum = 0
+        self.__window = TimeWindow(time_window)
+        self.__symbol_refs = array('i')
+
+
+    def advance(self, timestamp):
+        '''Moves the window to `timestamp`, removing the edges of the tweets
+        that fall out of it'''
+
+        for packed_entries in self.__window.advance(timestamp):
+            for entry in iter_entries(packed_entries):
+                self.__remove_entry(entry)
+
+
+    def add_tweet(self, timestamp, owned_hashtags, other_hashtags=()):
+        '''Adds the tweet's edges that go out from its `owned_hashtags` (to all
+        of its other hashtags); the window has to have been moved to (at least)
+        `timestamp` already'''
+
+        owned_ids = [self.__intern(hashtag) for hashtag in owned_hashtags]
+        other_ids = [self.__intern(hashtag) for hashtag in other_hashtags]
+        self.__add_edges(owned_ids, owned_ids + other_ids)
+        self.__window.add(timestamp, [len(owned_ids)] + owned_ids + other_ids)
+
+
+    def __intern(self, hashtag):
+        hashtag_id = self.symbols.intern(hashtag)
+        symbol_refs = self.__symbol_refs
+        if hashtag_id == len(symbol_refs):
+            symbol_refs.append(1)
+        else:
+            symbol_refs[hashtag_id] += 1
+        return hashtag_id
+
+
+    def __add_edges(self, owned_ids, hashtag_ids):
+        adjacency = self.adjacency
+        new_nodes = new_halves = 0
+        for id1 in owned_ids:
+            neighbors = adjacency.get(id1)
+            if neighbors is None:
+                neighbors = adjacency[id1] = {}
+                new_nodes += 1
+            for id2 in hashtag_ids:
+                if id2 != id1:
+                    refs = neighbors.get(id2, 0)
+                    if not refs:
+                        new_halves += 1
+                    neighbors[id2] = refs + 1
+        self.node_count += new_nodes
+        self.degree_sum += new_halves
+
+
+    def __remove_entry(self, entry):
+        adjacency = self.adjacency
+        owned_count = entry[0]
+        hashtag_ids = entry[1:]
+        gone_nodes = gone_halves = 0
+        for id1 in hashtag_ids[:owned_count]:
+            neighbors = adjacency[id1]
+            for id2 in hashtag_ids:
+                if id2 != id1:
+                    refs = neighbors[id2] - 1
+                    if refs:
+                        neighbors[id2] = refs
+                    else:
+                        del neighbors[id2]
+                        gone_halves += 1
+            if not neighbors:
+                del adjacency[id1]
+                gone_nodes += 1
+        self.node_count -= gone_nodes
+        self.degree_sum -= gone_halves
+
+        symbol_refs = self.__symbol_refs
+        for hashtag_id in hashtag_ids:
+            symbol_refs[hashtag_id] -= 1
+            if not symbol_refs[hashtag_id]:
+                self.symbols.release(hashtag_id)
+
+
+    def as_adjacency_sets(self):
+        '''Returns the owned part of the graph as a (dict) of hashtag (str) ->
+        (set) of neighboring hashtags'''
+
+        name_of = self.symbols.name_of
+        return dict((name_of(node_id), set(name_of(nbr_id) for nbr_id in neighbors))
+                    for node_id, neighbors in self.adjacency.items())
+
+
+def _apply_batch(shard, mark_positions, mark_timestamps, tweets):
+    '''Applies a batch to `shard`: moves its window to each of the batch's
+    watermarks and adds each of its `tweets`, in the order of their positions
+    in the batch (a watermark before the tweet at the same position).
+
+    Returns an int (array) of the positions at which the shard's counts
+    changed, then the node count at each of them, then the degree sum.'''
+
+    positions = array('i')
+    node_counts = array('i')
+    degree_sums = array('i')
+    node_count = shard.node_count
+    degree_sum = shard.degree_sum
+    advance = shard.advance
+    add_tweet = shard.add_tweet
+    mark_count = len(mark_positions)
+    mark_index = 0
+    for pos, timestamp, owned_hashtags, other_hashtags in tweets:
+        while mark_index < mark_count and mark_positions[mark_index] <= pos:
+            advance(mark_timestamps[mark_index])
+            if shard.node_count != node_count or shard.degree_sum != degree_sum:
+                node_count = shard.node_count
+                degree_sum = shard.degree_sum
+                positions.append(mark_positions[mark_index])
+                node_counts.append(node_count)
+                degree_sums.append(degree_sum)
+            mark_index += 1
+        add_tweet(timestamp, owned_hashtags, other_hashtags)
+        if shard.node_count != node_count or shard.degree_sum != degree_sum:
+            node_count = shard.node_count
+            degree_sum = shard.degree_sum
+            positions.append(pos)
+            node_counts.append(node_count)
+            degree_sums.append(degree_sum)
+    for mark_index in range(mark_index, mark_count):
+        advance(mark_timestamps[mark_index])
+        if shard.node_count != node_count or shard.degree_sum != degree_sum:
+            node_count = shard.node_count
+            degree_sum = shard.degree_sum
+            positions.append(mark_positions[mark_index])
+            node_counts.append(node_count)
+            degree_sums.append(degree_sum)
+    return positions + node_counts + degree_sums
+
+
+def _run_shard(connection, time_window):
+    '''Main loop of a shard's process: applies each batch sent over
+    `connection` (see `_apply_batch`) and sends back where its counts changed
+    (as the raw bytes of the int array)'''
+
+    shard = GraphShard(time_window)
+    while True:
+        message = connection.recv()
+        if message[0] == 'batch':
+            _, mark_positions, mark_timestamps, tweets = message
+            connection.send_bytes(_array_bytes(_apply_batch(shard, mark_positions, mark_timestamps, tweets)))
+        elif message[0] == 'graph':
+            connection.send(shard.as_adjacency_sets())
+        else:
+            break
+    connection.close()
+
+
+
+class ShardedTweetsGraph(object):
+    """Same graph as a `TweetsGraph` (and the very same average degrees), with
+    its upkeep spread over `shards` worker processes.
+        eg.
+            tweet_graph = ShardedTweetsGraph(shards=4)
+            avg_degrees = tweet_graph.update_graph_batch(tweets)
+            tweet_graph.close()
+
+
+    Methods
+    -------
+    update_graph_batch: adds a (list) of tweets in order and returns the
+        average degree right after each one
+
+    update_graph: same as for a `TweetsGraph` (but a batch at a time is far
+        faster, as each call is a round trip to every shard)
+
+    get_graph_avg_degree_of_all_nodes: same as for a `TweetsGraph`
+
+    close: stops the worker processes
+
+
+    Attributes
+    ----------
+    graph, time_window, max_lateness, late_tweets_merged, late_tweets_dropped:
+        the same as for a `TweetsGraph`
+
+    shard_count: (int) number of worker processes
+
+    owner_cache_size: (int) how many hashtags' shards are remembered, so the
+        hash isn't worked out again for every tweet (Default: 65536)
+
+
+    Notes
+    -----
+    Each hashtag (node) belongs to one shard, picked by a hash of its text (see
+    `GraphShard`).  This process only does the lateness check and works out
+    which shards own the hashtags of each tweet; each shard is then sent just
+    the tweets it owns a hashtag of, along with the batch's watermarks (the
+    positions at which the newest timestamp went up, and to what), which is
+    all it needs to move its window along.  The shards apply their tweets in
+    parallel and send back only the positions at which their own node and
+    degree counts changed, so the totals (and the average degree) only have to
+    be worked out again at those positions, not after every tweet."""
+
+
+    def __init__(self, time_window=60, max_lateness=None, shards=2, owner_cache_size=65536):
+        self.time_window = time_window
+        if max_lateness is None or max_lateness > time_window:
+            max_lateness = time_window  # anything older would be expired right away
+        self.max_lateness = max_lateness
+        self.late_tweets_merged = 0
+        self.late_tweets_dropped = 0
+        self.shard_count = shards
+        self.owner_cache_size = owner_cache_size
+        self.__owner_cache = {}      # hashtag -> index of the shard that owns it
+        self.__newest_timestamp = None
+        self.__node_count = 0
+        self.__degree_sum = 0
+        self.__shard_counts = [(0, 0)] * shards   # last node count and degree sum from each shard
+        self.__connections = []
+        self.__processes = []
+        for _ in range(shards):
+            connection, shard_connection = Pipe()
+            process = Process(target=_run_shard, args=(shard_connection, time_window))
+            process.daemon = True
+            process.start()
+            shard_connection.close()
+            self.__connections.append(connection)
+            self.__processes.append(process)
+
+
+    def update_graph_batch(self, tweets):
+        '''Adds each of `tweets` into the graph (in order), like calling
+        `update_graph` on each of them in turn.
+
+
+        Parameters
+        ----------
+        tweets:  (list) of Tweet instances (see `tweet_processor.py`)
+
+
+        Returns
+        -------
+        (list) of the average degree (float) of the graph right after each tweet
+        '''
+
+        shard_count = self.shard_count
+        owner_cache = self.__owner_cache
+        if len(owner_cache) >= self.owner_cache_size:
+            owner_cache.clear()
+        mark_positions = []
+        mark_timestamps = []
+        routes = [[] for _ in range(shard_count)]
+        newest_timestamp = self.__newest_timestamp
+        for pos, tweet in enumerate(tweets):
+            timestamp = tweet.timestamp
+            if newest_timestamp is None or timestamp > newest_timestamp:
+                newest_timestamp = timestamp
+                mark_positions.append(pos)
+                mark_timestamps.append(timestamp)
+            elif timestamp < newest_timestamp:
+                if newest_timestamp - timestamp > self.max_lateness:
+                    self.late_tweets_dropped += 1
+                    continue
+                self.late_tweets_merged += 1
+
+            hashtags = tweet.hashtags
+            if len(hashtags) < 2:
+                continue
+            owners = []
+            for hashtag in hashtags:
+                owner = owner_cache.get(hashtag)
+                if owner is None:
+                    owner = owner_cache[hashtag] = shard_of(hashtag, shard_count)
+                owners.append(owner)
+            first_owner = owners[0]
+            if owners.count(first_owner) == len(owners):
+                routes[first_owner].append((pos, timestamp, tuple(hashtags), ()))
+                continue
+            hashtags = tuple(hashtags)
+            for owner in set(owners):
+                routes[owner].append(
+                    (pos, timestamp,
+                     [hashtag for hashtag, hashtag_owner in zip(hashtags, owners) if hashtag_owner == owner],
+                     [hashtag for hashtag, hashtag_owner in zip(hashtags, owners) if hashtag_owner != owner]))
+        self.__newest_timestamp = newest_timestamp
+
+        # each shard only sends back the positions at which its own counts
+        # changed, which are turned into changes of the totals at each position
+        node_changes = {}
+        degree_changes = {}
+        if mark_positions or any(routes):
+            for connection, shard_routes in zip(self.__connections, routes):
+                connection.send(('batch', mark_positions, mark_timestamps, shard_routes))
+            for shard_index, connection in enumerate(self.__connections):
+                changes = array('i')
+                _array_from_bytes(changes, connection.recv_bytes())
+                change_count = len(changes) // 3
+                node_count, degree_sum = self.__shard_counts[shard_index]
+                for i in range(change_count):
+                    pos = changes[i]
+                    new_node_count = changes[change_count + i]
+                    new_degree_sum = changes[2 * change_count + i]
+                    node_changes[pos] = node_changes.get(pos, 0) + new_node_count - node_count
+                    degree_changes[pos] = degree_changes.get(pos, 0) + new_degree_sum - degree_sum
+                    node_count = new_node_count
+                    degree_sum = new_degree_sum
+                self.__shard_counts[shard_index] = (node_count, degree_sum)
+
+        avg_degrees = []
+        avg_degree = self.__avg_degree()
+        pos = 0
+        for change_pos in sorted(node_changes):
+            avg_degrees.extend([avg_degree] * (change_pos - pos))
+            self.__node_count += node_changes[change_pos]
+            self.__degree_sum += degree_changes[change_pos]
+            avg_degree = self.__avg_degree()
+            pos = change_pos
+        avg_degrees.extend([avg_degree] * (len(tweets) - pos))
+        return avg_degrees
+
+
+    def update_graph(self, tweet):
+        '''Adds a single tweet (see `update_graph_batch`)'''
+        self.update_graph_batch([tweet])
+
+
+    def __avg_degree(self):
+        # the same division as `EdgeStore.avg_degree`, so exactly the same floats
+        if self.__node_count:
+            return self.__degree_sum / float(self.__node_count)
+        return 0.0
+
+
+    def get_graph_avg_degree_of_all_nodes(self, as_float=False):
+        '''Returns the current average degree, same as `TweetsGraph` does'''
+
+        avg_deg = self.__avg_degree()
+        if as_float:
+            return avg_deg
+        return format_avg_degree(avg_deg)
+
+
+    @property
+    def graph(self):
+        '''(dict) of hashtag -> (set) of neighboring hashtags, gathered from all
+        of the shards (each shard has the neighbors of its own hashtags)'''
+
+        graph = {}
+        for connection in self.__connections:
+            connection.send(('graph',))
+        for connection in self.__connections:
+            graph.update(connection.recv())
+        return graph
+
+
+    def close(self):
+        '''Stops the shard processes'''
+
+        for connection in self.__connections:
+            connection.send(('stop',))
+            connection.close()
+        for process in self.__processes:
+            process.join()
+        self.__connections = []
+        self.__processes = []
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  `SymbolTable` interns each (cleaned) hashtag as a small int,
+#           so that the graph and the time window only have to hold ints.
+#----------------------------------------------------------------
+
+
+class SymbolTable(object):
+    """Two-way mapping between hashtags (strs) and small (int) ids.
+
+    Ids are handed out densely starting at 0; once a hashtag is released
+    (eg. its node left the graph) its id goes onto a free list and is reused
+    for the next new hashtag, so the ids stay small for as long as the number
+    of hashtags in the window does.
+        eg.
+            symbols = SymbolTable()
+            hashtag_id = symbols.intern('apache')
+            symbols.name_of(hashtag_id)     # 'apache'
+            symbols.release(hashtag_id)
+
+
+    Notes
+    -----
+    `len(symbols)` is the number of hashtags currently interned, while
+    `capacity` is the number of ids ever handed out (ie. the largest id + 1)."""
+
+
+    def __init__(self):
+        self.__ids = {}
+        self.__names = []
+        self.__free_ids = []
+
+
+    def __len__(self):
+        return len(self.__ids)
+
+
+    def __contains__(self, hashtag):
+        return hashtag in self.__ids
+
+
+    @property
+    def capacity(self):
+        '''(int) number of ids in use or on the free list'''
+        return len(self.__names)
+
+
+    def intern(self, hashtag):
+        '''Returns the (int) id for `hashtag`, assigning one if needed.'''
+
+        hashtag_id = self.__ids.get(hashtag)
+        if hashtag_id is None:
+            if self.__free_ids:
+                hashtag_id = self.__free_ids.pop()
+                self.__names[hashtag_id] = hashtag
+            else:
+                hashtag_id = len(self.__names)
+                self.__names.append(hashtag)
+            self.__ids[hashtag] = hashtag_id
+        return hashtag_id
+
+
+    def get(self, hashtag, default=None):
+        '''Returns the (int) id for `hashtag` (or `default` if it isn't interned)'''
+        return self.__ids.get(hashtag, default)
+
+
+    def name_of(self, hashtag_id):
+        '''Returns the hashtag (str) that is interned as `hashtag_id`.'''
+        return self.__names[hashtag_id]
+
+
+    def release(self, hashtag_id):
+        '''Forgets the hashtag interned as `hashtag_id` and frees the id for reuse.'''
+
+        del self.__ids[self.__names[hashtag_id]]
+        self.__names[hashtag_id] = None
+        self.__free_ids.append(hashtag_id)
@@ -14,8 +14,40 @@ repo_root = os.getcwd()
 sys.path.insert(0, os.path.abspath(repo_root))
 from tweet_processor import Tweet
 from tweet_processor import clean_text
+from tweet_processor import clean_texts
+from tweet_processor import iter_parsed_tweets
+from tweet_processor import iter_parsed_chunks
 from tweets_graph import TweetsGraph 
+from time_window import TimeWindow
+from time_window import iter_entries
+from symbol_table import SymbolTable
+from edge_store import EdgeStore
+from output_sinks import LineSink, AverageTextSink, AverageBinarySink
+from timestamp_parser import parse_created_at
+from timestamp_parser import TimestampParser
+from tweet_extractor import extract_tweet_fields
+from sharded_graph import ShardedTweetsGraph
+from graph_analytics import AnalyticsTweetsGraph
+from multi_window_graph import MultiWindowTweetsGraph
+from approx_graph import ApproxTweetsGraph
+from approx_graph import SlidingHyperLogLog
+from approx_graph import hash_hashtag
+from checkpoint import save_checkpoint
+from checkpoint import load_checkpoint
+from line_follower import split_lines
+from line_follower import follow_file
+from line_follower import iter_stream_batches
+from input_readers import open_lines
+from input_readers import iter_line_ranges
+from input_readers import read_line_range
+from input_readers import build_line_index
+from input_readers import offset_for_time
+from tweet_archive import build_archive
+from tweet_archive import TweetArchive
+from instrumentation import PipelineStats
+from instrumentation import instrument_graph
 from nose.tools import ok_ 
+from nose.plugins.skip import SkipTest
 
 tests_dir = os.path.join(repo_root, 'src', 'tests')
 
@@ -32,6 +64,40 @@ class TestTweet(object):
         ok_(tweet.hashtags == set(['spark', 'apache']))
         ok_(tweet.timestamp == 1446141060)
 
+        # `timestamp_ms` is used when it's there
+        tweet = Tweet('Thu Oct 29 17:51:00 +0000 2015', hashtags=[], timestamp_ms='1446141060999')
+        ok_(tweet.timestamp == 1446141060)
+
+
+class TestTimestampParser(object):
+
+    def test_matches_strptime(self):
+        from time import strptime, strftime, gmtime
+        from calendar import timegm
+        fmt = "%a %b %d %H:%M:%S +0000 %Y"
+        for timestamp in range(946684800, 4102444800, 86400 * 7 + 3607):   # 2000 - 2100
+            created_at = strftime(fmt, gmtime(timestamp))
+            ok_(parse_created_at(created_at) == timegm(strptime(created_at, fmt)) == timestamp)
+
+        # leap seconds and lowercase names are left to strptime
+        ok_(parse_created_at('Thu Oct 29 17:51:60 +0000 2015') == 1446141120)
+        ok_(parse_created_at('thu oct 29 17:51:01 +0000 2015') == 1446141061)
+        for bad_created_at in ['Sun Feb 29 17:51:01 +0000 2015', 'Thu Oct 29 24:51:01 +0000 2015',
+                               'Thu Oct 29 17:51:01 +0100 2015', ' Thu Oct 29 17:51:01 +0000 2015']:
+            try:
+                parse_created_at(bad_created_at)
+                ok_(False, bad_created_at)
+            except ValueError:
+                pass
+
+
+    def test_cache(self):
+        parse = TimestampParser(cache_size=4).parse
+        for _ in range(3):
+            for second in range(10):
+                ok_(parse('Thu Oct 29 17:51:0{} +0000 2015'.format(second)) == 1446141060 + second)
+        ok_(parse('Thu Oct 29 17:51:01 +0000 2015', timestamp_ms=1446141999000) == 1446141999)
+
 
 class TestTweetsGraph(object):
     
@@ -126,6 +192,935 @@ class TestTweetsGraph(object):
         assert tweets_test_graph2.graph == self.tweet_graph.graph 
 
 
+    def test_edge_shared_by_newer_tweet_survives_eviction(self):
+        '''an edge that is also part of a newer tweet in the window is kept when
+        the older tweet expires, and only goes away once the newer one does too'''
+
+        self.tweet_graph.update_graph(Tweet('Thu Oct 29 17:51:01 +0000 2015', hashtags=['Spark', 'Apache']))
+        self.tweet_graph.update_graph(Tweet('Thu Oct 29 17:51:30 +0000 2015', hashtags=['Spark', 'Apache', 'Storm']))
+        id_of = self.tweet_graph.edge_store.symbols.get    # (looks up, w/o interning)
+        ok_(self.tweet_graph.edge_store.adjacency[id_of('spark')] == {id_of('apache'): 2, id_of('storm'): 1})
+
+        # first tweet expires, but spark <-> apache is still backed by the second one
+        self.tweet_graph.update_graph(Tweet('Thu Oct 29 17:52:02 +0000 2015', hashtags=[]))
+        ok_(self.tweet_graph.graph == {'apache': set(['spark', 'storm']),
+                                       'spark': set(['apache', 'storm']),
+                                       'storm': set(['apache', 'spark'])})
+        ok_(self.tweet_graph.get_graph_avg_degree_of_all_nodes() == '2.00')
+
+        # and now the second tweet expires as well
+        self.tweet_graph.update_graph(Tweet('Thu Oct 29 17:52:31 +0000 2015', hashtags=[]))
+        ok_(self.tweet_graph.graph == {})
+        ok_(self.tweet_graph.get_graph_avg_degree_of_all_nodes() == '0.00')
+
+
+    def test_running_counters_match_graph(self):
+        '''the node/edge counters kept by the edge store agree with a full scan'''
+
+        testfile = os.path.join(tests_dir, 'test_data', 'data_for_building_hashtag_graph.txt')
+        with open(testfile, 'r') as f:
+            for tweet in f:
+                tweet_dict = json.loads(tweet)
+                hashtags = [hashtag['text'] for hashtag in tweet_dict['entities']['hashtags']]
+                self.tweet_graph.update_graph(Tweet(tweet_dict['created_at'], hashtags))
+
+                graph = self.tweet_graph.graph
+                total_edge_len = sum([len(neighbors) for neighbors in graph.values()])
+                ok_(self.tweet_graph.edge_store.node_count == len(graph))
+                ok_(self.tweet_graph.edge_store.edge_count * 2 == total_edge_len)
+                ok_(self.tweet_graph.get_graph_avg_degree_of_all_nodes(as_float=True) ==
+                    total_edge_len / float(len(graph)))
+        ok_(self.tweet_graph.get_graph_avg_degree_of_all_nodes() == '1.67')
+
+
+class TestTimeWindow(object):
+
+    def test_buckets_expire_whole_seconds(self):
+        window = TimeWindow(time_window=60)
+        ok_(window.advance(100) == [])
+        window.add(100, (1, 2))
+        window.add(100, (3, 4, 5))
+        ok_(window.advance(130) == [])
+        window.add(130, (6, 7))
+        ok_(len(window) == 2)
+
+        # seconds w/o entries don't get a bucket
+        ok_(window.advance(150) == [])
+        ok_(len(window) == 2)
+
+        # not newer, so nothing moves
+        ok_(window.advance(130) == ())
+
+        # 160 - 100 is still w/in the window, 161 - 100 isn't
+        ok_(window.advance(160) == [])
+        expired = window.advance(161)
+        ok_([[tuple(entry) for entry in iter_entries(packed)] for packed in expired] == [[(1, 2), (3, 4, 5)]])
+        ok_([(timestamp, list(packed)) for timestamp, packed in window] == [(130, [2, 6, 7])])
+        ok_([list(packed) for packed in window.advance(1000)] == [[2, 6, 7]])
+        ok_(len(window) == 0)
+
+
+    def test_late_entries_go_into_their_own_second(self):
+        window = TimeWindow(time_window=10)
+        for timestamp in [100, 102, 105]:
+            window.advance(timestamp)
+            window.add(timestamp, [timestamp])
+        window.add(102, [1])    # existing bucket
+        window.add(101, [2])    # new bucket in between
+        window.add(99, [3])     # new oldest bucket
+        ok_([(timestamp, list(packed)) for timestamp, packed in window] ==
+            [(99, [1, 3]), (100, [1, 100]), (101, [1, 2]), (102, [1, 102, 1, 1]), (105, [1, 105])])
+        ok_([list(packed) for packed in window.advance(111)] == [[1, 3], [1, 100]])
+        ok_([list(packed) for packed in window.advance(112)] == [[1, 2]])
+
+
+class TestMultiWindowTweetsGraph(object):
+
+    def test_same_as_one_graph_per_window(self):
+        testfile = os.path.join(tests_dir, 'test_data', 'data_for_building_hashtag_graph.txt')
+        with open(testfile, 'r') as f:
+            tweets = [parsed[0] for parsed in iter_parsed_tweets(f.readlines()) if parsed is not None]
+        tweets.insert(3, Tweet('Thu Oct 29 17:51:40 +0000 2015', ['late', 'tweet']))  # 15 secs late
+        time_windows = (10, 60, 2, 30)
+        multi_graph = MultiWindowTweetsGraph(time_windows, max_lateness=25)
+        graphs = [TweetsGraph(time_window, max_lateness=25) for time_window in time_windows]
+        for tweet in tweets:
+            multi_graph.update_graph(tweet)
+            for tweet_graph in graphs:
+                tweet_graph.update_graph(tweet)
+            ok_(multi_graph.get_graph_avg_degree_of_all_nodes(as_float=True) ==
+                tuple(tweet_graph.get_graph_avg_degree_of_all_nodes(as_float=True) for tweet_graph in graphs))
+            ok_(multi_graph.get_graph_avg_degree_of_all_nodes() ==
+                ' '.join(tweet_graph.get_graph_avg_degree_of_all_nodes() for tweet_graph in graphs))
+            for time_window, tweet_graph in zip(time_windows, graphs):
+                ok_(multi_graph.graph_for(time_window) == tweet_graph.graph)
+        ok_(multi_graph.late_tweets_dropped == [tweet_graph.late_tweets_dropped for tweet_graph in graphs])
+        ok_(multi_graph.late_tweets_merged == [tweet_graph.late_tweets_merged for tweet_graph in graphs])
+        ok_(multi_graph.late_tweets_dropped[2] > 0 and multi_graph.late_tweets_merged[1] > 0)
+
+
+    def test_edges_stored_once(self):
+        multi_graph = MultiWindowTweetsGraph((5, 60))
+        multi_graph.update_graph(Tweet('Thu Mar 24 17:51:10 +0000 2016', ['a', 'b', 'c']))
+        multi_graph.update_graph(Tweet('Thu Mar 24 17:51:20 +0000 2016', ['a', 'b']))
+        ok_(multi_graph.get_graph_avg_degree_of_all_nodes() == '1.00 2.00')
+        ok_(multi_graph.edge_seconds == {('a', 'b'): 1458841880, ('a', 'c'): 1458841870,
+                                         ('b', 'c'): 1458841870})
+        multi_graph.update_graph(Tweet('Thu Mar 24 17:52:15 +0000 2016', ['d', 'e']))
+        ok_(sorted(multi_graph.edge_seconds) == [('a', 'b'), ('d', 'e')])
+        ok_(multi_graph.get_graph_avg_degree_of_all_nodes() == '1.00 1.00')
+
+
+class TestApproxTweetsGraph(object):
+
+    def test_sliding_sketch_same_as_one_of_just_the_window(self):
+        '''the registers kept up to date as the window slides (with out of order
+        items) give the same estimate as a sketch of just the items in the window'''
+
+        import random
+        rnd = random.Random(0)
+        time_window = 20
+        sketch = SlidingHyperLogLog(time_window, precision=8)
+        added = []
+        for i in range(5000):
+            timestamp = 1000 + i // 40
+            if rnd.random() < 0.2:
+                timestamp -= rnd.randint(0, 25)
+            hashes = [hash_hashtag('h{}'.format(rnd.randint(0, 3000))) for _ in range(rnd.randint(1, 4))]
+            sketch.update(hashes, timestamp)
+            added.append((timestamp, hashes))
+            if i % 50 == 0:
+                cutoff = sketch.newest_timestamp - time_window
+                window_sketch = SlidingHyperLogLog(10 ** 9, precision=8)
+                for added_timestamp, added_hashes in added:
+                    if added_timestamp >= cutoff:
+                        window_sketch.update(added_hashes, added_timestamp)
+                ok_(window_sketch.estimate() == sketch.estimate())
+
+
+    def test_estimates_close_to_exact_graph(self):
+        testfile = os.path.join(tests_dir, 'test_data', 'data_for_building_hashtag_graph.txt')
+        with open(testfile, 'r') as f:
+            tweets = [parsed[0] for parsed in iter_parsed_tweets(f.readlines()) if parsed is not None]
+        tweets.insert(3, Tweet('Thu Oct 29 17:51:40 +0000 2015', ['late', 'tweet']))  # 15 secs late
+        tweet_graph = TweetsGraph(max_lateness=10)
+        approx_graph = ApproxTweetsGraph(max_lateness=10)
+        for tweet in tweets:
+            tweet_graph.update_graph(tweet)
+            approx_graph.update_graph(tweet)
+            edge_store = tweet_graph.edge_store
+            ok_(abs(approx_graph.estimated_node_count() - edge_store.node_count) < 0.05 * edge_store.node_count + 0.5)
+            ok_(abs(approx_graph.estimated_edge_count() - edge_store.edge_count) < 0.05 * edge_store.edge_count + 0.5)
+            ok_(approx_graph.get_graph_avg_degree_of_all_nodes() == tweet_graph.get_graph_avg_degree_of_all_nodes())
+            for hashtag, neighbors in tweet_graph.graph.items():
+                ok_(approx_graph.degree_upper_bound(hashtag) >= len(neighbors))
+        ok_(approx_graph.late_tweets_dropped == tweet_graph.late_tweets_dropped == 1)
+        ok_(approx_graph.late_tweets_merged == tweet_graph.late_tweets_merged)
+
+        # everything expires like it does from the graph
+        approx_graph.update_graph(Tweet('Thu Oct 29 18:51:00 +0000 2015', hashtags=[]))
+        ok_(approx_graph.estimated_node_count() == approx_graph.estimated_edge_count() == 0)
+        ok_(approx_graph.get_graph_avg_degree_of_all_nodes() == '0.00')
+
+
+    def test_memory_is_fixed(self):
+        approx_graph = ApproxTweetsGraph(time_window=60)
+        memory_bytes = approx_graph.memory_bytes
+        for i in range(20000):
+            approx_graph.update_graph(Tweet('Thu Oct 29 17:51:{:02d} +0000 2015'.format(i // 400),
+                                            ['a{}'.format(i), 'b{}'.format(i), 'c{}'.format(i)]))
+        ok_(approx_graph.memory_bytes <= memory_bytes + 9 * approx_graph.degree_sketch.width *
+            approx_graph.degree_sketch.depth * 8)
+        ok_(abs(approx_graph.estimated_node_count() - 60000) < 4 * approx_graph.relative_error * 60000)
+        ok_(abs(approx_graph.estimated_edge_count() - 60000) < 4 * approx_graph.relative_error * 60000)
+
+
+class TestGraphAnalytics(object):
+
+    def brute_force(self, graph):
+        '''(tuple) of the degree histogram, component sizes and hashtags by degree of `graph`'''
+
+        histogram = {}
+        for neighbors in graph.values():
+            histogram[len(neighbors)] = histogram.get(len(neighbors), 0) + 1
+        seen, sizes = set(), []
+        for node in graph:
+            if node in seen:
+                continue
+            component, to_visit = set([node]), [node]
+            while to_visit:
+                for neighbor in graph[to_visit.pop()] - component:
+                    component.add(neighbor)
+                    to_visit.append(neighbor)
+            seen |= component
+            sizes.append(len(component))
+        by_degree = sorted(((node, len(nbrs)) for node, nbrs in graph.items()), key=lambda t: (-t[1], t[0]))
+        return histogram, sorted(sizes, reverse=True), by_degree
+
+
+    def test_matches_brute_force_as_tweets_come_and_go(self):
+        testfile = os.path.join(tests_dir, 'test_data', 'data_for_building_hashtag_graph.txt')
+        with open(testfile, 'r') as f:
+            lines = f.readlines()
+        tweet_graph, plain_graph = AnalyticsTweetsGraph(rebuild_interval=0), TweetsGraph()
+        for parsed in iter_parsed_tweets(lines):
+            if parsed is None:
+                continue
+            tweet_graph.update_graph(parsed[0])
+            plain_graph.update_graph(parsed[0])
+            histogram, sizes, by_degree = self.brute_force(tweet_graph.graph)
+            ok_(tweet_graph.degree_histogram() == histogram)
+            ok_(tweet_graph.connected_components() == sizes)
+            ok_(tweet_graph.top_hashtags(3) == by_degree[:3])
+            ok_(tweet_graph.get_graph_avg_degree_of_all_nodes() ==
+                plain_graph.get_graph_avg_degree_of_all_nodes())
+        ok_(tweet_graph.edge_store.components.rebuilds > 0)
+
+
+    def test_components_rebuilt_at_most_once_per_interval(self):
+        tweet_graph = AnalyticsTweetsGraph(time_window=2, rebuild_interval=5)
+        tweet_graph.update_graph(Tweet('Thu Mar 24 17:51:10 +0000 2016', ['a', 'b']))
+        tweet_graph.update_graph(Tweet('Thu Mar 24 17:51:11 +0000 2016', ['c', 'd']))
+        ok_(tweet_graph.connected_components() == [2, 2])
+        tweet_graph.update_graph(Tweet('Thu Mar 24 17:51:13 +0000 2016', ['e', 'f']))
+        ok_(tweet_graph.connected_components() == [2, 2])    # a-b expired; rebuilt
+        tweet_graph.update_graph(Tweet('Thu Mar 24 17:51:14 +0000 2016', ['c', 'e']))
+        # c-d expired and c-e-f joined up, but the last rebuild was < 5 secs ago
+        ok_(tweet_graph.connected_components() == [2, 2])
+        tweet_graph.update_graph(Tweet('Thu Mar 24 17:51:18 +0000 2016', ['g', 'h', 'i']))
+        ok_(tweet_graph.connected_components() == [3])
+        ok_(tweet_graph.edge_store.components.rebuilds == 2)
+
+
+    def test_degree_index_keeps_only_degrees_in_use(self):
+        from graph_analytics import DegreeIndex
+        degrees = DegreeIndex()
+        degrees.move(1, 0, 3)
+        degrees.move(2, 0, 10 ** 9)     # a hub; no step goes through the degrees in between
+        degrees.move(3, 0, 3)
+        ok_(degrees.max_degree == 10 ** 9)
+        ok_([degree for degree, _ in degrees.highest()] == [10 ** 9, 3])
+        degrees.move(2, 10 ** 9, 2)
+        degrees.move(1, 3, 0)
+        ok_(degrees.sorted_degrees == [2, 3] and degrees.max_degree == 3)
+        ok_(list(degrees.highest()) == [(3, set([3])), (2, set([2]))])
+        ok_(degrees.histogram() == {2: 1, 3: 1})
+
+
+class TestSymbolTable(object):
+
+    def test_ids_are_reused(self):
+        symbols = SymbolTable()
+        ok_([symbols.intern(hashtag) for hashtag in ['a', 'b', 'c', 'b']] == [0, 1, 2, 1])
+        symbols.release(1)
+        ok_('b' not in symbols and len(symbols) == 2)
+        ok_(symbols.intern('d') == 1 and symbols.name_of(1) == 'd')
+        ok_(symbols.intern('b') == 3 and symbols.capacity == 4)
+
+
+    def test_graph_releases_ids_of_expired_nodes(self):
+        tweet_graph = TweetsGraph()
+        tweet_graph.update_graph(Tweet('Thu Oct 29 17:51:01 +0000 2015', hashtags=['Spark', 'Apache']))
+        tweet_graph.update_graph(Tweet('Thu Oct 29 17:51:30 +0000 2015', hashtags=['Apache', 'Storm']))
+        ok_(len(tweet_graph.edge_store.symbols) == 3)
+        tweet_graph.update_graph(Tweet('Thu Oct 29 17:52:05 +0000 2015', hashtags=['Flink', 'Hadoop']))
+        # spark is gone and its id went to one of the new hashtags
+        ok_(len(tweet_graph.edge_store.symbols) == 4)
+        ok_(tweet_graph.edge_store.symbols.capacity == 4)
+        ok_(tweet_graph.graph == {'apache': set(['storm']), 'storm': set(['apache']),
+                                  'flink': set(['hadoop']), 'hadoop': set(['flink'])})
+
+
+class TestOutOfOrderTweets(object):
+
+    def test_late_tweets_are_merged_or_dropped(self):
+        tweet_graph = TweetsGraph(time_window=60, max_lateness=10)
+        tweet_graph.update_graph(Tweet('Thu Oct 29 17:51:30 +0000 2015', hashtags=['Spark', 'Apache']))
+        # 5 secs late, so it's merged into the graph
+        tweet_graph.update_graph(Tweet('Thu Oct 29 17:51:25 +0000 2015', hashtags=['Storm', 'Apache']))
+        # 20 secs late, so it's dropped
+        tweet_graph.update_graph(Tweet('Thu Oct 29 17:51:10 +0000 2015', hashtags=['Flink', 'Hadoop']))
+        ok_(tweet_graph.graph == {'apache': set(['spark', 'storm']),
+                                  'spark': set(['apache']),
+                                  'storm': set(['apache'])})
+        ok_(tweet_graph.late_tweets_merged == 1)
+        ok_(tweet_graph.late_tweets_dropped == 1)
+
+        # the late tweet expires once it's more than 60 secs older than the newest
+        tweet_graph.update_graph(Tweet('Thu Oct 29 17:52:26 +0000 2015', hashtags=[]))
+        ok_(tweet_graph.graph == {'apache': set(['spark']), 'spark': set(['apache'])})
+        tweet_graph.update_graph(Tweet('Thu Oct 29 17:52:31 +0000 2015', hashtags=[]))
+        ok_(tweet_graph.graph == {})
+
+
+    def test_max_lateness_defaults_to_time_window(self):
+        tweet_graph = TweetsGraph(time_window=30)
+        ok_(tweet_graph.max_lateness == 30)
+        ok_(TweetsGraph(time_window=30, max_lateness=100).max_lateness == 30)
+
+
+class TestShardedTweetsGraph(object):
+
+    def test_same_averages_as_one_graph(self):
+        tweets = [Tweet('Thu Oct 29 17:51:{:02d} +0000 2015'.format(secs), hashtags=hashtags)
+                  for secs, hashtags in [(1, ['Spark', 'Apache']), (30, ['Apache', 'Hadoop', 'Storm']),
+                                         (50, ['Flink', 'Spark']), (45, ['Storm', 'Apache']),
+                                         (10, ['Kafka', 'Hadoop']), (59, [])]]
+        tweets += [Tweet('Thu Oct 29 17:52:{:02d} +0000 2015'.format(secs), hashtags=hashtags)
+                   for secs, hashtags in [(2, ['Hadoop', 'Kafka', 'Flink']), (31, ['Spark', 'Kafka']),
+                                          (55, ['Apache', 'Spark'])]]
+        tweet_graph = TweetsGraph(time_window=60, max_lateness=10)
+        expected = []
+        for tweet in tweets:
+            tweet_graph.update_graph(tweet)
+            expected.append(tweet_graph.get_graph_avg_degree_of_all_nodes(as_float=True))
+
+        sharded_graph = ShardedTweetsGraph(time_window=60, max_lateness=10, shards=3)
+        try:
+            avg_degrees = sharded_graph.update_graph_batch(tweets[:4])
+            ok_(sharded_graph.graph == {'apache': set(['spark', 'hadoop', 'storm']), 'spark': set(['apache', 'flink']),
+                                        'hadoop': set(['apache', 'storm']), 'storm': set(['apache', 'hadoop']),
+                                        'flink': set(['spark'])})
+            avg_degrees += sharded_graph.update_graph_batch(tweets[4:])
+            ok_(avg_degrees == expected)
+            ok_(sharded_graph.graph == tweet_graph.graph)
+            ok_(sharded_graph.late_tweets_dropped == tweet_graph.late_tweets_dropped == 1)
+            ok_(sharded_graph.get_graph_avg_degree_of_all_nodes() == tweet_graph.get_graph_avg_degree_of_all_nodes())
+        finally:
+            sharded_graph.close()
+
+    def test_batches_without_a_new_newest_timestamp(self):
+        # the shards only get the tweets they own a hashtag of, so one batch of
+        # late (or same second) tweets still has to reach them
+        tweets = [Tweet('Thu Oct 29 17:51:{:02d} +0000 2015'.format(secs), hashtags=hashtags)
+                  for secs, hashtags in [(30, ['Spark', 'Apache']), (20, ['Apache', 'Hadoop']),
+                                         (30, ['Storm', 'Flink', 'Spark']), (29, [])]]
+        tweet_graph = TweetsGraph(time_window=60)
+        expected = []
+        for tweet in tweets:
+            tweet_graph.update_graph(tweet)
+            expected.append(tweet_graph.get_graph_avg_degree_of_all_nodes(as_float=True))
+
+        sharded_graph = ShardedTweetsGraph(time_window=60, shards=2)
+        try:
+            avg_degrees = sharded_graph.update_graph_batch(tweets[:1])
+            avg_degrees += sharded_graph.update_graph_batch(tweets[1:])
+            ok_(avg_degrees == expected)
+            ok_(sharded_graph.graph == tweet_graph.graph)
+            ok_(sharded_graph.late_tweets_merged == tweet_graph.late_tweets_merged == 2)
+        finally:
+            sharded_graph.close()
+
+
+class TestCheckpoint(object):
+
+    def test_restored_graph_continues_like_the_original(self):
+        import tempfile
+        tweets = [Tweet('Thu Oct 29 17:51:{:02d} +0000 2015'.format(secs), hashtags=hashtags)
+                  for secs, hashtags in [(1, ['Spark', 'Apache']), (30, ['Apache', 'Hadoop', 'Storm']),
+                                         (50, ['Flink', 'Spark']), (45, ['Storm', 'Apache'])]]
+        later_tweets = [Tweet('Thu Oct 29 17:52:{:02d} +0000 2015'.format(secs), hashtags=hashtags)
+                        for secs, hashtags in [(2, ['Hadoop', 'Kafka']), (31, []), (55, ['Spark', 'Kafka'])]]
+        tweet_graph = TweetsGraph(time_window=60, max_lateness=10)
+        for tweet in tweets:
+            tweet_graph.update_graph(tweet)
+
+        checkpoint_path = os.path.join(tempfile.mkdtemp(), 'checkpoint.pkl')
+        save_checkpoint(checkpoint_path, tweet_graph, input_offset=1234)
+        restored_graph, processor_state = load_checkpoint(checkpoint_path)
+        ok_(processor_state == {'input_offset': 1234})
+        ok_(restored_graph.graph == tweet_graph.graph)
+        ok_(restored_graph.late_tweets_merged == 1)
+
+        for tweet in later_tweets:
+            tweet_graph.update_graph(tweet)
+            restored_graph.update_graph(tweet)
+            ok_(restored_graph.graph == tweet_graph.graph)
+            ok_(restored_graph.get_graph_avg_degree_of_all_nodes() ==
+                tweet_graph.get_graph_avg_degree_of_all_nodes())
+        ok_(restored_graph.edge_store.symbols.capacity == tweet_graph.edge_store.symbols.capacity)
+
+
+    def test_resume_needs_same_input_and_graph_options(self):
+        import shutil
+        import tempfile
+        from tweet_processor import main, parse_args
+        work_dir = tempfile.mkdtemp()
+        testfile = os.path.join(tests_dir, 'test_data', 'data_for_building_hashtag_graph.txt')
+        tweets_path = os.path.join(work_dir, 'tweets.txt')
+        shutil.copy(testfile, tweets_path)
+        shutil.copy(testfile, os.path.join(work_dir, 'other.txt'))
+        checkpoint_path = os.path.join(work_dir, 'checkpoint.pkl')
+        cwd = os.getcwd()
+        os.chdir(work_dir)  # (the outputs go into ./tweet_output)
+        try:
+            main(parse_args([tweets_path, '--checkpoint', checkpoint_path, '--max-lateness', '10']))
+            for argv in [['other.txt', '--max-lateness', '10'], [tweets_path], [tweets_path, '--max-lateness', '5'],
+                         [tweets_path, '--max-lateness', '10', '--time-windows', '10,60'],
+                         [tweets_path, '--max-lateness', '10', '--approximate']]:
+                try:
+                    main(parse_args(argv + ['--checkpoint', checkpoint_path]))
+                    ok_(False, argv)
+                except SystemExit as exit:
+                    ok_(str(exit.code).startswith('Error: the checkpoint'))
+            main(parse_args([tweets_path, '--checkpoint', checkpoint_path, '--max-lateness', '10']))
+
+            # nor one that doesn't record (all of) the options
+            tweet_graph, processor_state = load_checkpoint(checkpoint_path)
+            del processor_state['graph_options']['approximate']
+            for saved_options in [processor_state['graph_options'], None]:
+                processor_state['graph_options'] = saved_options
+                save_checkpoint(checkpoint_path, tweet_graph, **processor_state)
+                try:
+                    main(parse_args([tweets_path, '--checkpoint', checkpoint_path, '--max-lateness', '10']))
+                    ok_(False, saved_options)
+                except SystemExit as exit:
+                    ok_(str(exit.code).startswith("Error: the checkpoint doesn't say"))
+        finally:
+            os.chdir(cwd)
+
+
+class TestLineFollower(object):
+
+    def test_split_lines_keeps_partial_line(self):
+        ok_(split_lines('a\nb') == (['a\n'], 'b'))
+        ok_(split_lines('c\r\n', 'b') == (['bc\r\n'], ''))
+        ok_(split_lines('no newline yet', 'so ') == ([], 'so no newline yet'))
+
+
+    def test_stream_batches_until_closed(self):
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b'line 1\nline 2\nhalf a ')
+        os.write(write_fd, b'line\nlast line w/o newline')
+        os.close(write_fd)
+        lines = [line for batch in iter_stream_batches(read_fd) for line in batch]
+        os.close(read_fd)
+        ok_(lines == [b'line 1\n', b'line 2\n', b'half a line\n', b'last line w/o newline'])
+
+
+    def test_follow_file_picks_up_appends(self):
+        import tempfile
+        file_path = os.path.join(tempfile.mkdtemp(), 'tweets.txt')
+        with open(file_path, 'wb') as growing_file:
+            growing_file.write(b'skipped\nline 1\nline')
+        appends = [b' 2\nline 3', b'\n']
+
+        def append_more():      # called each time the follower is at the end of the file
+            if appends:
+                with open(file_path, 'ab') as growing_file:
+                    growing_file.write(appends.pop(0))
+
+        lines = []
+        for batch in follow_file(file_path, offset=len('skipped\n'), on_idle=append_more, poll_interval=0.1):
+            lines.extend(batch)
+            if len(lines) == 3:
+                break
+        ok_(lines == [b'line 1\n', b'line 2\n', b'line 3\n'])
+
+
+class TestInputReaders(object):
+
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+        testfile = os.path.join(tests_dir, 'test_data', 'data_for_building_hashtag_graph.txt')
+        with open(testfile, 'rb') as f:
+            self.data = f.read()
+        self.lines = self.data.splitlines(True)
+
+
+    def __write(self, name, data, opener=open):
+        file_path = os.path.join(self.tmp_dir, name)
+        with opener(file_path, 'wb') as f:
+            f.write(data)
+        return file_path
+
+
+    def test_compressed_lines(self):
+        import gzip
+        import bz2
+        gz_path = self.__write('tweets.txt.gz', self.data, gzip.open)
+        ok_(list(open_lines(gz_path)) == self.lines)
+        ok_(list(open_lines(self.__write('tweets.bz2', self.data, bz2.BZ2File))) == self.lines)
+        ok_(list(open_lines(gz_path, offset=len(self.lines[0]))) == self.lines[1:])
+
+        with open(gz_path, 'rb') as f:     # two gzip streams, one after the other
+            ok_(list(open_lines(self.__write('twice.gz', f.read() * 2))) == self.lines * 2)
+
+
+    def test_line_ranges(self):
+        file_path = self.__write('tweets.txt', self.data + b'no newline')
+        ranges = list(iter_line_ranges(file_path, offset=len(self.lines[0]), lines_per_range=2))
+        ok_(len(ranges) > 1)
+        ok_([line for start, end in ranges for line in read_line_range(file_path, start, end)] ==
+            self.lines[1:] + [b'no newline'])
+        ok_(list(open_lines(file_path)) == self.lines + [b'no newline'])
+        ok_(list(open_lines(file_path, offset=len(self.lines[0]))) == self.lines[1:] + [b'no newline'])
+
+        # a file replaced by a shorter one (with another mtime) is mapped again
+        read_line_range(file_path, 0, len(self.data))
+        os.remove(file_path)
+        self.__write('tweets.txt', self.lines[1])
+        os.utime(file_path, (0, 0))
+        ok_(read_line_range(file_path, 0, len(self.data)) == [self.lines[1]])
+
+
+    def test_line_index(self):
+        file_path = self.__write('tweets.txt', self.data)
+        timestamps = [parse_created_at(json.loads(line)['created_at']) for line in self.lines]
+        index = build_line_index(file_path, granularity=1)
+        ok_(offset_for_time(index, 0) == 0)
+        for timestamp in set(timestamps):
+            # nothing from `timestamp` on is skipped
+            first_line = len(self.data[:offset_for_time(index, timestamp)].splitlines())
+            ok_(timestamp in timestamps[first_line:])
+            ok_(all(t < timestamp for t in timestamps[:first_line]))
+
+
+class TestTweetArchive(object):
+
+    def test_graph_at_matches_replay(self):
+        '''the graph rebuilt from the archive for the window ending at each
+        tweet is the same as the graph had when that tweet came in'''
+
+        import tempfile
+        testfile = os.path.join(tests_dir, 'test_data', 'data_for_building_hashtag_graph.txt')
+        archive_dir = os.path.join(tempfile.mkdtemp(), 'archive')
+        meta = build_archive(testfile, archive_dir)
+        archive = TweetArchive(archive_dir)
+        with open(testfile, 'r') as f:
+            parsed_tweets = [parsed for parsed in iter_parsed_tweets(f) if parsed is not None]
+        ok_(meta['tweet_count'] == len(archive) == len(parsed_tweets))
+
+        tweet_graph = TweetsGraph()
+        for tweet, cleaned_text, _, _ in parsed_tweets:
+            tweet_graph.update_graph(tweet)
+            rebuilt_graph = archive.graph_at(tweet.timestamp)
+            ok_(rebuilt_graph.graph == tweet_graph.graph)
+            ok_(rebuilt_graph.get_graph_avg_degree_of_all_nodes() ==
+                tweet_graph.get_graph_avg_degree_of_all_nodes())
+            ok_((tweet.timestamp, sorted(tweet.hashtags), cleaned_text) in
+                [(timestamp, sorted(hashtags), text) for timestamp, hashtags, text in
+                 archive.iter_tweets(tweet.timestamp, tweet.timestamp)])
+        ok_(archive.graph_at(parsed_tweets[0][0].timestamp - 1).graph == {})
+
+
+class TestParsedTweets(object):
+
+    def test_workers_keep_input_order(self):
+        '''parsing in a process pool gives back the same results, in the same order'''
+
+        testfile = os.path.join(tests_dir, 'test_data', 'data_for_building_hashtag_graph.txt')
+        with open(testfile, 'r') as f:
+            lines = f.readlines() + ['{"limit":{"track":10}}\n']
+        with open(os.path.join(tests_dir, 'test_data', 'data_from_instructions_orig.txt'), 'r') as f:
+            lines += f.readlines()
+
+        serial = list(iter_parsed_tweets(lines))
+        pooled = list(iter_parsed_tweets(lines, workers=2, chunk_size=2))
+        ok_(len(serial) == len(lines))
+        ok_(serial[6] is None)
+        ok_(serial[-1][3] is True)     # the last tweet's text has unicode
+        ok_([p and (p[0].timestamp, p[0].hashtags, p[1:]) for p in serial] ==
+            [p and (p[0].timestamp, p[0].hashtags, p[1:]) for p in pooled])
+
+
+class TestInstrumentation(object):
+
+    def test_parse_counts_match_with_workers(self):
+        lines = ['{"limit":{"track":10}}\n', '{"created_at": not json\n']
+        with open(os.path.join(tests_dir, 'test_data', 'data_from_instructions_orig.txt'), 'r') as f:
+            lines += f.readlines()
+
+        serial_stats, pooled_stats = PipelineStats(), PipelineStats()
+        list(iter_parsed_chunks(lines, stats=serial_stats))
+        list(iter_parsed_chunks(lines, workers=2, chunk_size=2, stats=pooled_stats))
+        for stats in (serial_stats, pooled_stats):
+            ok_(stats.counters['lines'] == len(lines))
+            ok_(stats.counters['skipped'] == 1)
+            ok_(stats.counters['errored'] == 1)
+            ok_(stats.counters['parsed'] == len(lines) - 2)
+            ok_(set(stats.timers) == set(['decode', 'clean', 'timestamp', 'build']))
+
+
+    def test_instrumented_graph_counts_evictions(self):
+        stats = PipelineStats()
+        tweet_graph, plain_graph = TweetsGraph(), TweetsGraph()
+        instrument_graph(tweet_graph, stats)
+        tweets = [Tweet('Thu Mar 24 17:51:10 +0000 2016', ['a', 'b', 'c']),
+                  Tweet('Thu Mar 24 17:51:20 +0000 2016', ['a', 'b']),
+                  Tweet('Thu Mar 24 17:52:15 +0000 2016', ['d', 'e'])]
+        for tweet in tweets:
+            tweet_graph.update_graph(tweet)
+            plain_graph.update_graph(tweet)
+            ok_(tweet_graph.get_graph_avg_degree_of_all_nodes() ==
+                plain_graph.get_graph_avg_degree_of_all_nodes())
+        # the first tweet expired, but its a-b edge is still held by the second one
+        ok_(stats.counters['inserted_tweets'] == 3)
+        ok_(stats.counters['evicted_tweets'] == 1)
+        ok_(stats.counters['evicted_edges'] == 2)
+        snapshot = stats.snapshot(tweet_graph)
+        ok_(snapshot['graph']['nodes'] == 4 and snapshot['graph']['window_seconds'] == 2)
+
+        # a checkpoint of it is of the plain graph, without the timing
+        import tempfile
+        checkpoint_path = os.path.join(tempfile.mkdtemp(), 'checkpoint.pkl')
+        save_checkpoint(checkpoint_path, tweet_graph, input_offset=0)
+        restored_graph, _ = load_checkpoint(checkpoint_path)
+        ok_(type(restored_graph.edge_store) is EdgeStore)
+        tweet = Tweet('Thu Mar 24 17:52:20 +0000 2016', ['a', 'e'])
+        restored_graph.update_graph(tweet)
+        plain_graph.update_graph(tweet)
+        ok_(restored_graph.graph == plain_graph.graph)
+        ok_(stats.counters['inserted_tweets'] == 3)
+
+
+class TestAsyncIngest(object):
+
+    def test_connections_feed_one_graph(self):
+        '''tweets sent over a socket end up in the same graph as when read from a file'''
+
+        if sys.version_info < (3, 7):
+            raise SkipTest('the asyncio front end needs python 3.7+')
+        import asyncio
+        import tempfile
+        from async_ingest import IngestServer
+        from async_ingest import send_tweets
+        from async_ingest import query
+
+        testfile = os.path.join(tests_dir, 'test_data', 'data_for_building_hashtag_graph.txt')
+        with open(testfile, 'rb') as f:
+            data = f.read()
+        expected_graph = TweetsGraph()
+        parsed_tweets = [p for p in iter_parsed_tweets(data.decode('utf-8').splitlines(True)) if p is not None]
+        for parsed_tweet in parsed_tweets:
+            expected_graph.update_graph(parsed_tweet[0])
+
+        socket_dir = tempfile.mkdtemp()
+        address = os.path.join(socket_dir, 'tweets.sock')
+        query_address = os.path.join(socket_dir, 'query.sock')
+        server = IngestServer(TweetsGraph())
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(server.start([address], [query_address]))
+            # the first line is split over two reads
+            loop.run_until_complete(send_tweets(address, [data[:100], data[100:]]))
+            while server.stats['tweets_processed'] < len(parsed_tweets):
+                loop.run_until_complete(asyncio.sleep(0.01))
+            replies = loop.run_until_complete(query(query_address, ['avg', 'stats']))
+            loop.run_until_complete(server.stop())
+        finally:
+            loop.close()
+        ok_(server.tweet_graph.graph == expected_graph.graph)
+        ok_(replies[0] == expected_graph.get_graph_avg_degree_of_all_nodes())
+        ok_(json.loads(replies[1])['nodes'] == len(expected_graph.graph))
+
+
+    def test_bad_chunk_stops_the_server(self):
+        '''a chunk that fails part way through being applied stops the server,
+        and leaves the sinks in step with the part of the graph it did apply'''
+
+        if sys.version_info < (3, 7):
+            raise SkipTest('the asyncio front end needs python 3.7+')
+        import io
+        import asyncio
+        import logging
+        import tempfile
+        from async_ingest import IngestServer
+        from async_ingest import send_tweets
+        from async_ingest import open_connection
+
+        class FailOnThirdGraph(TweetsGraph):
+            updates = 0
+            def update_graph(self, tweet):
+                self.updates += 1
+                if self.updates == 3:
+                    raise RuntimeError('bad tweet')
+                return TweetsGraph.update_graph(self, tweet)
+
+        lines = [('{"created_at":"Thu Oct 29 17:51:01 +0000 2015","text":"#' + a + ' #' + b + '",'
+                  '"entities":{"hashtags":[{"text":"' + a + '"},{"text":"' + b + '"}]}}\n')
+                 for a, b in [('a', 'b'), ('a', 'c'), ('d', 'e'), ('f', 'g')]]
+        ft1_file = io.StringIO()
+        ft2_file = io.StringIO()
+        socket_dir = tempfile.mkdtemp()
+        address = os.path.join(socket_dir, 'tweets.sock')
+        server = IngestServer(FailOnThirdGraph(), ft1=LineSink(ft1_file, close_file=False),
+                              ft2=AverageTextSink(LineSink(ft2_file, close_file=False)))
+        loop = asyncio.new_event_loop()
+        logging.disable(logging.CRITICAL)
+        try:
+            loop.run_until_complete(server.start([address]))
+            loop.run_until_complete(send_tweets(address, [''.join(lines).encode('utf-8')]))
+            loop.run_until_complete(asyncio.wait_for(server.wait_failed(), 5))
+            stats = server.stats
+            try:
+                loop.run_until_complete(open_connection(address))
+                refused = False
+            except OSError:
+                refused = True
+            loop.run_until_complete(asyncio.wait_for(server.stop(), 5))
+        finally:
+            logging.disable(logging.NOTSET)
+            loop.close()
+
+        expected_graph = TweetsGraph()
+        expected_avgs = []
+        for parsed_tweet in list(iter_parsed_tweets(lines))[:2]:
+            expected_graph.update_graph(parsed_tweet[0])
+            expected_avgs.append(expected_graph.get_graph_avg_degree_of_all_nodes())
+        ok_(isinstance(server.error, RuntimeError))
+        ok_(stats['failed'] and stats['tweets_processed'] == 0)
+        ok_(refused)
+        ok_(server.tweet_graph.graph == expected_graph.graph)
+        ok_(ft1_file.getvalue().splitlines()[:-2] == ['#a #b (timestamp: Thu Oct 29 17:51:01 +0000 2015)',
+                                                      '#a #c (timestamp: Thu Oct 29 17:51:01 +0000 2015)'])
+        ok_(ft2_file.getvalue().splitlines() == expected_avgs == ['1.00', '1.33'])
+
+
+    def test_idle_flush_and_stop_with_open_connections(self):
+        '''the sinks get flushed while nothing comes in, and stopping doesn't
+        wait on the connections that are still open'''
+
+        if sys.version_info < (3, 7):
+            raise SkipTest('the asyncio front end needs python 3.7+')
+        import io
+        import asyncio
+        import tempfile
+        from async_ingest import IngestServer
+        from async_ingest import send_tweets
+        from async_ingest import open_connection
+
+        line = (b'{"created_at":"Thu Oct 29 17:51:01 +0000 2015","text":"#a #b",'
+                b'"entities":{"hashtags":[{"text":"a"},{"text":"b"}]}}\n')
+        ft1_file = io.StringIO()
+        socket_dir = tempfile.mkdtemp()
+        address = os.path.join(socket_dir, 'tweets.sock')
+        server = IngestServer(TweetsGraph(), ft1=LineSink(ft1_file, flush_bytes=1 << 20, close_file=False),
+                              flush_interval=0.01)
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(server.start([address]))
+            loop.run_until_complete(send_tweets(address, [line]))
+            while server.tweets_processed < 1:
+                loop.run_until_complete(asyncio.sleep(0.01))
+            loop.run_until_complete(asyncio.sleep(0.1))
+            flushed = ft1_file.getvalue()
+            idle = loop.run_until_complete(open_connection(address))
+            loop.run_until_complete(asyncio.wait_for(server.stop(), 5))
+            idle[1].close()
+        finally:
+            loop.close()
+        ok_(server.error is None)
+        ok_(server.tweet_graph.get_graph_avg_degree_of_all_nodes() == '1.00')
+        ok_(flushed.startswith('#a #b (timestamp: '))
+
+
+class TestTweetExtractor(object):
+
+    def test_same_fields_as_json_loads(self):
+        retweet = ('{"created_at":"Thu Oct 29 17:51:01 +0000 2015","id":1,"text":"RT Spark \\u00e9\\n",'
+                   '"retweeted_status":{"created_at":"Thu Oct 29 17:50:00 +0000 2015","text":"x",'
+                   '"entities":{"hashtags":[{"text":"Nested"}]}},'
+                   '"entities":{"hashtags":[{"text":"Spark"}]},"timestamp_ms":"1446141061000"}\n')
+        spaced = '{"text": "a", "created_at": "Thu Oct 29 17:51:01 +0000 2015", "entities": {"hashtags": []}}'
+        # the extended tweet's entities come before the top level ones
+        extended = ('{"created_at":"Thu Oct 29 17:51:01 +0000 2015","id":1,"text":"#A trunc\u2026",'
+                    '"truncated":true,"extended_tweet":{"full_text":"#B #C long",'
+                    '"entities":{"hashtags":[{"text":"B"},{"text":"C"}]}},'
+                    '"entities":{"hashtags":[{"text":"A"}],"symbols":[{"text":"X"}]},'
+                    '"timestamp_ms":"1446141061000"}\n')
+        # json.loads keeps the last of a repeated key
+        repeated_text = ('{"created_at":"Thu Oct 29 17:51:01 +0000 2015","text":"first",'
+                         '"entities":{"hashtags":[{"text":"A"}]},"text":"last"}\n')
+        lines = [retweet, spaced, extended, repeated_text]
+        for testfile in ['data_for_building_hashtag_graph.txt', 'data_from_instructions_orig.txt',
+                         'data_from_instructions_modified_with_more_esc_chars.txt']:
+            with open(os.path.join(tests_dir, 'test_data', testfile), 'r') as f:
+                lines.extend(f.readlines())
+
+        for line in lines:
+            tweet_dict = json.loads(line)
+            hashtags = [hashtag['text'] for hashtag in tweet_dict['entities']['hashtags']]
+            ok_(extract_tweet_fields(line) == (tweet_dict['text'], tweet_dict['created_at'],
+                                               hashtags, tweet_dict.get('timestamp_ms')))
+
+
+    def test_nested_and_repeated_top_level_keys(self):
+        '''keys of nested objects are told apart from the top level ones, and a
+        repeated top level key gives what json.loads (which keeps the last) does'''
+
+        start = '{"created_at":"Thu Oct 29 17:51:01 +0000 2015","id":1,"text":"#A a",'
+        hashtags = '"entities":{"hashtags":[{"text":"A"}]}'
+        user = '"user":{"name":"{ b","created_at":"Wed Oct 28 10:00:00 +0000 2009"}'
+        lines = [
+            # like straight from the api, with the user's own `created_at`
+            start + user + ',' + hashtags + ',"timestamp_ms":"1446141061000"}\n',
+            # a nested `timestamp_ms` after the top level one
+            start + hashtags + ',"timestamp_ms":"1446141061000","place":{"timestamp_ms":"5"}}\n',
+            # one that's only nested
+            start + '"place":{"timestamp_ms":"5"},' + hashtags + '}\n',
+            # not a string
+            start + hashtags + ',"timestamp_ms":1446141061000}\n',
+            # repeated top level keys
+            start + hashtags + ',"timestamp_ms":"1","timestamp_ms":"1446141061000"}\n',
+            start + user + ',' + hashtags + ',"created_at":"Fri Oct 30 17:51:01 +0000 2015"}\n',
+            start + hashtags + ',"text":5}\n',
+            start + hashtags + ',"entities":{"urls":[]}}\n',
+            start + '"entities":{"urls":[]},' + hashtags + '}\n',
+            start + '"entities":{"hashtags":[{"text":"A"}],"hashtags":[]}}\n',
+            # the hashtags are only in a nested object
+            start + '"user":{"name":"}",' + hashtags + '}}\n',
+            # (with escaped quotes around a bracket after them)
+            start + '"user":{' + hashtags + ',"name":"\\"{\\""}}\n',
+        ]
+        for line in lines:
+            try:
+                tweet_dict = json.loads(line)
+                expected = (tweet_dict['text'], tweet_dict['created_at'],
+                            [hashtag['text'] for hashtag in tweet_dict['entities']['hashtags']],
+                            tweet_dict.get('timestamp_ms'))
+            except KeyError:
+                expected = KeyError
+            try:
+                fields = extract_tweet_fields(line)
+            except KeyError:
+                fields = KeyError
+            ok_(fields == expected, line)
+
+
+    def test_non_tweets(self):
+        ok_(extract_tweet_fields('{"limit":{"track":5}}\n') is None)
+        ok_(extract_tweet_fields('{"delete":{"status":{"id":1}}}\n') is None)
+        for bad_line in ['\r\n', '{"created_at":"Thu Oct 29 17:51:01 +0000 2015","text":"trunc',
+                         '{"created_at":"Thu Oct 29 17:51:01 +0000 2015","id":1}']:
+            try:
+                extract_tweet_fields(bad_line)
+                ok_(False, bad_line)
+            except (ValueError, KeyError):
+                pass
+
+
+    def test_utf8_bytes(self):
+        '''lines read in as bytes (as they are under python 3) give the same
+        fields, and a line that isn't utf-8 is just not a usable tweet'''
+
+        line = (u'{"created_at":"Thu Oct 29 17:51:01 +0000 2015","text":"caf\u00e9 #a",'
+                u'"entities":{"hashtags":[{"text":"a"}]}}\n')
+        ok_(extract_tweet_fields(line.encode('utf-8')) == extract_tweet_fields(line))
+        try:
+            extract_tweet_fields(line.encode('latin-1'))
+            ok_(False)
+        except ValueError:
+            pass
+
+
+class TestOutputSinks(object):
+
+    class FakeFile(object):
+        def __init__(self):
+            self.writes = []
+            self.closed = False
+        def write(self, data):
+            self.writes.append(data)
+        def flush(self):
+            pass
+        def close(self):
+            self.closed = True
+
+
+    def test_line_sink_writes_in_large_chunks(self):
+        fileobj = self.FakeFile()
+        sink = LineSink(fileobj, flush_bytes=10)
+        for line in ['abc\n', 'def\n', 'ghi\n', 'j\n']:
+            sink.write(line)
+        ok_(fileobj.writes == ['abc\ndef\nghi\n'])
+        sink.close()
+        ok_(fileobj.writes == ['abc\ndef\nghi\n', 'j\n'] and fileobj.closed)
+
+
+    def test_average_sinks(self):
+        fileobj = self.FakeFile()
+        sink = AverageTextSink(LineSink(fileobj))
+        for avg_deg in [1.0, 2.0, 2.0, 5 / 3.0, 0.0]:
+            sink.write(avg_deg)
+        sink.close()
+        ok_(''.join(fileobj.writes) == '1.00\n2.00\n2.00\n1.67\n0.00\n')
+
+        fileobj = self.FakeFile()
+        sink = AverageBinarySink(fileobj, flush_count=2)
+        for avg_deg in [1.0, 5 / 3.0, 0.5]:
+            sink.write(avg_deg)
+        sink.close()
+        from array import array
+        averages = array('d')
+        (getattr(averages, 'frombytes', None) or averages.fromstring)(b''.join(fileobj.writes))
+        ok_(list(averages) == [1.0, 5 / 3.0, 0.5] and len(fileobj.writes) == 2)
+
+        fileobj = self.FakeFile()
+        sink = AverageTextSink(LineSink(fileobj), columns=2)
+        for avg_degs in [(1.0, 2.0), (1.0, 2.0), (5 / 3.0, 0.0)]:
+            sink.write(avg_degs)
+        sink.close()
+        ok_(''.join(fileobj.writes) == '1.00 2.00\n1.00 2.00\n1.67 0.00\n')
+
+
+def test_clean_texts_matches_clean_text():
+    texts = [u'Spark Summit East\tthis week! #Spark', u'Jo\xe3o Pessoa\n', u'', u'#Apache',
+             u'caf\xe9', u'ascii only']
+    cleaned_txts, contained_unicode, unicode_count = clean_texts(texts)
+    ok_(cleaned_txts == [clean_text(text) for text in texts])
+    ok_(contained_unicode == [False, True, False, False, True, False])
+    ok_(unicode_count == 2)
+
+    # a NUL char in a text, or a text that isn't a str, falls back to one at a time
+    cleaned_txts, contained_unicode, unicode_count = clean_texts([u'a\x00b\xe9', None, u'c'])
+    ok_(cleaned_txts == [u'a\x00b', None, u'c'])
+    ok_(contained_unicode == [True, False, False])
+    ok_(unicode_count == 1)
+    ok_(clean_texts([]) == ([], [], 0))
+
+
 def check_clean_text(testfile, tweet1_correct, tweet2_correct):
 
     with open(testfile, 'r') as testfile: 
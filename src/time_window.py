@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  `TimeWindow` keeps the entries (eg. a tweet's hashtag ids) that
+#           fall inside a rolling time window, grouped into one bucket per
+#           second, so that whole seconds can be expired at once.
+#----------------------------------------------------------------
+
+from collections import deque
+from array import array
+
+# (python 2 arrays only have `tostring` / `fromstring`, python 3.9+ only these)
+_array_bytes = getattr(array, 'tobytes', None) or array.tostring
+_array_from_bytes = getattr(array, 'frombytes', None) or array.fromstring
+
+
+def iter_entries(packed):
+    '''Yields each entry (an array of ints) from a bucket's packed array,
+    in the order they were added (see `TimeWindow`).'''
+
+    i = 0
+    end = len(packed)
+    while i < end:
+        entry_end = i + 1 + packed[i]
+        yield packed[i + 1:entry_end]
+        i = entry_end
+
+
+class _Bucket(object):
+    '''All entries that were added for a single (int) timestamp, packed into
+    a single array as [len(entry1), *entry1, len(entry2), *entry2, ...]'''
+
+    __slots__ = ('timestamp', 'packed')
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.packed = array('i')
+
+
+class TimeWindow(object):
+    """Sliding time window made of a deque of per-second buckets (oldest on
+    the left, newest on the right).
+
+    Only seconds that actually received an entry get a bucket, so seconds
+    without any hashtags cost nothing, and expiring a second is a single
+    `popleft` of its bucket (amortized O(1), no copying of the window).
+    Entries are short sequences of ints (eg. a tweet's interned hashtag ids),
+    and all of the entries for one second are packed into a single int array
+    rather than being kept as a python object each.
+        eg.
+            window = TimeWindow(60)
+            for packed in window.advance(timestamp):
+                for hashtag_ids in iter_entries(packed):
+                    ...
+            window.add(timestamp, hashtag_ids)
+
+
+    Attributes
+    ----------
+    time_window: (int) how long back (in seconds) entries are kept relative
+        to the newest timestamp seen; an entry is expired once
+        `newest_timestamp - its_timestamp > time_window`
+
+    newest_timestamp: (int) most recent timestamp passed to `advance`
+        (None until the first call)
+
+
+    Notes
+    -----
+    Entries don't need to arrive in timestamp order, but `add` doesn't check
+    whether a late entry is still inside the window; that's up to the caller
+    (see `max_lateness` in `TweetsGraph`)."""
+
+
+    def __init__(self, time_window=60):
+        self.time_window = time_window
+        self.newest_timestamp = None
+        self.__buckets = deque()
+        self.__buckets_by_timestamp = {}
+
+
+    def __len__(self):
+        '''Number of (non-empty) seconds currently in the window'''
+        return len(self.__buckets)
+
+
+    def advance(self, timestamp):
+        '''Moves the window forward to `timestamp` (if it's newer than anything
+        seen so far) and pops every bucket that has fallen out of the window.
+
+
+        Parameters
+        ----------
+        timestamp:  epoch based time (int)
+
+
+        Returns
+        -------
+        (list) with the packed (array) of entries of each expired bucket, oldest
+        first (see `iter_entries`); an empty (tuple) when the window didn't move
+        '''
+
+        newest_timestamp = self.newest_timestamp
+        if newest_timestamp is not None and timestamp <= newest_timestamp:
+            return ()
+        self.newest_timestamp = timestamp
+
+        buckets = self.__buckets
+        oldest_allowed = timestamp - self.time_window
+        expired = []
+        while buckets and buckets[0].timestamp < oldest_allowed:
+            bucket = buckets.popleft()
+            del self.__buckets_by_timestamp[bucket.timestamp]
+            expired.append(bucket.packed)
+        return expired
+
+
+    def add(self, timestamp, entry):
+        '''Adds `entry` into the bucket for `timestamp` (creating the bucket
+        if this is the first entry for that second).  A late entry (older than
+        the newest bucket) is merged into its own second's bucket, so that it's
+        expired at the right time.
+
+
+        Parameters
+        ----------
+        timestamp:  epoch based time (int)
+        entry:      (sequence) of ints to keep until `timestamp` leaves the window
+        '''
+
+        packed = self.__bucket_for(timestamp).packed
+        packed.append(len(entry))
+        packed.extend(entry)
+
+
+    def __bucket_for(self, timestamp):
+        '''Returns the bucket for `timestamp`, adding a new one if needed'''
+
+        bucket = self.__buckets_by_timestamp.get(timestamp)
+        if bucket is not None:
+            return bucket
+
+        bucket = _Bucket(timestamp)
+        self.__buckets_by_timestamp[timestamp] = bucket
+        buckets = self.__buckets
+        if not buckets or buckets[-1].timestamp < timestamp:
+            buckets.append(bucket)
+            return bucket
+
+        # a late entry for a second that doesn't have a bucket yet; they're usually
+        # only a few seconds behind, so find its place from the newest end and slot
+        # the new bucket in before the newer ones
+        newer_buckets = 0
+        for newer_bucket in reversed(buckets):
+            if newer_bucket.timestamp < timestamp:
+                break
+            newer_buckets += 1
+        buckets.rotate(newer_buckets)
+        buckets.append(bucket)
+        buckets.rotate(-newer_buckets)
+        return bucket
+
+
+    def __getstate__(self):
+        '''Compact state for pickling (eg. see `checkpoint.py`); each bucket's
+        packed array is stored as its raw bytes'''
+
+        return {'time_window': self.time_window,
+                'newest_timestamp': self.newest_timestamp,
+                'buckets': [(bucket.timestamp, _array_bytes(bucket.packed)) for bucket in self.__buckets]}
+
+
+    def __setstate__(self, state):
+        self.time_window = state['time_window']
+        self.newest_timestamp = state['newest_timestamp']
+        self.__buckets = deque()
+        self.__buckets_by_timestamp = {}
+        for timestamp, packed_bytes in state['buckets']:
+            bucket = _Bucket(timestamp)
+            _array_from_bytes(bucket.packed, packed_bytes)
+            self.__buckets.append(bucket)
+            self.__buckets_by_timestamp[timestamp] = bucket
+
+
+    def __iter__(self):
+        '''Yields (timestamp, packed entries) for each bucket, oldest first'''
+
+        for bucket in self.__buckets:
+            yield bucket.timestamp, bucket.packed
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  Turns a tweet's `created_at` (or `timestamp_ms`) field into an
+#           epoch based timestamp, without going through `time.strptime`
+#           for every tweet.
+#----------------------------------------------------------------
+
+from time import strptime
+from calendar import timegm
+
+
+CREATED_AT_FORMAT = "%a %b %d %H:%M:%S +0000 %Y"
+
+_WEEKDAYS = frozenset(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'])
+_MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+           'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+_DAYS_IN_MONTH = [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+_DAYS_BEFORE_MONTH = [0, 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334]
+
+
+def _is_leap(year):
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+def _days_before_year(year):
+    '''Number of days from 1970-01-01 to Jan 1st of `year`'''
+    y = year - 1
+    return y * 365 + y // 4 - y // 100 + y // 400 - 719162
+
+
+def parse_created_at(created_at):
+    '''Converts a `created_at` (str) like "Thu Oct 29 17:51:01 +0000 2015"
+    into epoch based time (int).
+
+    The fields are sliced out of their fixed positions and the date is worked
+    out from a table of month offsets; anything that doesn't look exactly like
+    that format (extra whitespace, lowercase names, out of range fields, ...)
+    is handed to `strptime` instead, so the results (and errors) are always the
+    same as `timegm(strptime(created_at, CREATED_AT_FORMAT))`.
+    '''
+
+    if (len(created_at) == 30 and created_at[19:26] == ' +0000 ' and
+            created_at[3] == ' ' and created_at[7] == ' ' and created_at[10] == ' ' and
+            created_at[13] == ':' and created_at[16] == ':' and
+            created_at[:3] in _WEEKDAYS):
+        month = _MONTHS.get(created_at[4:7])
+        day, hour, minute, second, year = (created_at[8:10], created_at[11:13], created_at[14:16],
+                                           created_at[17:19], created_at[26:30])
+        if (month and day.isdigit() and hour.isdigit() and minute.isdigit() and
+                second.isdigit() and year.isdigit()):
+            day, hour, minute, second, year = int(day), int(hour), int(minute), int(second), int(year)
+            days_in_month = _DAYS_IN_MONTH[month] + (month == 2 and _is_leap(year))
+            if 1 <= day <= days_in_month and hour < 24 and minute < 60 and second < 60:
+                days = (_days_before_year(year) + _DAYS_BEFORE_MONTH[month] +
+                        (month > 2 and _is_leap(year)) + day - 1)
+                return ((days * 24 + hour) * 60 + minute) * 60 + second
+
+    return timegm(strptime(created_at, CREATED_AT_FORMAT))
+
+
+def parse_timestamp_ms(timestamp_ms):
+    '''Converts a `timestamp_ms` field (str or int of epoch milliseconds) into
+    epoch based time (int) in seconds'''
+
+    return int(timestamp_ms) // 1000
+
+
+class TimestampParser(object):
+    """Parses tweet timestamps, remembering the most recently seen `created_at`
+    strings (tweets arrive many per second, all with the same `created_at`).
+        eg.
+            parse = TimestampParser().parse
+            timestamp = parse(created_at)
+
+
+    Attributes
+    ----------
+    cache_size: (int) how many distinct `created_at` strings are remembered
+        (roughly; Default: 256)
+
+
+    Notes
+    -----
+    The cache is a cheap approximation of an LRU: new strings go into a "recent"
+    dict, and once that fills up it becomes the "old" dict (and the previous old
+    one is thrown away); a hit in the old dict gets moved back into the recent one.
+    So lookups and inserts are a dict access or two, and anything seen within the
+    last `cache_size / 2` distinct strings is always still there."""
+
+
+    def __init__(self, cache_size=256):
+        self.cache_size = cache_size
+        self.__generation_size = max(1, cache_size // 2)
+        self.__recent = {}
+        self.__old = {}
+
+
+    def parse(self, created_at=None, timestamp_ms=None):
+        '''Returns the epoch based time (int) for a tweet.
+
+
+        Parameters
+        ----------
+        created_at:    `created_at` field (str) obtained from the Twitter api json output
+        timestamp_ms:  `timestamp_ms` field (str or int) obtained from the Twitter api
+            json output; when it's given it's used instead of `created_at`
+        '''
+
+        if timestamp_ms is not None:
+            return parse_timestamp_ms(timestamp_ms)
+
+        timestamp = self.__recent.get(created_at)
+        if timestamp is None:
+            timestamp = self.__old.get(created_at)
+            if timestamp is None:
+                timestamp = parse_created_at(created_at)
+            if len(self.__recent) >= self.__generation_size:
+                self.__old = self.__recent
+                self.__recent = {}
+            self.__recent[created_at] = timestamp
+        return timestamp
+
+
+# shared (per process) parser used by `Tweet`
+parse_timestamp = TimestampParser().parse
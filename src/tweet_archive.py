@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  Converts a file of tweets into a columnar archive (timestamps,
+#           interned hashtag ids and cleaned texts, with an index of where
+#           each second starts), from which the graph of any time window can
+#           be rebuilt by reading only that window's tweets.
+#
+#   $ python ./src/tweet_archive.py build ./tweet_input/tweets.txt ./tweet_archive
+#   $ python ./src/tweet_archive.py graph ./tweet_archive --at 2015-10-29T17:52:00 --top 10
+#----------------------------------------------------------------
+
+import os
+import sys
+import json
+import argparse
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
+from os import path
+
+from symbol_table import SymbolTable
+from tweets_graph import TweetsGraph
+from tweets_graph import format_avg_degree
+from graph_analytics import AnalyticsTweetsGraph
+from tweet_processor import iter_parsed_file_chunks
+from tweet_processor import parse_start_time
+
+
+ARCHIVE_VERSION = 1
+
+# name -> array typecode of each column, stored in native byte order as
+# '<name>.col' (the `*_starts` columns have one more entry than there are
+# seconds / tweets, so that the entries of row i are [starts[i], starts[i + 1]))
+COLUMNS = {'seconds': 'i',          # each second (epoch) that has tweets, in order
+           'second_starts': 'L',    # row of the first tweet of each second
+           'hashtag_starts': 'L',   # offset of each tweet's first id in `hashtag_ids`
+           'hashtag_ids': 'i',      # ids of the tweets' hashtags (into 'hashtags.json')
+           'text_starts': 'L'}      # byte offset of each tweet's text in 'texts.txt'
+
+
+class ArchiveWriter(object):
+    """Writes tweets into a new archive in `archive_dir`, one row per tweet.
+        eg.
+            writer = ArchiveWriter('./tweet_archive')
+            writer.add(tweet, cleaned_text)
+            writer.close()
+
+
+    Attributes
+    ----------
+    max_lateness: (int) how far (in seconds) a tweet may be behind the newest
+        one added and still go into the archive (Default: 60); a later one is
+        dropped and counted in `late_tweets_dropped`, like in a `TweetsGraph`
+
+    tweet_count: (int) number of tweets (rows) in the archive so far
+
+
+    Notes
+    -----
+    The rows are stored in timestamp order (and in the order they were added
+    within each second), so the tweets of any range of seconds are one run of
+    rows.  Tweets are held back until the newest timestamp is more than
+    `max_lateness` past their second, which is when that second gets written
+    out; out of order tweets within that are slotted into their own second.
+    A tweet's hashtags are stored as ids that are interned once for the whole
+    archive (and never released), and the texts are stored back to back in
+    'texts.txt', utf-8 encoded, with an empty text for a tweet whose text
+    couldn't be used.  'meta.json' is written last, by `close`, so an archive
+    that wasn't finished can't be opened."""
+
+
+    def __init__(self, archive_dir, max_lateness=60):
+        self.archive_dir = archive_dir
+        self.max_lateness = max_lateness
+        self.tweet_count = 0
+        self.late_tweets_dropped = 0
+        self.newest_timestamp = None
+        self.__symbols = SymbolTable()
+        self.__pending = {}             # second -> (list) of (hashtag ids, text) rows
+        self.__written_through = None   # newest second written out
+        self.__hashtag_count = 0
+        self.__text_bytes = 0
+        if not path.isdir(archive_dir):
+            os.makedirs(archive_dir)
+        self.__files = dict((name, open(path.join(archive_dir, name + '.col'), 'wb')) for name in COLUMNS)
+        self.__texts_file = open(path.join(archive_dir, 'texts.txt'), 'wb')
+        for name in ('hashtag_starts', 'text_starts'):
+            array(COLUMNS[name], [0]).tofile(self.__files[name])
+
+
+    def add(self, tweet, cleaned_text):
+        '''Adds `tweet` (an instance of class Tweet, see `tweet_processor.py`)
+        and its `cleaned_text` (str, or None)'''
+
+        timestamp = tweet.timestamp
+        if self.__written_through is not None and timestamp <= self.__written_through:
+            self.late_tweets_dropped += 1
+            return
+        intern = self.__symbols.intern
+        hashtag_ids = [intern(hashtag) for hashtag in tweet.hashtags]
+        if cleaned_text is None:
+            cleaned_text = b''
+        elif not isinstance(cleaned_text, bytes):
+            cleaned_text = cleaned_text.encode('utf-8')
+        rows = self.__pending.get(timestamp)
+        if rows is None:
+            rows = self.__pending[timestamp] = []
+        rows.append((hashtag_ids, cleaned_text))
+
+        if self.newest_timestamp is None or timestamp > self.newest_timestamp:
+            self.newest_timestamp = timestamp
+            self.__write_seconds(timestamp - self.max_lateness)
+
+
+    def __write_seconds(self, before):
+        '''Writes out every pending second older than `before`, oldest first'''
+
+        seconds = sorted(second for second in self.__pending if second < before)
+        if not seconds:
+            return
+        second_starts = array(COLUMNS['second_starts'])
+        hashtag_starts = array(COLUMNS['hashtag_starts'])
+        hashtag_ids = array(COLUMNS['hashtag_ids'])
+        text_starts = array(COLUMNS['text_starts'])
+        texts = []
+        for second in seconds:
+            second_starts.append(self.tweet_count)
+            for row_hashtag_ids, text in self.__pending.pop(second):
+                hashtag_ids.extend(row_hashtag_ids)
+                self.__hashtag_count += len(row_hashtag_ids)
+                hashtag_starts.append(self.__hashtag_count)
+                texts.append(text)
+                self.__text_bytes += len(text)
+                text_starts.append(self.__text_bytes)
+                self.tweet_count += 1
+        self.__written_through = seconds[-1]
+
+        files = self.__files
+        array(COLUMNS['seconds'], seconds).tofile(files['seconds'])
+        second_starts.tofile(files['second_starts'])
+        hashtag_starts.tofile(files['hashtag_starts'])
+        hashtag_ids.tofile(files['hashtag_ids'])
+        text_starts.tofile(files['text_starts'])
+        self.__texts_file.write(b''.join(texts))
+
+
+    def close(self):
+        '''Writes out the rest of the tweets, the hashtags and 'meta.json' '''
+
+        if self.__pending:
+            self.__write_seconds(max(self.__pending) + 1)
+        array(COLUMNS['second_starts'], [self.tweet_count]).tofile(self.__files['second_starts'])
+        for column_file in self.__files.values():
+            column_file.close()
+        self.__texts_file.close()
+
+        symbols = self.__symbols
+        with open(path.join(self.archive_dir, 'hashtags.json'), 'w') as hashtags_file:
+            json.dump([symbols.name_of(hashtag_id) for hashtag_id in range(symbols.capacity)], hashtags_file)
+        meta = {'version': ARCHIVE_VERSION,
+                'byteorder': sys.byteorder,
+                'columns': dict((name, [typecode, array(typecode).itemsize])
+                                for name, typecode in COLUMNS.items()),
+                'tweet_count': self.tweet_count,
+                'max_lateness': self.max_lateness,
+                'late_tweets_dropped': self.late_tweets_dropped}
+        with open(path.join(self.archive_dir, 'meta.json'), 'w') as meta_file:
+            json.dump(meta, meta_file, indent=2, sort_keys=True)
+        return meta
+
+
+
+def build_archive(tweets_path, archive_dir, max_lateness=60, workers=1, chunk_size=1000):
+    '''Reads the file of tweets at `tweets_path` (compressed or not, see
+    `input_readers.py`) into a new archive in `archive_dir` (see `ArchiveWriter`)
+    and returns its (dict) of meta data; `workers` and `chunk_size` are the same
+    as for `tweet_processor.py`'''
+
+    writer = ArchiveWriter(archive_dir, max_lateness)
+    for parsed_chunk, _ in iter_parsed_file_chunks(tweets_path, 0, workers, chunk_size):
+        for parsed_tweet in parsed_chunk:
+            if parsed_tweet is not None:
+                writer.add(parsed_tweet[0], parsed_tweet[1])
+    return writer.close()
+
+
+
+class _ArchivedTweet(object):
+    '''Just enough of a `Tweet` for `TweetsGraph.update_graph`'''
+
+    __slots__ = ('timestamp', 'hashtags')
+
+    def __init__(self, timestamp, hashtags):
+        self.timestamp = timestamp
+        self.hashtags = hashtags
+
+
+
+class TweetArchive(object):
+    """Reads an archive written by `ArchiveWriter` (or `build_archive`).
+        eg.
+            archive = TweetArchive('./tweet_archive')
+            tweet_graph = archive.graph_at(timestamp)
+            tweet_graph.get_graph_avg_degree_of_all_nodes()
+            for timestamp, hashtags, text in archive.iter_tweets(start, end):
+                ...
+
+
+    Methods
+    -------
+    graph_at: rebuilds the graph of the time window ending at a given time
+
+    iter_tweets: the tweets of a range of seconds
+
+    rows_between: which rows hold the tweets of a range of seconds
+
+
+    Attributes
+    ----------
+    meta: (dict) from 'meta.json' (see `ArchiveWriter.close`)
+
+    hashtags: (list) of the hashtags, by their id in the archive
+
+    seconds: (array) of each second that has tweets in it, in order
+
+
+    Notes
+    -----
+    Only the per second index (and the hashtags) are read in up front; the
+    rest of the columns are read just for the rows that are asked for, so
+    rebuilding a window costs the same however long the archive is."""
+
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        with open(path.join(archive_dir, 'meta.json'), 'r') as meta_file:
+            self.meta = json.load(meta_file)
+        if self.meta.get('version') != ARCHIVE_VERSION:
+            raise ValueError('unsupported archive version: {}'.format(self.meta.get('version')))
+        for name, (typecode, itemsize) in self.meta['columns'].items():
+            if array(typecode).itemsize != itemsize:
+                raise ValueError("the archive's {} column has {} byte items, but they're {} bytes "
+                                 "here".format(name, itemsize, array(typecode).itemsize))
+        with open(path.join(archive_dir, 'hashtags.json'), 'r') as hashtags_file:
+            self.hashtags = json.load(hashtags_file)
+        if bytes is str:   # python 2: the same (str) hashtags as the tweets have
+            self.hashtags = [hashtag.encode('utf-8') for hashtag in self.hashtags]
+        self.seconds = self.__read_column('seconds')
+        self.__second_starts = self.__read_column('second_starts')
+
+
+    def __len__(self):
+        return self.meta['tweet_count']
+
+
+    def __read_column(self, name, start=0, stop=None):
+        '''(array) of the entries [start, stop) of column `name` (all from
+        `start` on if `stop` is None)'''
+
+        typecode = self.meta['columns'][name][0]
+        column = array(typecode)
+        column_path = path.join(self.archive_dir, name + '.col')
+        if stop is None:
+            stop = path.getsize(column_path) // column.itemsize
+        with open(column_path, 'rb') as column_file:
+            column_file.seek(start * column.itemsize)
+            column.fromfile(column_file, stop - start)
+        if self.meta['byteorder'] != sys.byteorder:
+            column.byteswap()
+        return column
+
+
+    def rows_between(self, start, end):
+        '''Returns the (tuple) of the first row and one past the last row that
+        hold the tweets from second `start` through second `end` (inclusive)'''
+
+        first_second = bisect_left(self.seconds, start)
+        last_second = bisect_right(self.seconds, end)
+        if first_second >= last_second:
+            return 0, 0
+        return self.__second_starts[first_second], self.__second_starts[last_second]
+
+
+    def __iter_rows(self, start, end, with_texts):
+        first_row, last_row = self.rows_between(start, end)
+        if first_row == last_row:
+            return
+        # the timestamp of each row (from the per second index)
+        first_second = bisect_left(self.seconds, start)
+        second_starts = self.__second_starts
+        hashtag_starts = self.__read_column('hashtag_starts', first_row, last_row + 1)
+        hashtag_ids = self.__read_column('hashtag_ids', hashtag_starts[0], hashtag_starts[-1])
+        if with_texts:
+            text_starts = self.__read_column('text_starts', first_row, last_row + 1)
+            with open(path.join(self.archive_dir, 'texts.txt'), 'rb') as texts_file:
+                texts_file.seek(text_starts[0])
+                texts = texts_file.read(text_starts[-1] - text_starts[0])
+
+        names = self.hashtags
+        base = hashtag_starts[0]
+        second = first_second
+        for row in range(first_row, last_row):
+            while second_starts[second + 1] <= row:
+                second += 1
+            i = row - first_row
+            hashtags = [names[hashtag_id] for hashtag_id in
+                        hashtag_ids[hashtag_starts[i] - base:hashtag_starts[i + 1] - base]]
+            if with_texts:
+                text = texts[text_starts[i] - text_starts[0]:text_starts[i + 1] - text_starts[0]]
+                if bytes is not str:
+                    text = text.decode('utf-8')
+                yield self.seconds[second], hashtags, text
+            else:
+                yield self.seconds[second], hashtags
+
+
+    def iter_tweets(self, start, end):
+        '''Yields (timestamp (int), (list) of hashtags, cleaned text (str)) for
+        each tweet from second `start` through second `end` (inclusive), in
+        timestamp order; the hashtags are the ones that went into the graph
+        (so there are none for a tweet with less than two)'''
+
+        return self.__iter_rows(start, end, with_texts=True)
+
+
+    def graph_at(self, timestamp, time_window=60, tweet_graph=None):
+        '''Returns a graph of the tweets in the time window that ends at
+        `timestamp`, ie. from `timestamp - time_window` through `timestamp`.
+
+
+        Parameters
+        ----------
+        timestamp:    (int) epoch secs at which the window ends
+        time_window:  (int) secs (Default: 60)
+        tweet_graph:  an empty graph to fill in (eg. an `AnalyticsTweetsGraph`);
+            by default a new `TweetsGraph(time_window)`
+
+
+        Notes
+        -----
+        For tweets that came in in order, this is exactly the graph that
+        `tweet_processor.py` had after the last tweet at or before `timestamp`.
+        With out of order tweets, it's the graph as if they had all arrived in
+        time (ie. late tweets that were still within the archive's `max_lateness`
+        are in it, even when they arrived after the window had moved past them).
+        '''
+
+        if tweet_graph is None:
+            tweet_graph = TweetsGraph(time_window)
+        update_graph = tweet_graph.update_graph
+        for row_timestamp, hashtags in self.__iter_rows(timestamp - time_window, timestamp, with_texts=False):
+            if hashtags:
+                update_graph(_ArchivedTweet(row_timestamp, set(hashtags)))
+        return tweet_graph
+
+
+
+def parse_args(argv):
+    '''Parses the command line options for running this script directly'''
+
+    parser = argparse.ArgumentParser(description='Builds a columnar archive from a file of tweets, '
+                                                 'and rebuilds the graph at any time from it.')
+    commands = parser.add_subparsers(dest='command')
+    build = commands.add_parser('build', help='convert a file of tweets into an archive')
+    build.add_argument('tweets_input', help='path to a file of tweets (can be compressed)')
+    build.add_argument('archive_dir', help='directory to write the archive into')
+    build.add_argument('--max-lateness', type=int, default=60, metavar='SECS',
+                       help='how far behind the newest tweet (in seconds) an out of order '
+                            'tweet may be and still be archived (default: 60)')
+    build.add_argument('--workers', type=int, default=1, metavar='N',
+                       help='number of processes used to decode and clean the tweets (default: 1)')
+    build.add_argument('--chunk-size', type=int, default=1000, metavar='LINES')
+
+    graph = commands.add_parser('graph', help='rebuild the graph of the window ending at a given time')
+    graph.add_argument('archive_dir', help='directory of an archive')
+    graph.add_argument('--at', required=True, metavar='TIME',
+                       help='end of the window (epoch secs, or YYYY-MM-DDTHH:MM:SS in UTC)')
+    graph.add_argument('--time-window', type=int, default=60, metavar='SECS',
+                       help='length of the window (default: 60)')
+    graph.add_argument('--top', type=int, default=0, metavar='K',
+                       help='also list the K hashtags with the highest degree')
+    args = parser.parse_args(argv)
+    if args.command == 'graph':
+        try:
+            args.at = parse_start_time(args.at)
+        except ValueError:
+            parser.error('--at needs epoch secs or YYYY-MM-DDTHH:MM:SS')
+    return args
+
+
+def main(args):
+    if args.command == 'build':
+        meta = build_archive(args.tweets_input, args.archive_dir, args.max_lateness,
+                             args.workers, args.chunk_size)
+        sys.stdout.write('{} tweets archived in {} ({} too late)\n'.format(
+            meta['tweet_count'], args.archive_dir, meta['late_tweets_dropped']))
+        return
+
+    archive = TweetArchive(args.archive_dir)
+    tweet_graph = AnalyticsTweetsGraph(args.time_window) if args.top else None
+    tweet_graph = archive.graph_at(args.at, args.time_window, tweet_graph)
+    first_row, last_row = archive.rows_between(args.at - args.time_window, args.at)
+    edge_store = tweet_graph.edge_store
+    sys.stdout.write('{} tweets, {} hashtags, {} edges, average degree {}\n'.format(
+        last_row - first_row, edge_store.node_count, edge_store.degree_sum // 2,
+        format_avg_degree(edge_store.avg_degree())))
+    if args.top:
+        for hashtag, degree in tweet_graph.top_hashtags(args.top):
+            sys.stdout.write('  {:<30} {}\n'.format(hashtag, degree))
+
+
+
+if __name__ == '__main__':
+    main(parse_args(sys.argv[1:]))
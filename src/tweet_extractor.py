@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------
+# Purpose:  Pulls only the fields that are needed (`text`, `created_at`,
+#           `entities.hashtags` and `timestamp_ms`) out of a line of Twitter
+#           api json output, without decoding the rest of the tweet.
+#----------------------------------------------------------------
+
+import re
+from string import ascii_letters, digits
+from json import loads as json_loads
+from json import JSONDecoder
+
+
+_decoder = JSONDecoder()
+
+# under python 3 the lines are read in as bytes (see `input_readers.py`) and only
+# decoded here, one at a time; under python 2 a (byte) str is used as is
+_DECODE_LINES = bytes is not str
+
+TWEET_PREFIX = '{"created_at":"'
+
+# the other kinds of messages that show up in the streaming api output; see
+# https://dev.twitter.com/streaming/overview/messages-types
+NON_TWEET_PREFIXES = ('{"limit":', '{"delete":', '{"scrub_geo":', '{"status_withheld":',
+                      '{"user_withheld":', '{"disconnect":', '{"warning":', '{"event":',
+                      '{"friends":', '{"friends_str":', '{"control":', '{"for_user":')
+
+_TEXT_KEY = '"text":"'
+_CREATED_AT_KEY = '"created_at":'
+_ENTITIES_KEY = '"entities":'
+_HASHTAGS_KEY = '"hashtags":'
+_HASHTAGS_VALUE = '{' + _HASHTAGS_KEY + '['
+_OBJECT_VALUE = '":{'
+_KEY_CHARS = frozenset(ascii_letters + digits + '_')
+# what a `text` key is counted by, as searching for anything with an `x` in it
+# is slow over long runs of that letter
+_TEXT_KEY_START = '"te'
+_TIMESTAMP_MS_KEY = '"timestamp_ms":'
+# the top level `timestamp_ms` is the last key of a tweet from the api
+_LAST_TIMESTAMP_MS = re.compile(r',"timestamp_ms":"([^"\\]*)"}\r?\n?\Z')
+# to get the layout of the end of a line: all but `"`, the brackets and what
+# makes up the escapes of `"` and `/` is dropped, and arrays look like objects
+_LAYOUT_TABLE = bytes(bytearray(ord({'[': '{', ']': '}'}.get(chr(c), chr(c))) for c in range(256)))
+_NOT_LAYOUT = bytes(bytearray(c for c in range(256) if chr(c) not in '"{}[]\\/'))
+_COMPLETE_LINE_ENDINGS = ('}', '}\n', '}\r\n')    # so truncated lines get the full decode
+
+
+def extract_tweet_fields(line):
+    '''Gets the fields of a tweet that are used to build the graph.
+
+
+    Parameters
+    ----------
+    line:  (str) json for a single message from the Twitter api (or utf-8
+        encoded bytes of it under python 3)
+
+
+    Returns
+    -------
+    (tuple) of `text`, `created_at`, (list) of hashtag texts and `timestamp_ms`
+    (None if the tweet doesn't have one); or None if the line is one of the
+    api's non-tweet messages (eg. a `limit` or `delete` notice).
+
+    Raises the same errors as decoding the line with `json.loads` and looking up
+    the fields would (eg. ValueError or KeyError) if the line isn't a usable tweet
+    (including a UnicodeDecodeError for bytes that aren't utf-8).
+
+
+    Notes
+    -----
+    Tweets straight from the api are compact json that starts with `created_at`,
+    followed by a few plain values and then `text`, and whose `entities` starts
+    with `hashtags`; this is taken advantage of by slicing out `created_at` and
+    only decoding the `text` string and the top level `entities.hashtags`.  The
+    rest of the line is gone over once, front to back, with searches for the few
+    keys that matter and for the brackets that show how the objects after the
+    hashtags nest, and is never turned into python objects.  Anything that doesn't
+    look exactly like that, or where it's not certain which keys belong to the top
+    level object (other key orders, whitespace, retweets/quotes that contain a
+    nested tweet, an `extended_tweet`, a repeated top level key of which
+    `json.loads` would keep the last, escapes or brackets in the strings after the
+    hashtags, a `timestamp_ms` that isn't the last key or isn't a string, ...) is
+    decoded the normal way with `json.loads` instead.
+    '''
+
+    if _DECODE_LINES and isinstance(line, bytes):
+        line = line.decode('utf-8')
+    if line.startswith(TWEET_PREFIX) and line.endswith(_COMPLETE_LINE_ENDINGS):
+        fields = _extract_in_place(line)
+        if fields is not None:
+            return fields
+    elif line.startswith(NON_TWEET_PREFIXES):
+        return None
+    return _extract_with_json_loads(line)
+
+
+def _extract_in_place(line):
+    '''The fast path of `extract_tweet_fields`; returns None whenever the line
+    isn't laid out as expected (and so needs to be fully decoded).'''
+
+    created_at_end = len(TWEET_PREFIX) + 30
+    created_at = line[len(TWEET_PREFIX):created_at_end]
+    if line[created_at_end:created_at_end + 1] != '"' or '\\' in created_at:
+        return None
+
+    # the first `text` is the top level one when no object starts before it
+    text_start = line.find(_TEXT_KEY, created_at_end)
+    if text_start == -1 or line.find('{', created_at_end, text_start) != -1:
+        return None
+    if line.find(_CREATED_AT_KEY, created_at_end, text_start) != -1:
+        return None
+    text, text_end = _decoder.raw_decode(line, text_start + len(_TEXT_KEY) - 1)
+
+    # the last `entities` is the top level one (and the one json.loads keeps,
+    # as it keeps the last of a repeated key) when the rest of the line after
+    # its `hashtags` closes just it and then the outermost object
+    entities_start = line.rfind(_ENTITIES_KEY, text_end)
+    if entities_start == -1:
+        return None
+    hashtags_start = entities_start + len(_ENTITIES_KEY)
+    if not line.startswith(_HASHTAGS_VALUE, hashtags_start):
+        return None
+    hashtags, hashtags_end = _decoder.raw_decode(line, hashtags_start + len(_HASHTAGS_VALUE) - 1)
+    if line.find(_HASHTAGS_KEY, hashtags_end) != -1 or not _closes_two_objects(line[hashtags_end:]):
+        return None
+
+    # any other `text` or `created_at` (eg. the `user`'s) has to be certain to
+    # be a nested one; the hashtags' own `text` are, and when there are no more
+    # `"te` than hashtags after the top level `text` there are no others
+    if not _all_nested(line, _CREATED_AT_KEY, text_end, len(line)):
+        return None
+    if line.count(_TEXT_KEY_START, text_end) != len(hashtags):
+        if not (_all_nested(line, _TEXT_KEY[:-1], text_end, entities_start) and
+                _all_nested(line, _TEXT_KEY[:-1], hashtags_end, len(line))):
+            return None
+
+    # the top level `timestamp_ms` can only be told apart from one of a nested
+    # object (or a repeated one) when it's the last key
+    timestamp_ms = None
+    timestamp_ms_start = line.rfind(_TIMESTAMP_MS_KEY, created_at_end)
+    if timestamp_ms_start != -1:
+        last_timestamp_ms = _LAST_TIMESTAMP_MS.match(line, timestamp_ms_start - 1)
+        if last_timestamp_ms is None:
+            return None
+        timestamp_ms = last_timestamp_ms.group(1)
+
+    return text, created_at, [hashtag['text'] for hashtag in hashtags], timestamp_ms
+
+
+def _all_nested(line, key, start, end):
+    '''Whether every `key` between `start` and `end` is certain to be inside
+    of a nested object'''
+
+    key_start = line.find(key, start, end)
+    while key_start != -1:
+        if not _in_nested_object(line, key_start):
+            return False
+        key_start = line.find(key, key_start + len(key), end)
+    return True
+
+
+def _closes_two_objects(tail):
+    '''Whether the json `tail` (that starts outside of any string) is the rest
+    of an object, and after that of the object that it's in'''
+
+    # (bytes have a much faster `translate`)
+    if not isinstance(tail, bytes):
+        tail = tail.encode('utf-8')
+    layout = tail.translate(_LAYOUT_TABLE, _NOT_LAYOUT)
+    # with no `\` right before a `"` (which rules out more than the escaped `"`,
+    # as all but the `/` of the other escapes is dropped) each string is a pair
+    # of `"`, and when no string has a bracket in it they all drop out, leaving
+    # the nesting of the rest
+    if b'\\"' in layout:
+        return False
+    layout = layout.translate(None, b'\\/').replace(b'""', b'')
+    if b'"' in layout:
+        return False
+    # what's left of a (well formed) tail closes one more bracket than it opens
+    # for every object or array it's in
+    return layout.count(b'}') - layout.count(b'{') == 2
+
+
+def _starts_object_value(line, quote):
+    '''Whether the `"` at `quote` ends a key whose value is an object'''
+
+    # a `"` right after a key character can only be the (unescaped) end of a
+    # string, and a string followed by `:` is a key; anything else might be in
+    # the middle of a string
+    return line.startswith(_OBJECT_VALUE, quote) and line[quote - 1] in _KEY_CHARS
+
+
+def _in_nested_object(line, position):
+    '''Whether `position` is certain to be inside of an object nested in the
+    outermost one of `line`'''
+
+    # it is when there's no `}` at all (not even in a string) since the last
+    # start of an object value
+    quote = line.rfind(_OBJECT_VALUE, 0, position)
+    return quote != -1 and _starts_object_value(line, quote) and line.find('}', quote, position) == -1
+
+
+def _extract_with_json_loads(line):
+    '''The slow (but general) path of `extract_tweet_fields`'''
+
+    tweet_dict = json_loads(line)     # json.loads uses utf-8 decoding by default
+    text = tweet_dict["text"]
+    created_at = tweet_dict["created_at"]
+    hashtags = [hashtag['text'] for hashtag in tweet_dict['entities']['hashtags']]
+    return text, created_at, hashtags, tweet_dict.get('timestamp_ms')
@@ -12,14 +12,39 @@ import os
 from os import path
 import sys
 import logging
-from json import loads as json_loads
-from string import translate
-from string import maketrans
-from codecs import encode as codecs_encode
+import argparse
+from collections import deque
+from itertools import islice
+from time import time
 from time import strptime
 from calendar import timegm
+from timeit import default_timer as clock
+try:
+    from string import translate
+    from string import maketrans
+except ImportError:     # python 3
+    maketrans = bytes.maketrans
+
+    def translate(ascii_txt, table):
+        # the ascii encoded bytes are translated as is (a table lookup per byte,
+        # unlike `str.translate`), and only then decoded (a straight copy for ascii)
+        return ascii_txt.translate(table).decode('ascii')
+from codecs import encode as codecs_encode
 
 from tweets_graph import TweetsGraph
+from timestamp_parser import parse_timestamp
+from tweet_extractor import extract_tweet_fields
+from output_sinks import make_sink
+from output_sinks import DEFAULT_FLUSH_BYTES
+from input_readers import compression_of
+from input_readers import open_lines
+from input_readers import iter_line_ranges
+from input_readers import read_line_range
+# the modules for the other options (sharded and multi window graphs, checkpoints,
+# streaming input, stats and profiling) are only imported when they're used, so
+# that a plain run starts up without them
+
+logger = logging.getLogger('tweet_processor')
 
 
 # FAQ says, "all whitespace escape characters should be replaced with a single space"
@@ -28,8 +53,8 @@ from tweets_graph import TweetsGraph
 #      vertical tab ("\v"), and form-feed ("\f")  -- from [1] and [2]. so i'll use those
 # [1] https://en.wikipedia.org/wiki/Whitespace_character#Programming_languages
 # chars_to_replace_with_space = {"\t", "\n", "\r", "\v", "\f"}  #also there is str.isspace()
-white_space_chars = "\t\n\r\v\f"
-whitespace_replacements = ' ' * len(white_space_chars)
+white_space_chars = b"\t\n\r\v\f"
+whitespace_replacements = b' ' * len(white_space_chars)
 trans_table = maketrans(white_space_chars, whitespace_replacements)
 
 # Also, FAQ says only keep ascii chars 32-127
@@ -37,6 +62,8 @@ trans_table = maketrans(white_space_chars, whitespace_replacements)
 
 unicode_tweets_count = 0
 
+_BATCH_SEPARATOR = u'\x00'     # see `clean_texts`
+
 
 def clean_text(text_to_convert, count_unicode=False):
     '''Removes unicode and escape chars from text_to_convert;
@@ -58,13 +85,30 @@ def clean_text(text_to_convert, count_unicode=False):
     https://dev.twitter.com/streaming/overview/processing
     '''
 
+    ws_replaced_txt, contained_unicode = _clean_text(text_to_convert)
+    if count_unicode and contained_unicode:
+        global unicode_tweets_count  # fine for now
+        unicode_tweets_count += 1
+
+    return ws_replaced_txt
+
+
+def _clean_text(text_to_convert):
+    '''Does the actual work for `clean_text`, but instead of counting
+    into the module level `unicode_tweets_count` it returns whether
+    the text contained unicode (so it can be used in worker processes).
+
+    Returns
+    -------
+    (tuple) of the cleaned ascii (str) and (bool) if text had unicode
+    '''
+
+    contained_unicode = False
     try:
         # https://docs.python.org/2/howto/unicode.html
         ascii_txt = codecs_encode(text_to_convert, 'ascii')
     except UnicodeEncodeError:
-        if count_unicode:
-            global unicode_tweets_count  # fine for now
-            unicode_tweets_count += 1
+        contained_unicode = True
 
         # remove all non ascii chars from the unicode string
         ascii_txt = codecs_encode(text_to_convert, 'ascii', 'ignore')
@@ -74,7 +118,60 @@ def clean_text(text_to_convert, count_unicode=False):
     #                                else char for char in ascii_txt])
     ws_replaced_txt = translate(ascii_txt, trans_table)
 
-    return ws_replaced_txt
+    return ws_replaced_txt, contained_unicode
+
+
+def clean_texts(texts_to_convert):
+    '''Batch version of `clean_text`: removes unicode and escape chars from
+    every text in the (list) all in one go (eg. all of the tweet texts and
+    hashtags of a chunk of lines).
+
+
+    Parameters
+    ----------
+    texts_to_convert: (list) of (unicode) strs to standardize
+
+
+    Returns
+    -------
+    (tuple) of a (list) of the cleaned ascii (strs), a (list) of (bool) for
+    whether each text contained unicode, and the (int) number that did; a
+    text that couldn't be cleaned at all gets None (and False) instead
+
+
+    Notes
+    -----
+    The texts are joined into one buffer (with a NUL char between them) that
+    is encoded and translated once, then split back apart.  Encoding with
+    'ignore' only ever drops (non ascii) chars, so a text contained unicode
+    exactly when its cleaned version came out shorter.  If the join fails or
+    a text contains a NUL char itself, each text is cleaned on its own instead.
+    '''
+
+    if not texts_to_convert:
+        return [], [], 0
+
+    try:
+        joined_txt = _BATCH_SEPARATOR.join(texts_to_convert)
+    except (TypeError, UnicodeDecodeError):   # eg. a null text, or a non ascii byte str
+        joined_txt = None
+
+    if joined_txt is not None and joined_txt.count(_BATCH_SEPARATOR) == len(texts_to_convert) - 1:
+        ascii_txt = codecs_encode(joined_txt, 'ascii', 'ignore')
+        cleaned_txts = translate(ascii_txt, trans_table).split(_BATCH_SEPARATOR)
+        contained_unicode = [len(cleaned_txt) != len(text_to_convert)
+                             for cleaned_txt, text_to_convert in zip(cleaned_txts, texts_to_convert)]
+    else:
+        cleaned_txts, contained_unicode = [], []
+        for text_to_convert in texts_to_convert:
+            try:
+                cleaned_txt, had_unicode = _clean_text(text_to_convert)
+            except Exception:
+                cleaned_txt, had_unicode = None, False
+            cleaned_txts.append(cleaned_txt)
+            contained_unicode.append(had_unicode)
+
+    return cleaned_txts, contained_unicode, sum(contained_unicode)
 
 
 
@@ -85,37 +182,494 @@ class Tweet(object):
 
     Attributes
     ----------
-    timestamp: takes tweet `created_at` (str) field and converts to an
-        epoch based time format; used to better perform time based
-        comparisons and manipulations.
+    timestamp: takes tweet `created_at` (str) field (or `timestamp_ms` if
+        it's available) and converts to an epoch based time format; used to
+        better perform time based comparisons and manipulations.
 
     hashtags: takes a (list) of a tweet's hashtags and returns them with
         unicode and escape chars removed.  Will either return an empty
         set or a set of length >= 2'''
 
 
-    def __init__(self, created_at, hashtags):
+    def __init__(self, created_at, hashtags, timestamp_ms=None, cleaned_hashtags=None, timestamp=None):
         '''
         Parameters
         ----------
         created_at: `created_at` field (str) obtained from the Twitter api json output
         hashtags:   (list) of hashtags (strs) obtained from the Twitter api json output
+        timestamp_ms: optional `timestamp_ms` field (str) obtained from the Twitter api
+            json output; when given it's used for the timestamp instead of `created_at`
+        cleaned_hashtags: optional (list) of `hashtags` already passed through
+            `clean_text` (eg. by `clean_texts`), so they don't get cleaned again
+        timestamp: optional (int) already parsed from `created_at` / `timestamp_ms`
+            (eg. by `parse_tweet_chunk`), so it doesn't get parsed again
         '''
 
-        self.timestamp = timegm(strptime(created_at, "%a %b %d %H:%M:%S +0000 %Y"))
-
-        hashtags_cleaned = [clean_text(hashtag).lower() for hashtag in hashtags]
+        # see `timestamp_parser.py`; same result as
+        #   timegm(strptime(created_at, "%a %b %d %H:%M:%S +0000 %Y"))
+        if timestamp is None:
+            timestamp = parse_timestamp(created_at, timestamp_ms)
+        self.timestamp = timestamp
+
+        if cleaned_hashtags is None:
+            cleaned_hashtags = [clean_text(hashtag) for hashtag in hashtags]
+        hashtags_cleaned = [cleaned_hashtag.lower() for cleaned_hashtag in cleaned_hashtags]
+        # NOTE: this has always tested the last (raw) hashtag rather than each cleaned
+        # one (the loop var leaked out of the list comprehension above it); kept as is
+        # so that the graph comes out exactly the same.
+        hashtag = hashtags[-1] if hashtags else None
         hashtags_to_use = set([ht for ht in hashtags_cleaned if hashtag])
         hashtags_for_graph = hashtags_to_use if len(hashtags_to_use) >= 2 else set()
         self.hashtags = hashtags_for_graph
 
 
 
-if __name__ == '__main__':
+def parse_tweet(line):
+    '''Decodes one line of Twitter api json output into everything that
+    is needed to update the graph and write out the results for it.
+
+
+    Parameters
+    ----------
+    line:  (str) json for a single tweet
 
-    if sys.argv[1:]:
-        # test other datasets by providing a path as single arg to this script
-        tweets_data_incoming = sys.argv[1]
+
+    Returns
+    -------
+    (tuple) of (Tweet, cleaned text (str), `created_at` (str), (bool) if the text
+    had unicode); the cleaned text is None if only the text couldn't be used.
+    None is returned if the line isn't a usable tweet at all.
+    '''
+
+    return parse_tweet_chunk([line])[0]
+
+
+def parse_tweet_chunk(lines, stats=None):
+    '''Runs `parse_tweet` over a (list) of lines; the unit of work that
+    gets handed to each worker process.  The texts and hashtags of all of
+    the tweets in the chunk are cleaned together with `clean_texts`.
+
+    If a `PipelineStats` is passed in as `stats` (see `instrumentation.py`), the
+    time spent in each stage and the number of lines that were parsed, skipped
+    (non-tweet messages) or couldn't be used (errored) are added to it.'''
+
+    if stats is not None:
+        start = clock()
+    all_tweet_fields = []
+    texts_to_clean = []
+    skipped = errored = 0
+    for line in lines:
+        try:
+            # only the fields that are needed get decoded (see `tweet_extractor.py`)
+            tweet_fields = extract_tweet_fields(line)
+        except Exception:   # don't normally exception handle like this, but play it safe on unknown data.
+            logger.debug('could not decode line: %r', line[:200], exc_info=True)
+            errored += 1
+            all_tweet_fields.append(None)
+            continue
+        if tweet_fields is not None:
+            text, created_at, hashtags, timestamp_ms = tweet_fields
+            texts_to_clean.append(text)
+            texts_to_clean.extend(hashtags)
+        else:   # eg. a `limit` or `delete` notice
+            skipped += 1
+        all_tweet_fields.append(tweet_fields)
+
+    if stats is not None:
+        stats.add_time('decode', clock() - start)
+        start = clock()
+    cleaned_txts, contained_unicode, _ = clean_texts(texts_to_clean)
+
+    if stats is not None:
+        stats.add_time('clean', clock() - start)
+        start = clock()
+    timestamps = []
+    for tweet_fields in all_tweet_fields:
+        if tweet_fields is None:
+            timestamps.append(None)
+            continue
+        try:
+            timestamps.append(parse_timestamp(tweet_fields[1], tweet_fields[3]))
+        except Exception:
+            logger.debug('could not parse timestamp: %r', tweet_fields[1], exc_info=True)
+            timestamps.append(None)
+
+    if stats is not None:
+        stats.add_time('timestamp', clock() - start)
+        start = clock()
+    parsed_tweets = []
+    pos = 0
+    for tweet_fields, timestamp in zip(all_tweet_fields, timestamps):
+        if tweet_fields is None:
+            parsed_tweets.append(None)
+            continue
+        text, created_at, hashtags, timestamp_ms = tweet_fields
+        cleaned_text, text_had_unicode = cleaned_txts[pos], contained_unicode[pos]
+        cleaned_hashtags = cleaned_txts[pos + 1:pos + 1 + len(hashtags)]
+        pos += 1 + len(hashtags)
+
+        try:
+            if timestamp is None:
+                raise ValueError('timestamp could not be parsed')
+            if None in cleaned_hashtags:
+                raise ValueError('hashtag could not be cleaned')
+            tweet = Tweet(created_at, hashtags, timestamp_ms, cleaned_hashtags, timestamp)
+        except Exception:
+            logger.debug('could not make a tweet from: %r', tweet_fields, exc_info=True)
+            errored += 1
+            parsed_tweets.append(None)
+            continue
+        parsed_tweets.append((tweet, cleaned_text, created_at,
+                              text_had_unicode if cleaned_text is not None else False))
+
+    if stats is not None:
+        stats.add_time('build', clock() - start)
+        stats.count('lines', len(lines))
+        stats.count('parsed', len(lines) - skipped - errored)
+        stats.count('skipped', skipped)
+        stats.count('errored', errored)
+    return parsed_tweets
+
+
+def iter_parsed_tweets(tweets_incomming, workers=1, chunk_size=1000):
+    '''Yields the `parse_tweet` result for each line of `tweets_incomming`,
+    always in input order (see `iter_parsed_chunks` for the parameters).'''
+
+    for parsed_chunk, _ in iter_parsed_chunks(tweets_incomming, workers, chunk_size):
+        for parsed_tweet in parsed_chunk:
+            yield parsed_tweet
+
+
+def iter_parsed_chunks(tweets_incomming, workers=1, chunk_size=1000, stats=None):
+    '''Yields the lines of `tweets_incomming` parsed a chunk at a time, always
+    in input order.
+
+
+    Parameters
+    ----------
+    tweets_incomming:  iterable of (str) lines (eg. an open file)
+    workers:    (int) number of processes to do the parsing in; with 1 (Default)
+        everything is done right here in this process
+    chunk_size: (int) number of lines parsed (and sent to a worker) at a time
+    stats:      optional `PipelineStats` (see `instrumentation.py`) that the
+        parsing stages' times and counts get added to (from the workers as well)
+
+
+    Returns
+    -------
+    generator of (tuple) with a (list) of `parse_tweet` results (one per line)
+    and the (int) total length of the chunk's lines (ie. how far to move the
+    input's offset past the chunk)
+
+
+    Notes
+    -----
+    With more than one worker, chunks of lines are handed out to a process pool
+    and their results are collected back in the order they were submitted.  At
+    most a couple of chunks per worker are in flight at once, so the input file
+    is read only as fast as it can be parsed (instead of being read into memory).
+    '''
+
+    if workers <= 1:
+        for chunk in _chunked(tweets_incomming, chunk_size):
+            yield parse_tweet_chunk(chunk, stats), sum(map(len, chunk))
+        return
+
+    if stats is None:
+        parse = parse_tweet_chunk
+    else:
+        from instrumentation import parse_chunk_with_stats as parse
+    jobs = ((parse, (chunk,), sum(map(len, chunk))) for chunk in _chunked(tweets_incomming, chunk_size))
+    for parsed_chunk in _iter_in_pool(jobs, workers, stats):
+        yield parsed_chunk
+
+
+def iter_parsed_file_ranges(file_path, offset=0, workers=2, chunk_size=1000, stats=None):
+    '''Same as `iter_parsed_chunks` for the (uncompressed) file at `file_path`,
+    from byte `offset` on, but the workers are only sent the byte range of each
+    chunk and read its lines from their own memory map of the file (see
+    `input_readers.py`), instead of this process reading the lines and sending
+    them over to the workers.'''
+
+    jobs = ((_parse_file_range, (file_path, start, end, stats is not None), end - start)
+            for start, end in iter_line_ranges(file_path, offset, chunk_size))
+    for parsed_chunk in _iter_in_pool(jobs, workers, stats):
+        yield parsed_chunk
+
+
+def _parse_file_range(file_path, start, end, with_stats=False):
+    lines = read_line_range(file_path, start, end)
+    if with_stats:
+        from instrumentation import parse_chunk_with_stats
+        return parse_chunk_with_stats(lines)
+    return parse_tweet_chunk(lines)
+
+
+def _iter_in_pool(jobs, workers, stats=None):
+    '''Runs each of `jobs`, (function, args, chunk length) tuples, in a pool of
+    `workers` processes and yields (result, chunk length) in the same order
+    (see `iter_parsed_chunks`)'''
+
+    from multiprocessing import Pool
+    pool = Pool(workers)
+    try:
+        pending = deque()
+        max_pending = 2 * workers
+        for func, func_args, chunk_len in jobs:
+            pending.append((pool.apply_async(func, func_args), chunk_len))
+            if len(pending) >= max_pending:
+                async_result, chunk_len = pending.popleft()
+                yield _collect_parsed_chunk(async_result.get(), stats), chunk_len
+        while pending:
+            async_result, chunk_len = pending.popleft()
+            yield _collect_parsed_chunk(async_result.get(), stats), chunk_len
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _collect_parsed_chunk(result, stats):
+    '''The parsed chunk from a worker; when it was parsed with `parse_chunk_with_stats`,
+    its stats are added into `stats` first'''
+
+    if stats is None:
+        return result
+    parsed_chunk, chunk_stats = result
+    stats.merge(chunk_stats)
+    return parsed_chunk
+
+
+def iter_parsed_file_chunks(file_path, offset, workers, chunk_size, stats=None):
+    '''`iter_parsed_chunks` for the file at `file_path` (compressed or not),
+    starting at byte `offset` (of the decompressed data)'''
+
+    if workers > 1 and compression_of(file_path) is None:
+        return iter_parsed_file_ranges(file_path, offset, workers, chunk_size, stats)
+    return iter_parsed_chunks(open_lines(file_path, offset), workers, chunk_size, stats)
+
+
+def _chunked(iterable, chunk_size):
+    '''Yields (lists) of up to `chunk_size` items from `iterable`'''
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def process_tweets(parsed_tweets, tweet_graph, ft1, ft2):
+    '''Applies each parsed tweet to the graph (in order) and writes out its
+    cleaned text to `ft1` and the graph's new average degree to `ft2`.
+
+
+    Parameters
+    ----------
+    parsed_tweets:  iterable of `parse_tweet` results
+    tweet_graph:    a TweetsGraph instance
+    ft1:            sink (see `output_sinks.py`) for the (str) lines of text
+    ft2:            sink for the average degrees (floats)
+
+
+    Returns
+    -------
+    (int) number of tweets (that were written out) which contained unicode
+    '''
+
+    unicode_count = 0
+    for parsed_tweet in parsed_tweets:
+        if parsed_tweet is None:
+            continue
+        tweet, cleaned_text, created_at, contained_unicode = parsed_tweet
+        tweet_graph.update_graph(tweet)
+        if cleaned_text is None:
+            continue
+
+        if contained_unicode:
+            unicode_count += 1
+        ft1.write('{} (timestamp: {})\n'.format(cleaned_text, created_at))
+        ft2.write(tweet_graph.get_graph_avg_degree_of_all_nodes(as_float=True))
+    return unicode_count
+
+
+def process_tweets_batch(parsed_tweets, tweet_graph, ft1, ft2):
+    '''Same as `process_tweets`, but for a graph that takes a whole batch of
+    tweets at once (ie. a `ShardedTweetsGraph`, see `sharded_graph.py`)'''
+
+    parsed_tweets = [parsed_tweet for parsed_tweet in parsed_tweets if parsed_tweet is not None]
+    avg_degrees = tweet_graph.update_graph_batch([parsed_tweet[0] for parsed_tweet in parsed_tweets])
+
+    unicode_count = 0
+    for (tweet, cleaned_text, created_at, contained_unicode), avg_deg in zip(parsed_tweets, avg_degrees):
+        if cleaned_text is None:
+            continue
+        if contained_unicode:
+            unicode_count += 1
+        ft1.write('{} (timestamp: {})\n'.format(cleaned_text, created_at))
+        ft2.write(avg_deg)
+    return unicode_count
+
+
+def parse_args(argv):
+    '''Parses the command line options for running this script directly'''
+
+    parser = argparse.ArgumentParser(description='Builds a rolling hashtag graph from a file of tweets.')
+    # test other datasets by providing a path as single arg to this script
+    parser.add_argument('tweets_input', nargs='?', default=None,
+                        help="path to a data set file, or - to read from stdin "
+                             "(default: tweet_input/tweets.txt)")
+    parser.add_argument('--follow', action='store_true',
+                        help="keep reading what's appended to the file as it grows (like tail -f) "
+                             "and write out the results in real time; stop with ctrl-c")
+    parser.add_argument('--listen', default=None, metavar='ADDRESS',
+                        help='read the tweets from connections to a local socket instead of a file; '
+                             'ADDRESS is a unix socket path or HOST:PORT')
+    parser.add_argument('--poll-interval', type=float, default=1.0, metavar='SECS',
+                        help="with --follow, the longest time to wait before checking the file "
+                             "again when it can't be watched for changes (default: 1)")
+    parser.add_argument('--time-windows', default=None, metavar='SECS,SECS,...',
+                        help='keep the graph for each of these time windows at once (eg. 10,60,300) '
+                             'and write their average degrees to ft2 as space separated columns, '
+                             'in this order (default: just the one 60 sec window)')
+    parser.add_argument('--max-lateness', type=int, default=None, metavar='SECS',
+                        help='how far behind the newest tweet (in seconds) an out of order '
+                             'tweet may be and still be added to the graph (default: the time window)')
+    parser.add_argument('--approximate', action='store_true',
+                        help='estimate the average degree with sketches of a fixed size instead of '
+                             'keeping the graph (for windows with very many hashtags); ~95%% of the '
+                             'averages are within 4.6%% at the default --approx-precision')
+    parser.add_argument('--approx-precision', type=int, default=12, metavar='P',
+                        help='with --approximate, use 2**P registers per sketch; each step up halves '
+                             'the variance and doubles the memory (default: 12, ~1.4MB in all)')
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help='number of processes used to decode and clean the tweets; the graph '
+                             'is still updated in input order by this process (default: 1)')
+    parser.add_argument('--chunk-size', type=int, default=1000, metavar='LINES',
+                        help='number of lines handed to a worker process at a time (default: 1000)')
+    parser.add_argument('--graph-shards', type=int, default=1, metavar='N',
+                        help='split the upkeep of the graph over N processes, each holding the edges '
+                             'of a share of the hashtags; the output is exactly the same (default: 1)')
+    parser.add_argument('--ft1-sink', choices=['file', 'stdout', 'null'], default='file',
+                        help='where the cleaned tweet texts go (default: tweet_output/ft1.txt)')
+    parser.add_argument('--ft2-sink', choices=['file', 'binary', 'stdout', 'null'], default='file',
+                        help='where the average degrees go; binary writes raw 8 byte floats '
+                             'to tweet_output/ft2.bin (default: tweet_output/ft2.txt)')
+    parser.add_argument('--flush-bytes', type=int, default=DEFAULT_FLUSH_BYTES, metavar='N',
+                        help='write out the buffered output once it reaches this size (default: 1MB)')
+    parser.add_argument('--flush-interval', type=float, default=None, metavar='SECS',
+                        help='also write out the buffered output every SECS seconds '
+                             '(default: only by size and at the end)')
+    parser.add_argument('--start-time', default=None, metavar='TIME',
+                        help='start the replay of the file at TIME (epoch secs, or YYYY-MM-DDTHH:MM:SS '
+                             'in UTC), using a line index that gets saved next to the file as '
+                             '<file>.idx (and built the first time)')
+    parser.add_argument('--checkpoint', default=None, metavar='PATH',
+                        help='periodically save the graph and input position to PATH, and '
+                             'resume from it if it already exists')
+    parser.add_argument('--checkpoint-interval', type=float, default=60, metavar='SECS',
+                        help='how often to save the checkpoint (default: 60)')
+    parser.add_argument('--stats-interval', type=float, default=None, metavar='SECS',
+                        help='time each stage and count the parsed, skipped and errored lines, '
+                             'and log them (and the size of the graph) to stderr as json every '
+                             'SECS seconds and at the end (default: off)')
+    parser.add_argument('--profile', default=None, metavar='PATH',
+                        help='profile the run and write the results to PATH')
+    parser.add_argument('--profiler', choices=['cprofile', 'sampling'], default='cprofile',
+                        help='cprofile writes pstats (and prints a summary); sampling writes '
+                             'folded stacks for flame graphs, with far less overhead (default: cprofile)')
+    args = parser.parse_args(argv)
+
+    if args.time_windows is not None:
+        try:
+            args.time_windows = [int(secs) for secs in args.time_windows.split(',')]
+        except ValueError:
+            parser.error('--time-windows needs a comma separated list of whole seconds')
+        if len(set(args.time_windows)) != len(args.time_windows) or min(args.time_windows) < 1:
+            parser.error('--time-windows need to be different and at least 1 sec each')
+        if args.graph_shards > 1:
+            parser.error("--time-windows can't be used with --graph-shards")
+        if args.approximate and len(args.time_windows) > 1:
+            parser.error('--approximate only takes a single --time-windows window')
+    if args.approximate and args.graph_shards > 1:
+        parser.error("--approximate can't be used with --graph-shards")
+    if not 4 <= args.approx_precision <= 16:
+        parser.error('--approx-precision needs to be from 4 to 16')
+    if args.start_time is not None:
+        try:
+            args.start_time = parse_start_time(args.start_time)
+        except ValueError:
+            parser.error('--start-time needs epoch secs or YYYY-MM-DDTHH:MM:SS')
+    streaming = args.follow or args.listen is not None or args.tweets_input == '-'
+    if args.start_time is not None and (args.listen is not None or args.tweets_input == '-'):
+        parser.error("--start-time needs a file to read from")
+    if streaming and args.workers > 1:
+        parser.error('--workers only applies when reading a whole file (not with --follow, '
+                     '--listen or stdin)')
+    if args.checkpoint and args.graph_shards > 1:
+        parser.error("--checkpoint can't be used with --graph-shards")
+    if args.checkpoint and (args.listen is not None or args.tweets_input == '-'):
+        parser.error("--checkpoint needs a file to read from (stdin or a socket can't be resumed)")
+    return args
+
+
+
+def parse_start_time(text):
+    '''(int) epoch timestamp from epoch secs or a UTC 'YYYY-MM-DDTHH:MM:SS' (str)'''
+
+    if text.isdigit():
+        return int(text)
+    return timegm(strptime(text, '%Y-%m-%dT%H:%M:%S'))
+
+
+def graph_options(args):
+    '''(dict) of the command line options in `args` that the graph is built
+    with, which a checkpoint's graph has to have been built with as well'''
+
+    return {'max_lateness': args.max_lateness,
+            'time_windows': args.time_windows or [60],
+            'approximate': args.approximate,
+            'approx_precision': args.approx_precision if args.approximate else None}
+
+
+def main(args):
+    '''Runs the whole thing for the parsed command line `args`: reads the
+    tweets in, keeps the graph up to date and writes out ft1 and ft2.
+
+
+    Notes
+    -----
+    With `--checkpoint PATH`, a snapshot of the graph along with the byte offset
+    of the input and the sizes of the outputs gets saved every
+    `--checkpoint-interval` secs (and at the end).  If PATH already exists when
+    starting, the graph is restored from it, the outputs are cut back to the
+    sizes they had at that point, and reading the input resumes from the offset
+    (so the results are the same as if the run had never been interrupted).  A
+    checkpoint of another input file, or of a graph built with other options
+    (see `graph_options`) or that doesn't record them, isn't resumed from.
+
+    With `--follow`, `--listen ADDRESS` or '-' (stdin) as the input, the tweets
+    are processed as they arrive, and the outputs are written out whenever the
+    input has nothing more for the moment, so the averages show up in real time.
+
+    A gzip, bz2 or zstd compressed input file is decompressed as it's read, and
+    with `--workers` an uncompressed one is handed out to the workers as byte
+    ranges (see `input_readers.py`).  `--start-time TIME` starts reading the file
+    at TIME (or at most a minute of tweets before it), found with a line index.
+
+    With `--stats-interval SECS`, the stages are timed and counted (see
+    `instrumentation.py`); otherwise none of that code is in the loop at all.
+
+    With `--approximate`, the averages in ft2 are estimates from sketches of a
+    fixed size (see `approx_graph.py`) rather than exact.
+    '''
+
+    reading_file = args.tweets_input != '-' and args.listen is None
+    if not reading_file:
+        tweets_incomming_path = None
+    elif args.tweets_input:
+        tweets_data_incoming = args.tweets_input
         assert path.isfile(tweets_data_incoming), "Error: need to pass in a data file that exists."
         tweets_incomming_path = path.abspath(tweets_data_incoming)
     else:
@@ -126,34 +680,158 @@ if __name__ == '__main__':
     if not path.isdir(tweet_output_path):
         os.makedirs(tweet_output_path)
 
-    ft1 = open(path.abspath(path.join(tweet_output_path, 'ft1.txt')), 'w')
-    ft2 = open(path.abspath(path.join(tweet_output_path, 'ft2.txt')), 'w')
+    if args.follow and reading_file and compression_of(tweets_incomming_path) is not None:
+        raise SystemExit("Error: --follow can't be used with a compressed file.")
+
+    if args.checkpoint:
+        from checkpoint import save_checkpoint
+        from checkpoint import load_checkpoint
+    if args.checkpoint and path.isfile(args.checkpoint):
+        tweet_graph, processor_state = load_checkpoint(args.checkpoint)
+        if processor_state['input_path'] != tweets_incomming_path:
+            raise SystemExit("Error: the checkpoint is of another input file ({}).".format(
+                processor_state['input_path']))
+        options = graph_options(args)
+        saved_options = processor_state.get('graph_options')
+        missing = sorted(options) if saved_options is None else sorted(set(options) - set(saved_options))
+        if missing:
+            raise SystemExit("Error: the checkpoint doesn't say what its graph was built with: {}.".format(
+                ', '.join(missing)))
+        changed = sorted(option for option, value in options.items() if saved_options[option] != value)
+        if changed:
+            raise SystemExit("Error: the checkpoint's graph was built with other options: {} (was {}).".format(
+                ', '.join(changed), ', '.join(repr(saved_options[option]) for option in changed)))
+        if compression_of(tweets_incomming_path) is None:   # (the offset is into the decompressed data)
+            assert path.getsize(tweets_incomming_path) >= processor_state['input_offset'], \
+                "Error: the input is shorter than when the checkpoint was saved."
+    elif args.graph_shards > 1:
+        from sharded_graph import ShardedTweetsGraph
+        tweet_graph = ShardedTweetsGraph(time_window=60, max_lateness=args.max_lateness,
+                                         shards=args.graph_shards)
+        processor_state = {'input_offset': 0, 'unicode_tweets_count': 0,
+                           'ft1_position': None, 'ft2_position': None}
+    elif args.time_windows is not None and len(args.time_windows) > 1:
+        from multi_window_graph import MultiWindowTweetsGraph
+        tweet_graph = MultiWindowTweetsGraph(args.time_windows, max_lateness=args.max_lateness)
+        processor_state = {'input_offset': 0, 'unicode_tweets_count': 0,
+                           'ft1_position': None, 'ft2_position': None}
+    elif args.approximate:
+        from approx_graph import ApproxTweetsGraph
+        time_window = args.time_windows[0] if args.time_windows else 60
+        tweet_graph = ApproxTweetsGraph(time_window=time_window, max_lateness=args.max_lateness,
+                                        precision=args.approx_precision)
+        processor_state = {'input_offset': 0, 'unicode_tweets_count': 0,
+                           'ft1_position': None, 'ft2_position': None}
+    else:
+        time_window = args.time_windows[0] if args.time_windows else 60
+        tweet_graph = TweetsGraph(time_window=time_window, max_lateness=args.max_lateness)
+        processor_state = {'input_offset': 0, 'unicode_tweets_count': 0,
+                           'ft1_position': None, 'ft2_position': None}
+
+    ft1 = make_sink(args.ft1_sink, path.join(tweet_output_path, 'ft1.txt'),
+                    args.flush_bytes, args.flush_interval,
+                    resume_at=processor_state['ft1_position'])
+    ft2 = make_sink(args.ft2_sink, path.join(tweet_output_path,
+                                             'ft2.bin' if args.ft2_sink == 'binary' else 'ft2.txt'),
+                    args.flush_bytes, args.flush_interval, averages=True,
+                    resume_at=processor_state['ft2_position'],
+                    columns=len(args.time_windows) if args.time_windows else 1)
+
+    stats = reporter = None
+    if args.stats_interval is not None:
+        from instrumentation import PipelineStats
+        from instrumentation import StatsReporter
+        from instrumentation import TimedSink
+        from instrumentation import instrument_graph
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s: %(message)s')
+        stats = PipelineStats()
+        reporter = StatsReporter(stats, tweet_graph, args.stats_interval)
+        if hasattr(tweet_graph, 'edge_store'):  # not for a sharded, multi window or approximate graph
+            instrument_graph(tweet_graph, stats)
+        ft1 = TimedSink(ft1, stats)
+        ft2 = TimedSink(ft2, stats)
     close_files = lambda l: [f.close() for f in l]
 
-    tweet_graph = TweetsGraph(time_window=60)
+    def save(input_offset, unicode_tweets_count):
+        save_checkpoint(args.checkpoint, tweet_graph,
+                        input_path=tweets_incomming_path, input_offset=input_offset,
+                        graph_options=graph_options(args),
+                        unicode_tweets_count=unicode_tweets_count,
+                        ft1_position=ft1.position(), ft2_position=ft2.position())
+
+    def flush_outputs():
+        ft1.flush()
+        ft2.flush()
+
+    input_offset = processor_state['input_offset']
+    unicode_tweets_count = processor_state['unicode_tweets_count']
+    if args.start_time is not None and processor_state.get('input_path') is None:    # (not resumed)
+        from input_readers import load_line_index
+        from input_readers import offset_for_time
+        input_offset = offset_for_time(load_line_index(tweets_incomming_path), args.start_time)
+    if args.listen is not None:
+        from line_follower import serve_socket
+        line_batches = serve_socket(args.listen, on_idle=flush_outputs)
+    elif not reading_file:
+        from line_follower import iter_stream_batches
+        line_batches = iter_stream_batches(sys.stdin.fileno(), on_idle=flush_outputs)
+    elif args.follow:
+        from line_follower import follow_file
+        line_batches = follow_file(tweets_incomming_path, input_offset, on_idle=flush_outputs,
+                                   poll_interval=args.poll_interval)
+    else:
+        line_batches = None
 
-    with open(tweets_incomming_path, 'r') as tweets_incomming:
+    if line_batches is None:
+        parsed_chunks = iter_parsed_file_chunks(tweets_incomming_path, input_offset,
+                                                 workers=args.workers, chunk_size=args.chunk_size,
+                                                 stats=stats)
+    else:
+        # streaming; each batch is whatever was complete at the time it was read,
+        # so it gets parsed right here to keep the output in real time
+        parsed_chunks = ((parse_tweet_chunk(lines, stats), sum(map(len, lines))) for lines in line_batches)
+
+    process = process_tweets_batch if args.graph_shards > 1 else process_tweets
+    profiler = None
+    if args.profile:
+        from instrumentation import start_profiler
+        from instrumentation import stop_profiler
+        profiler = start_profiler(args.profiler)
+    last_checkpoint = time()
+    interrupted = False
+    try:
         # all tweets from the api are utf-8 encoded:
         # https://dev.twitter.com/overview/api/counting-characters
-        for cnt, tweet in enumerate(tweets_incomming, start=1):
-            try:
-                tweet_dict =  json_loads(tweet)     # json.loads uses utf-8 decoding by default
-                text = tweet_dict["text"]
-                created_at = tweet_dict["created_at"]
-                hashtags = [hashtag['text'] for hashtag in tweet_dict['entities']['hashtags']]
-                tweet = Tweet(created_at, hashtags)
-                tweet_graph.update_graph(tweet)
-
-                cleaned_text = clean_text(text, count_unicode=True)
-                # logging.debug('tweet_cnt: {}, num_graph_nodes: {}, avg_deg: {}'.format(
-                              # cnt, len(tweet_graph.graph), tweet_graph.get_graph_avg_degree_of_all_nodes()))
-                # print 'tweet_cnt: {}, num_graph_nodes: {}, avg_deg: {}'.format(cnt, len(tweet_graph.graph), tweet_graph.get_graph_avg_degree_of_all_nodes())
-                ft1.write('{} (timestamp: {})\n'.format(cleaned_text, created_at))
-                ft2.write('{}\n'.format(tweet_graph.get_graph_avg_degree_of_all_nodes()))
-
-            except Exception as e:  #  don't normally exception handle in main like this, but play it safe on unknown data.
-                # logging.exception("Tweet on ln {} failed to work.  Exception {}".format(cnt, e))
-                pass
-
-        ft1.write('\n{} tweets contained unicode.'.format(unicode_tweets_count))
+        for parsed_chunk, chunk_len in parsed_chunks:
+            if stats is None:
+                unicode_tweets_count += process(parsed_chunk, tweet_graph, ft1, ft2)
+            else:
+                start = clock()
+                unicode_tweets_count += process(parsed_chunk, tweet_graph, ft1, ft2)
+                stats.add_time('apply', clock() - start)
+                reporter.maybe_report()
+            input_offset += chunk_len
+            if args.checkpoint and time() - last_checkpoint >= args.checkpoint_interval:
+                save(input_offset, unicode_tweets_count)
+                last_checkpoint = time()
+    except KeyboardInterrupt:
+        # the usual way to stop following a stream; wrap up like at the end of a file,
+        # except that a chunk may have been cut off part way through, so the last
+        # (consistent) checkpoint is the one to resume from
+        interrupted = True
+    if profiler is not None:
+        stop_profiler(profiler, args.profile)
+    if args.checkpoint and not interrupted:
+        save(input_offset, unicode_tweets_count)
+    if reporter is not None:
+        reporter.report()
+
+    ft1.write('\n{} tweets contained unicode.'.format(unicode_tweets_count))
     close_files([ft1, ft2])
+    if args.graph_shards > 1:
+        tweet_graph.close()
+
+
+
+if __name__ == '__main__':
+    main(parse_args(sys.argv[1:]))
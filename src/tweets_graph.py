@@ -8,7 +8,12 @@
 #           within a rolling time window. 
 #----------------------------------------------------------------
 
-from itertools import permutations
+from decimal import Decimal
+from decimal import ROUND_HALF_UP
+
+from edge_store import EdgeStore
+from time_window import TimeWindow
+from time_window import iter_entries
 
 
 class TweetsGraph(object):
@@ -28,15 +33,34 @@ class TweetsGraph(object):
     update_graph: updates a graph instance by adding all permutations of a
         tweet's hashtag pairs as nodes and adjacent neighboring nodes.
 
+    get_graph_avg_degree_of_all_nodes: returns the current average degree,
+        read in O(1) from the edge store's running node and edge counters.
+
 
     Attributes
     ----------
     graph: (dict) where each key is a node/hashtag and each corresponding value
-        is a set of it's adjacent neighboring nodes/hashtags (eg. adjacency set)
+        is a set of it's adjacent neighboring nodes/hashtags (eg. adjacency set);
+        this is a read-only copy that is built from `edge_store` on each access
+
+    edge_store: (EdgeStore) the reference-counted adjacency (keyed on interned
+        hashtag ids) that is actually updated as tweets enter and leave the window;
+        `edge_store.symbols` maps between the hashtags and their ids (Default: a
+        new, empty `EdgeStore`; a subclass of it that keeps more can be passed in)
 
     time_window: (int) that specifies how long back (in seconds) old tweets should
         remain in the graph before being removed (Default: 60)
 
+    max_lateness: (int) how far (in seconds) a tweet may be behind the newest
+        tweet seen so far and still be merged into the graph, into the window
+        bucket for its own second; can't be more than `time_window`
+        (Default: None, which means `time_window`)
+
+    late_tweets_merged: (int) number of out of order tweets that were merged in
+
+    late_tweets_dropped: (int) number of tweets that arrived more than
+        `max_lateness` behind the newest tweet and were left out of the graph
+
 
     Returns
     -------
@@ -49,22 +73,32 @@ class TweetsGraph(object):
     method) adds the new tweet's hashtags into the graph (if there are any)
     and removes all hashtag node neighbors (and any nodes themselves if they
     are empty) that are older than the specified `time_window` when compared to
-    the latest tweet."""
+    the latest tweet.  An edge that is also part of a newer tweet still in the
+    window stays in the graph (each edge is reference counted per tweet).
 
+    Tweets don't have to be passed in sorted order (eg. when several stream
+    shards are merged); the newest timestamp seen acts as a watermark, and
+    tweets within `max_lateness` of it are still added, while later ones are
+    dropped and counted."""
 
-    def __init__(self, time_window=60):
-        self.graph = {}
+
+    def __init__(self, time_window=60, max_lateness=None, edge_store=None):
+        self.edge_store = edge_store if edge_store is not None else EdgeStore()
         self.time_window = time_window
-        self.__unique_timestamp_list = []
-        self.__dict_of_timestamps_and_list_of_hashtag_sets = {}
+        if max_lateness is None or max_lateness > time_window:
+            max_lateness = time_window  # anything older would be expired right away
+        self.max_lateness = max_lateness
+        self.late_tweets_merged = 0
+        self.late_tweets_dropped = 0
+        self.__window = TimeWindow(time_window)
 
 
     def __update_active_hashtag_nodes(self, current_timestamp, current_hashtags):
         '''This does all of the work in maintaining that only tweets that are
         within the `time_window` prior to the current tweet are used in making up
-        the hashtag graph.  This uses a first in, first out (fifo) ordering for
-        maintaining that the newest timestamped hashtags are located at the end
-        of the list and the oldest hashtag timestamps at the beginning of the list.
+        the hashtag graph.  This uses a first in, first out (fifo) ordering, where
+        the newest timestamped hashtags are located at the end of the window and
+        the oldest hashtag timestamps at the beginning of it.
 
 
         Parameters
@@ -75,106 +109,40 @@ class TweetsGraph(object):
 
         Notes
         -----
-        When each new tweet is passed in, a test checks whether it is timestamped
-        as more than the `time_window` amount allowed after the first/oldest tweet
-        currently at the beg of the list; if so, then the test checks whether the same
-        holds true for the second tweet in the list, and so on, until the test comes to
-        a tweet that is within the allowed `time_window` (or reaches the end of he list),
-        whereupon all tweets that are more than the allowed `time_window` away from
-        this latest tweet are removed; finally, the newest tweet gets appended onto
-        the end of the list so as to serve as the next most recent tweet for next time
-        around.'''
-
-        # To track what should & shouldn't be included in the graph, this uses 
-        # - a list of (unique) timestamps (fifo), along with
-        # - a dict with a timestamp (for each sec) as the keys and a list
-        # of corresponding hashtag sets as the values; like:
-        #
-        # unique_timestamp_list = [timeOldest ... timeNewest]
-        # dict_of_timestamps_and_lists_of_hashtag_sets = {timestamp_per_sec: [{hashtag_sets}]}
-        #              eg  {1446679027: [{tweet6s_hashtags}, {tweet7s_hashtags}],
-        #                   1446679021: [{tweet0s_hashtags}],
-        #                   1446679029: [{tweet9s_hashtags}, {tweet10s_hashtags}],
-        #                  }
-
-        if not self.__unique_timestamp_list:
-            self.__unique_timestamp_list.append(current_timestamp)
-        else:
-            next_most_recent_timestamp = self.__unique_timestamp_list[-1]
-            if next_most_recent_timestamp < current_timestamp:
-                for cnt, old_timestamp in enumerate(self.__unique_timestamp_list):
-                    if (current_timestamp - old_timestamp) > self.time_window:
-                        if old_timestamp in self.__dict_of_timestamps_and_list_of_hashtag_sets:
-                            list_of_hashtag_sets = self.__dict_of_timestamps_and_list_of_hashtag_sets[old_timestamp]
-                            for set_of_old_hashtags in list_of_hashtag_sets:
-                                self.__remove_hashtags_from_graph(set_of_old_hashtags)
-                            if not self.__dict_of_timestamps_and_list_of_hashtag_sets[old_timestamp]: # if only an empty set remains
-                                del self.__dict_of_timestamps_and_list_of_hashtag_sets[old_timestamp]
-                        else:   # only hit this when unsorted data was used in testing.
-                            pass
-                    else:
-                        if cnt > 0: # don't recopy if we don't need to (eg. when cnt is 0)
-                            # after every 1 sec increment this happens, but there are many tweets w/in each sec tick; (api data ~50 a sec)
-                            # -- so this happens after every avg_N_of_tweets_per_second, to a list of only constant size (at max) `time_window`.
-                            # now even on their firehouse data this copying of `unique_timestamp_list` would still be of only (at max) size 
-                            # `time_window`, and would happen even more infrequenqently b/c there would be a way larger avg_N_of_tweets_per_second
-                            # being delivered between performing this slicing operation.  Also, this seems very fault tolerant -- if the connection 
-                            # got dropped between tweets, it would be quite efficient to empty the graph of only timestamps that were in  
-                            # `unique_timestamp_list`, rather than instead of having to traverse all possible timestamps between the potentially
-                            #  much newer `current_timestamp` and all possible timestamps that could have occured between then and the recorded 
-                            # oldest timestamp (if we just used vars instead for oldest and newest).
-                            self.__unique_timestamp_list = self.__unique_timestamp_list[cnt:]
-                        break
-                self.__unique_timestamp_list.append(current_timestamp)
-            else:  # next_most_recent_timestamp == current_timestamp b/c tweets will
-                # be in sorted order, so don't need to append current_timestamp to
-                # __unique_timestamp_list b/c the current_timestamp isn't unique then
-                pass
-        self.__manage_timestamps_and_hashtag_dict(current_hashtags, current_timestamp)
-
-
-    def __manage_timestamps_and_hashtag_dict(self, current_hashtags, current_timestamp):
-        '''Determines what the state of the node/neighbor pairings are relative
-        to when their timestamp occurred
-
-
-        Parameters
-        ----------
-        current_hashtags:   (set) of hashtags for most recent tweet
-        current_timestamp:  epoch based time (int)
-        '''
-
-        if current_timestamp in self.__dict_of_timestamps_and_list_of_hashtag_sets:
-            if current_hashtags:
-                self.__dict_of_timestamps_and_list_of_hashtag_sets[current_timestamp].append(current_hashtags)
-            else:
-                pass    # nothing to do here; no hashtags to add into the graph for this time_stamp
-        else:
-            if current_hashtags:
-                self.__dict_of_timestamps_and_list_of_hashtag_sets[current_timestamp] = [current_hashtags]
-            else:
-                self.__dict_of_timestamps_and_list_of_hashtag_sets[current_timestamp] = []
+        The window (see `TimeWindow` in `time_window.py`) groups the tweets into
+        one bucket per second.  When a tweet with a newer timestamp is passed in,
+        every bucket (oldest first) that is more than the allowed `time_window`
+        away from this latest tweet is popped off and its tweets' hashtag pairs are
+        released from the graph; then the newest tweet's hashtag pairs (if any) get
+        added into the graph and its hashtags into the bucket for its second.
+        Expiring first means the ids of hashtags that just left the graph can
+        already be reused for the newest tweet's hashtags.'''
+
+        for packed_old_hashtags in self.__window.advance(current_timestamp):
+            for old_hashtags in iter_entries(packed_old_hashtags):
+                self.__remove_hashtags_from_graph(old_hashtags)
+
+        # tweets w/o (at least a pair of) hashtags don't need to be kept around at all
+        if len(current_hashtags) > 1:
+            # add (a reference to) all pairs of hashtags into the graph; the graph
+            # and the window only ever hold the interned (int) ids of the hashtags
+            intern = self.edge_store.intern
+            hashtag_ids = [intern(hashtag) for hashtag in current_hashtags]
+            self.edge_store.add_tweet_edges(hashtag_ids)
+            self.__window.add(current_timestamp, hashtag_ids)
 
 
     def __remove_hashtags_from_graph(self, old_hashtags):
-        '''If an old hashtag node and neighbor pair is in the graph, then this removes them.
+        '''Releases an old tweet's hashtag pairs from the graph; a node and neighbor
+        pair only goes away once no other tweet in the window still contains it.
 
 
         Parameters
         ----------
-        old_hashtags:  (set) of hashtags for an older tweet to be removed
+        old_hashtags:  (array) of hashtag ids for an older tweet to be removed
         '''
 
-        for ht1, ht2 in permutations(old_hashtags, 2):
-            if ht1 in self.graph:
-                # need this check b/c since using sets, no duplicates of a hashtag neighbor
-                # is stored under a hashtag_node; thus a given neighbor might have already of
-                # been removed in a previous removal step
-                if ht2 in self.graph[ht1]:
-                    self.graph[ht1].remove(ht2)   # remove the hashtag_node from the neighbors set
-                # if the hashtag_node doesn't have any more neighbors left, remove it from the graph.
-                if not self.graph[ht1]:
-                    del self.graph[ht1]
+        self.edge_store.remove_tweet_edges(old_hashtags)
 
 
     def update_graph(self, tweet):
@@ -186,25 +154,66 @@ class TweetsGraph(object):
         ----------
         tweet:  an instance of class Tweet (see `tweet_processor.py`)
         '''
-        if tweet.hashtags:
-            # add all new pairs of hashtags into the graph
-            for ht1, ht2 in permutations(tweet.hashtags, 2):
-                if ht1 not in self.graph:
-                    self.graph[ht1] = {ht2}
-                else:
-                    self.graph[ht1].update({ht2})
+        newest_timestamp = self.__window.newest_timestamp
+        if newest_timestamp is not None and tweet.timestamp < newest_timestamp:
+            if newest_timestamp - tweet.timestamp > self.max_lateness:
+                self.late_tweets_dropped += 1
+                return
+            self.late_tweets_merged += 1
 
         self.__update_active_hashtag_nodes(tweet.timestamp, tweet.hashtags)
 
 
-    def get_graph_avg_degree_of_all_nodes(self):
-        '''Calculates and returns the average degree for all nodes in all
-        graphs and subgraphs'''
+    @property
+    def graph(self):
+        '''(dict) of hashtag -> (set) of neighboring hashtags (see `edge_store`);
+        each access builds a new one, in O(nodes + edges), so get it once (and
+        not eg. per tweet), or look things up in `edge_store` directly.'''
+        return self.edge_store.as_adjacency_sets()
+
+
+    @property
+    def newest_timestamp(self):
+        '''(int) timestamp of the newest tweet in the graph (None if there hasn't been one)'''
+        return self.__window.newest_timestamp
+
+
+    @property
+    def window_seconds(self):
+        '''(int) number of seconds in the window that have tweets (with hashtags) in them'''
+        return len(self.__window)
+
+
+    def get_graph_avg_degree_of_all_nodes(self, as_float=False):
+        '''Returns the average degree for all nodes in all graphs and subgraphs;
+        this is read from running node/edge counters, so it's O(1) per call.
+
+
+        Parameters
+        ----------
+        as_float:  if (True) returns the raw (float) average instead of the
+            (str) rounded to two decimals (Default: False)
+        '''
+
+        avg_deg = self.edge_store.avg_degree()
+        if as_float:
+            return avg_deg
+        return format_avg_degree(avg_deg)
+
+
+
+_HUNDREDTH = Decimal('0.01')
+
+
+def format_avg_degree(avg_deg):
+    '''Formats an average degree (float) as a (str) rounded to two decimals
+    (eg. "1.67"); this is what gets written out for each tweet in `ft2.txt`
 
-        if self.graph:
-            total_edge_len = sum([len(neighbors) for neighbors in self.graph.itervalues()])
-            avg_deg = total_edge_len / float(len(self.graph))
-            return "{:.2f}".format(round(avg_deg, 2))
-        else:
-            return "{:.2f}".format(0.00)
+    This has always been `"{:.2f}".format(round(avg_deg, 2))` under python 2,
+    which rounds halves (eg. 5.125) up; python 3's `round` rounds them to even
+    instead, so exact halves are rounded here explicitly to get the same output
+    under both.'''
 
+    if (avg_deg * 200).is_integer():    # (possibly) exactly half way between hundredths
+        return str(Decimal(avg_deg).quantize(_HUNDREDTH, ROUND_HALF_UP))
+    return "{:.2f}".format(avg_deg)